@@ -1,10 +1,14 @@
 """A module for handling backend tasks received from from-user-listener.
 """
+import asyncio
+from bot.config import config
 from bot.deckbox.deckbox import Deckbox
 from bot.mongo.mongo_client import MongoClient
 from bot.utils.utils import Utils
 from bot.deckbox.deckbox import Deckbox
+from bot.league.league import League
 from bot.mythiccard.mythiccard import MythicCard
+from bot.scryfall.price_history import PriceHistory
 from bot.telegram.bot import MagicBot
 
 class Backend:
@@ -30,6 +34,25 @@ class Backend:
             message_text=text,
         )
 
+  @classmethod
+  def scryfall_unavailable(
+      cls,
+      chat_id: str
+  ) -> bytes:
+    """Sends an error saying scryfall couldn't answer right now.
+
+    Args:
+      chat_id: Id of the telegram chat to send message to
+    Returns:
+      A dict with message encoded into bytes
+    """
+    text = "Scryfall is not available right now. Please try again later."
+    return Utils.generate_outgoing_message(
+            command="text",
+            chat_id=chat_id,
+            message_text=text,
+        )
+
   @classmethod
   def ambiguous_card(
       cls,
@@ -92,6 +115,7 @@ class Backend:
             deckbox=deckbox_id,
             account_name=name,
         )
+        new_cache = await PriceHistory.value_deckbox(deckbox=new_cache)
         (new_status, _) = await MongoClient.update_deckbox(
             deckbox=deckbox_id,
             object=new_cache,
@@ -108,6 +132,7 @@ class Backend:
           deckbox=deckbox_id,
           account_name=account_name,
       )
+      new_cache = await PriceHistory.value_deckbox(deckbox=new_cache)
       result = await MongoClient.add_deckbox(
           object=new_cache,
           tradelist=tradelist,
@@ -149,6 +174,7 @@ class Backend:
           deckbox=deckbox_id,
           account_name=name,
       )
+      new_cache = await PriceHistory.value_deckbox(deckbox=new_cache)
       new_cards = new_cache.get("cards")
       # Get the difference between the old and the new cache
       old_cards = await MongoClient.get_deckbox_cards_dict(
@@ -166,6 +192,9 @@ class Backend:
         subscribed = await MongoClient.get_deckbox_subscribers(
             account_name=name
         )
+        owner_data = None
+        if subscribed:
+          owner_data = await MongoClient.get_user_data(deckbox=name)
         # Loop through subscribers and check if they have diff cards in wishlist
         for subscriber in subscribed:
           subscriber_name = subscriber.get("deckbox_name")
@@ -191,6 +220,7 @@ class Backend:
                     found_object=found_cards,
                     deckbox_name=name,
                     deckbox_id=deckbox_id,
+                    user_data=owner_data,
                 )
                 for message in messages:
                   await MagicBot.send_message_to_queue(
@@ -214,6 +244,7 @@ class Backend:
           deckbox=deckbox_id,
           account_name=account_name,
       )
+      new_cache = await PriceHistory.value_deckbox(deckbox=new_cache)
       result = await MongoClient.add_deckbox(
           object=new_cache,
           tradelist=tradelist,
@@ -276,6 +307,24 @@ class Backend:
         deckbox_names=sub_list,
     )
     trade_lists = list(deckboxes.keys())
+    if config.DECKBOX_CARDS_NORMALISED:
+      for deckbox_id in trade_lists:
+        await cls.add_deckbox_to_mongo(
+            deckbox_id=deckbox_id,
+            account_name=deckboxes.get(deckbox_id),
+            tradelist=True,
+        )
+      lower_cards = [
+          card.lower().replace("\u2019", "'") for card in received_cards
+      ]
+      found_cards_object = await MongoClient.find_cards_in_deckboxes(
+          deckbox_ids=trade_lists,
+          card_names=lower_cards,
+          exact=False,
+      )
+      return await cls.sort_found_cards_by_price(
+          found_object=found_cards_object,
+      )
     # Find cards in tradelists
     found_cards_object = {}
     for deckbox_id in trade_lists:
@@ -312,7 +361,7 @@ class Backend:
               found_cards_object[deckbox_id].append(
                   (found_card, cards[found_card])
               )
-    return found_cards_object
+    return await cls.sort_found_cards_by_price(found_object=found_cards_object)
 
   @classmethod
   async def wish_for_cards(
@@ -345,6 +394,20 @@ class Backend:
         deckbox_names=sub_list,
     )
     trade_lists = list(deckboxes.keys())
+    if config.DECKBOX_CARDS_NORMALISED:
+      for deckbox_id in trade_lists:
+        await cls.add_deckbox_to_mongo(
+            deckbox_id=deckbox_id,
+            account_name=deckboxes.get(deckbox_id),
+            tradelist=True,
+        )
+      found_cards_object = await MongoClient.find_cards_in_deckboxes(
+          deckbox_ids=trade_lists,
+          card_names=[card.lower() for card in received_cards],
+      )
+      return await cls.sort_found_cards_by_price(
+          found_object=found_cards_object,
+      )
     # Find cards in tradelists
     found_cards_object = {}
     for deckbox_id in trade_lists:
@@ -367,7 +430,29 @@ class Backend:
           found_cards_object[deckbox_id].append(
               (lower_card, cards_dict[lower_card])
           )
-    return found_cards_object
+    return await cls.sort_found_cards_by_price(found_object=found_cards_object)
+
+  @classmethod
+  async def sort_found_cards_by_price(
+      cls,
+      found_object: dict,
+  ) -> dict:
+    """Sorts the found cards of every tradelist from the most expensive one
+    using the prices saved by the tradelist valuation.
+
+    Args:
+      found_object: a dict with deckbox ids as keys and lists of (card, count)
+      as values
+    Returns:
+      A dict with the same search results sorted by price
+    """
+    deckbox_prices = await MongoClient.get_deckbox_card_prices(
+        deckbox_ids=list(found_object.keys()),
+    )
+    for (deckbox_id, found_cards) in found_object.items():
+      prices = deckbox_prices.get(deckbox_id.lower(), {})
+      found_cards.sort(key=lambda card: prices.get(card[0], 0), reverse=True)
+    return found_object
 
   @classmethod
   async def wish_for_cards_in_conflux(
@@ -471,51 +556,51 @@ class Backend:
     """
     print("Updating all the leagues")
     all_active_leagues = await MongoClient.get_all_leagues()
-    for league in all_active_leagues:
-      league_message = ""
-      league_name = league.get("league_name")
-      league_id = league.get("league_id")
-      current_week = league.get("current_week")
-      total_weeks = league.get("total_duration_weeks")
-      channels = league.get("subscribed_channels")
-      # Get the leaderboard
-      all_players = await MongoClient.get_all_leagues_players(
-          league_id=league_id,
-      )
-      sorted_players = sorted(
-          all_players,
-          key=lambda x: x["total_points"],
-          reverse=True,
-      )
-      top_players = []
-      for player in sorted_players[:5]:
-        streak = ""
-        if player["win_streak"] >= 3:
-          streak = f"🔥"
-        player_message = (
-            f"{player["telegram"]} "
-            f"{player["standing_wins"]}-{player["standing_losses"]} "
-            f"({player["total_points"]} points) {streak}"
-        )
-        top_players.append(player_message)
-      leaderboard_players = "\n".join(top_players)
-      leaderboard = "\n<b>Top 5 players:</b>\n" + leaderboard_players
-      print(f"CURRENT: {current_week}")
-      print(f"TOTAL: {total_weeks}")
-      if current_week == total_weeks:
-        league_message += f"The league '{league_name}' has ended!\n"
-      elif current_week < total_weeks:
-        update = await MongoClient.update_league(league_id=league_id)
-        if update:
+    if not all_active_leagues:
+      return
+    league_ids = [league.get("league_id") for league in all_active_leagues]
+    # Get the leaderboards of all the leagues at once
+    leaderboards = await MongoClient.get_leagues_leaderboards(
+        league_ids=league_ids,
+        limit=5,
+    )
+    # Move all the ongoing leagues forward at once
+    ongoing = [
+        league.get("league_id") for league in all_active_leagues
+        if league.get("current_week") < league.get("total_duration_weeks")
+    ]
+    advanced = await MongoClient.advance_leagues(league_ids=ongoing)
+    semaphore = asyncio.Semaphore(config.LEAGUE_ROLLOVER_WORKERS)
+
+    async def announce(league: dict) -> None:
+      async with semaphore:
+        league_message = ""
+        league_name = league.get("league_name")
+        league_id = league.get("league_id")
+        current_week = league.get("current_week")
+        total_weeks = league.get("total_duration_weeks")
+        channels = league.get("subscribed_channels", {})
+        print(f"{league_id} CURRENT: {current_week} TOTAL: {total_weeks}")
+        if current_week == total_weeks:
+          league_message += f"The league '{league_name}' has ended!\n"
+        elif current_week < total_weeks and league_id in advanced:
           league_message += (
               f"The league '{league_name}' has entered week "
               f"{int(current_week) + 1} out of {total_weeks}!\n"
               "All participants have 3 more standing matches and "
               "can add a new booster pack to their pool!\n"
           )
-      league_message += leaderboard
-      for channel in channels.keys():
-        await MagicBot.send_message_to_user(
-            chat_id=channel,
-            message=league_message
+        league_message += League.format_leaderboard(
+            top_players=leaderboards.get(league_id, []),
+            top=5,
         )
+        try:
+          await League.league_broadcast_message(
+              message=league_message,
+              league_id=league_id,
+              channels=list(channels.keys()),
+          )
+        except Exception as e:
+          print(f"Couldn't announce the new week of {league_id}: {e}")
+
+    await asyncio.gather(*(announce(league) for league in all_active_leagues))
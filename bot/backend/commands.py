@@ -1,19 +1,28 @@
 """Module for resolving commands sent by from-user-listener.
 """
-import json
 import random
+from bot.config import config
 from bot.deckbox.deckbox import Deckbox
 from bot.scryfall.scryfall import ScryfallFetcher
+from bot.scryfall.card_pool import CardPool
+from bot.scryfall.price_history import PriceHistory
 from bot.mongo.mongo_client import MongoClient
 from bot.utils.utils import Utils
+from bot.utils.command_registry import ADMIN, BULK, CommandRegistry
 from bot.deckbox.deckbox import Deckbox
 from bot.backend.backend import Backend
 from bot.league.league import League
 from datetime import datetime
 
 class TelegramCommands:
+  registry = CommandRegistry(
+      name="backend",
+      payload_argument="message_text",
+      limits=config.COMMAND_PRIORITY_LIMITS,
+  )
 
   @classmethod
+  @registry.command("sendmsg")
   async def send_freeform_message(
       cls,
       chat_id: str,
@@ -37,6 +46,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("c")
   async def show_full_card_url(
       cls,
       chat_id: str,
@@ -57,6 +67,10 @@ class TelegramCommands:
       return Backend.ambiguous_card(
           chat_id=chat_id,
       )
+    elif card_uri == "unavailable":
+      return Backend.scryfall_unavailable(
+          chat_id=chat_id,
+      )
     elif card_uri == "not_found":
       return Backend.card_not_found(
           card_name=message_text,
@@ -72,6 +86,7 @@ class TelegramCommands:
       )
 
   @classmethod
+  @registry.command("verification", payload=dict)
   async def show_verification(
       cls,
       chat_id: str,
@@ -87,20 +102,19 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     username = message_dict.get("username", "")
     user_id = message_dict.get("user_id", "")
-    card_data = await ScryfallFetcher.get_random_card(non_zero_cmc=True)
+    card_data = await CardPool.get_verification_card()
+    if not card_data:
+      return Backend.scryfall_unavailable(
+          chat_id=chat_id,
+      )
     card_cmc = int(card_data.get("cmc"))
     other_numbers = random.sample([n for n in range(1, 11) if n != card_cmc], 3)
     answers = [card_cmc] + other_numbers
     random.shuffle(answers)
-    faces = card_data.get("card_faces", None)
-    image_uri = card_data.get("image_uris", None)
-    if faces:
-      image = faces[0]["image_uris"]["normal"]
-    if image_uri:
-      image = image_uri["normal"]
+    image = card_data.get("image")
     return Utils.generate_outgoing_message(
         command="verification",
         chat_id=chat_id,
@@ -115,6 +129,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("approve", payload=dict)
   async def approve_user(
       cls,
       chat_id: str,
@@ -130,7 +145,7 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     username = message_dict.get("username", "")
     user_id = message_dict.get("user_id", "")
     return Utils.generate_outgoing_message(
@@ -145,6 +160,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("disapprove", payload=dict)
   async def disapprove_user(
       cls,
       chat_id: str,
@@ -160,7 +176,7 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     username = message_dict.get("username", "")
     user_id = message_dict.get("user_id", "")
     return Utils.generate_outgoing_message(
@@ -175,6 +191,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("ci")
   async def show_card_image(
       cls,
       chat_id: str,
@@ -195,6 +212,10 @@ class TelegramCommands:
       return Backend.ambiguous_card(
           chat_id=chat_id,
       )
+    elif card_images == "unavailable":
+      return Backend.scryfall_unavailable(
+          chat_id=chat_id,
+      )
     elif card_images == "not_found":
       return Backend.card_not_found(
           card_name=message_text,
@@ -213,6 +234,7 @@ class TelegramCommands:
       return image_results
 
   @classmethod
+  @registry.command("quiz", payload=None)
   async def show_quiz_image(
       cls,
       chat_id: str,
@@ -224,7 +246,7 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    card_object = await ScryfallFetcher.get_card_image_art()
+    card_object = await CardPool.get_quiz_card()
     if card_object:
       return Utils.generate_outgoing_message(
           command="quiz",
@@ -240,6 +262,7 @@ class TelegramCommands:
       )
 
   @classmethod
+  @registry.command("cp")
   async def show_card_price(
       cls,
       chat_id: str,
@@ -255,11 +278,15 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    card_prices = await ScryfallFetcher.get_card_prices(card_name=message_text)
+    card_prices = await PriceHistory.get_card_prices(card_name=message_text)
     if card_prices == "ambiguous":
       return Backend.ambiguous_card(
           chat_id=chat_id,
       )
+    elif card_prices == "unavailable":
+      return Backend.scryfall_unavailable(
+          chat_id=chat_id,
+      )
     elif card_prices == "not_found":
       return Backend.card_not_found(
           card_name=message_text,
@@ -274,6 +301,35 @@ class TelegramCommands:
       )
 
   @classmethod
+  @registry.command("prices", priority=BULK, payload=dict)
+  async def show_cards_prices(
+      cls,
+      chat_id: str,
+      message_text: str,
+  ) -> list[bytes]:
+    """Sends a price report for a list of cards to the chat.
+
+    Args:
+      chat_id: Id of the telegram chat to send message to
+      message_text: text with dict containing cards to check
+    Returns:
+      A list of dicts with messages encoded into bytes
+    """
+    message_dict = Utils.load_payload(message_text)
+    received_cards = message_dict.get("cards", [])
+    messages = await ScryfallFetcher.get_cards_prices(card_lines=received_cards)
+    results = []
+    for message in messages:
+      part = Utils.generate_outgoing_message(
+          command="text",
+          chat_id=chat_id,
+          message_text=message,
+      )
+      results.append(part)
+    return results
+
+  @classmethod
+  @registry.command("quiz_answer", payload=dict)
   async def handle_quiz_reply(
       cls,
       chat_id: str,
@@ -287,7 +343,7 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     text = message_dict.get("text", "")
     message_id = message_dict.get("message_id", "")
     user_card_name = "dummytext"
@@ -314,6 +370,7 @@ class TelegramCommands:
       )
 
   @classmethod
+  @registry.command("any_message", "help", payload=None)
   async def show_help(
       cls,
       chat_id: str,
@@ -330,6 +387,7 @@ class TelegramCommands:
         "/c cardname - search for a card on scryfall\n"
         "/ci cardname - search for a card image on scryfall\n"
         "/cp cardname - search for a card price on scryfall\n"
+        "/prices - check scryfall prices for a list of cards\n"
         "/edhdanas - create a EDH danas poll or forward it if it exists\n"
         "<b>Account commands:</b>\n"
         "/reg - register you telegram account\n"
@@ -349,6 +407,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("dbhelp", payload=None)
   async def show_deckbox_help(
       cls,
       chat_id: str,
@@ -378,6 +437,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("confluxhelp", payload=None)
   async def show_conflux_help(
       cls,
       chat_id: str,
@@ -403,6 +463,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("leaguehelp", payload=None)
   async def show_league_help(
       cls,
       chat_id: str,
@@ -429,6 +490,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("edhdanas", payload=dict)
   async def edh_danas_send_poll(
       cls,
       chat_id: str,
@@ -443,7 +505,7 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     message = message_dict.get("message", "")
     options = message_dict.get("options")
     chat_type = message_dict.get("chat_type")
@@ -478,6 +540,7 @@ class TelegramCommands:
       )
 
   @classmethod
+  @registry.command("reg")
   async def register_user(
       cls,
       chat_id: str,
@@ -531,6 +594,7 @@ class TelegramCommands:
           )
 
   @classmethod
+  @registry.command("start")
   async def get_user_menu(
       cls,
       chat_id: str,
@@ -577,6 +641,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("deckboxmenu")
   async def get_deckbox_menu(
       cls,
       chat_id: str,
@@ -609,6 +674,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("confluxmenu")
   async def get_conflux_menu(
       cls,
       chat_id: str,
@@ -641,6 +707,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("leaguemenu")
   async def get_league_menu(
       cls,
       chat_id: str,
@@ -673,6 +740,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("updatedeckbox", priority=BULK)
   async def update_user_deckbox(
       cls,
       chat_id: str,
@@ -748,6 +816,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("regdeckbox", priority=BULK, payload=dict)
   async def add_deckbox_to_user(
       cls,
       chat_id: str,
@@ -761,7 +830,7 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     telegram_name = f"@{message_dict.get("telegram", "")}"
     deckbox = message_dict.get("deckbox", "")
     deckbox_lower = deckbox.lower()
@@ -829,6 +898,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("dbsub", payload=dict)
   async def add_subscription_to_user(
       cls,
       chat_id: str,
@@ -842,7 +912,7 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     telegram_name = f"@{message_dict.get("telegram", "")}"
     deckbox = message_dict.get("deckbox")
     # Check if the user exists in mongo db
@@ -907,6 +977,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("dbunsub", payload=dict)
   async def remove_subscription_from_user(
       cls,
       chat_id: str,
@@ -920,7 +991,7 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     telegram_name = f"@{message_dict.get("telegram", "")}"
     deckbox = message_dict.get("deckbox")
     # Check if the user exists in mongo db
@@ -951,6 +1022,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("mydeckbox")
   async def check_user_deckbox(
       cls,
       chat_id: str,
@@ -992,13 +1064,33 @@ class TelegramCommands:
           message_text=f"You haven't registered a deckbox yet!",
       )
     else:
+      text = f"Your deckbox account name is: {current_deckbox}"
+      values = await MongoClient.get_deckbox_values(
+          account_name=current_deckbox,
+      )
+      for (list_name, value) in values.items():
+        if not value or "total_value" not in value:
+          continue
+        total_value = value.get("total_value")
+        priced_cards = value.get("priced_cards")
+        card_count = value.get("card_count")
+        if total_value is None:
+          text += f"\nYour {list_name} has no card prices yet"
+        elif priced_cards is not None and priced_cards < card_count:
+          text += (
+              f"\nYour {list_name} is worth at least: ${total_value:.2f} "
+              f"({priced_cards} of {card_count} cards priced)"
+          )
+        else:
+          text += f"\nYour {list_name} is worth: ${total_value:.2f}"
       return Utils.generate_outgoing_message(
           command="deckboxmenu",
           chat_id=chat_id,
-          message_text=f"Your deckbox account name is: {current_deckbox}",
+          message_text=text,
       )
 
   @classmethod
+  @registry.command("mydeckboxsubs")
   async def check_user_deckbox_subscriptions(
       cls,
       chat_id: str,
@@ -1044,6 +1136,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("search", priority=BULK, payload=dict)
   async def bulk_search_cards(
       cls,
       chat_id: str,
@@ -1057,7 +1150,7 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     telegram_name = f"@{message_dict.get("telegram", "")}"
     received_cards = message_dict.get("cards")
     # Check if the user exists in mongo db
@@ -1105,9 +1198,16 @@ class TelegramCommands:
     deckboxes = await MongoClient.match_deckbox_tradelist_ids_to_names(
         deckbox_names=sub_list,
     )
+    found_names = [
+        deckboxes[deckbox_id] for deckbox_id in result if result[deckbox_id]
+    ]
+    users = await MongoClient.get_users_by_deckbox_names(
+        deckbox_names=found_names,
+    )
     messages = await Utils.construct_found_message(
         found_object=result,
         deckbox_names=deckboxes,
+        users=users,
     )
     results = []
     for message in messages:
@@ -1120,6 +1220,7 @@ class TelegramCommands:
     return results
 
   @classmethod
+  @registry.command("dbsearch", priority=BULK, payload=dict)
   async def deckboxes_search_cards(
       cls,
       chat_id: str,
@@ -1133,7 +1234,7 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     telegram_name = f"@{message_dict.get("telegram", "")}"
     received_cards = message_dict.get("cards")
     received_deckboxes = message_dict.get("deckboxes")
@@ -1208,9 +1309,16 @@ class TelegramCommands:
       all_dicts.append(search_result)
     result = await Utils.construct_united_search_dict(input_dicts=all_dicts)
     deckboxes = await MongoClient.get_all_deckboxes(tradelist=True)
+    found_names = [
+        deckboxes[deckbox_id] for deckbox_id in result if result[deckbox_id]
+    ]
+    users = await MongoClient.get_users_by_deckbox_names(
+        deckbox_names=found_names,
+    )
     messages = await Utils.construct_found_message(
         found_object=result,
         deckbox_names=deckboxes,
+        users=users,
     )
     results = []
     for message in messages:
@@ -1223,6 +1331,7 @@ class TelegramCommands:
     return results
 
   @classmethod
+  @registry.command("consearch", priority=BULK, payload=dict)
   async def conflux_search_cards(
       cls,
       chat_id: str,
@@ -1236,7 +1345,7 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     telegram_name = f"@{message_dict.get("telegram", "")}"
     received_cards = message_dict.get("cards")
     search_type = message_dict.get("search")
@@ -1277,6 +1386,7 @@ class TelegramCommands:
     return results
 
   @classmethod
+  @registry.command("wish", priority=BULK, payload=dict)
   async def search_cards_from_wishlist(
       cls,
       chat_id: str,
@@ -1290,7 +1400,7 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     telegram_name = f"@{message_dict.get("telegram", "")}"
     search_type = message_dict.get("search")
     # Check if the user exists in mongo db
@@ -1364,9 +1474,16 @@ class TelegramCommands:
         deckbox_names=sub_list,
     )
     total = await Utils.construct_united_search_dict(input_dicts=wish_results)
+    found_names = [
+        deckboxes[deckbox_id] for deckbox_id in total if total[deckbox_id]
+    ]
+    users = await MongoClient.get_users_by_deckbox_names(
+        deckbox_names=found_names,
+    )
     messages = await Utils.construct_found_message(
         found_object=total,
         deckbox_names=deckboxes,
+        users=users,
     )
     final_message_results = []
     command = "menu"
@@ -1387,6 +1504,7 @@ class TelegramCommands:
     return final_message_results
 
   @classmethod
+  @registry.command("dbwish", priority=BULK, payload=dict)
   async def deckboxes_search_cards_from_wishlist(
       cls,
       chat_id: str,
@@ -1400,7 +1518,7 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     telegram_name = f"@{message_dict.get("telegram", "")}"
     search_type = message_dict.get("search")
     received_deckboxes = message_dict.get("deckboxes")
@@ -1463,9 +1581,16 @@ class TelegramCommands:
       wish_results.append(result)
     deckboxes = await MongoClient.get_all_deckboxes(tradelist=True)
     total = await Utils.construct_united_search_dict(input_dicts=wish_results)
+    found_names = [
+        deckboxes[deckbox_id] for deckbox_id in total if total[deckbox_id]
+    ]
+    users = await MongoClient.get_users_by_deckbox_names(
+        deckbox_names=found_names,
+    )
     messages = await Utils.construct_found_message(
         found_object=total,
         deckbox_names=deckboxes,
+        users=users,
     )
     final_message_results = []
     command = "menu"
@@ -1488,6 +1613,7 @@ class TelegramCommands:
     return final_message_results
 
   @classmethod
+  @registry.command("conwish", priority=BULK)
   async def conflux_search_wishlist(
       cls,
       chat_id: str,
@@ -1564,6 +1690,7 @@ class TelegramCommands:
     return final_message_results
 
   @classmethod
+  @registry.command("addstore", priority=ADMIN)
   async def add_store(
       cls,
       chat_id: str,
@@ -1605,6 +1732,7 @@ class TelegramCommands:
         )
 
   @classmethod
+  @registry.command("confluxsub", payload=dict)
   async def add_store_subscription_to_user(
       cls,
       chat_id: str,
@@ -1618,7 +1746,7 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     telegram_name = f"@{message_dict.get("telegram", "")}"
     store = message_dict.get("store")
     # Check if the user exists in mongo db
@@ -1661,6 +1789,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("confluxunsub", payload=dict)
   async def remove_store_subscription_from_user(
       cls,
       chat_id: str,
@@ -1674,7 +1803,7 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     telegram_name = f"@{message_dict.get("telegram", "")}"
     store = message_dict.get("store")
     # Check if the user exists in mongo db
@@ -1705,6 +1834,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("deckboxrecache", priority=ADMIN)
   async def recache_deckboxes_manually(
       cls,
       chat_id: str,
@@ -1726,6 +1856,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("leagues_update", priority=ADMIN)
   async def update_leagues_manually(
       cls,
       chat_id: str,
@@ -1747,6 +1878,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("confluxcache", priority=ADMIN)
   async def recache_conflux_manually(
       cls,
       chat_id: str,
@@ -1768,6 +1900,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("league_create", priority=ADMIN, payload=dict)
   async def create_league(
       cls,
       chat_id: str,
@@ -1781,7 +1914,7 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     league_name = message_dict.get("league_name")
     league_length = message_dict.get("league_length")
     league_id = await Utils.generate_random_id(length=5)
@@ -1808,6 +1941,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("league_subscribe", payload=dict)
   async def subscribe_to_league(
       cls,
       chat_id: str,
@@ -1821,7 +1955,7 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     league_id = message_dict.get("league_id")
     sub_chat_id = message_dict.get("chat_id")
     # Get the league name
@@ -1844,6 +1978,7 @@ class TelegramCommands:
       )
 
   @classmethod
+  @registry.command("league_unsubscribe", payload=dict)
   async def unsubscribe_from_league(
       cls,
       chat_id: str,
@@ -1857,7 +1992,7 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     league_id = message_dict.get("league_id")
     sub_chat_id = message_dict.get("chat_id")
     # Get the league name
@@ -1880,6 +2015,7 @@ class TelegramCommands:
       )
 
   @classmethod
+  @registry.command("league_status_change", priority=ADMIN, payload=dict)
   async def change_league_status(
       cls,
       chat_id: str,
@@ -1893,7 +2029,7 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     league_id = message_dict.get("league_id")
     status = message_dict.get("status")
     # Get the league name
@@ -1916,21 +2052,25 @@ class TelegramCommands:
       )
 
   @classmethod
+  @registry.command("league_invite", priority=ADMIN)
   async def create_league_invite(
       cls,
       chat_id: str,
       message_text: str,
   ) -> bytes:
-    """Adds a new league invite to DB and sends back it's ID.
+    """Adds new league invites to DB and sends back their IDs.
 
     Args:
       chat_id: Id of the telegram chat to send message to
-      message_text: text with dict with user name and store to add
+      message_text: text with league ID and optional amount of invites
     Returns:
       A dict with message encoded into bytes
     """
-    league_id = message_text
-    invite_id = await Utils.generate_random_id(length=10)
+    split_text = message_text.split()
+    league_id = split_text[0] if split_text else ""
+    count = 1
+    if len(split_text) > 1 and split_text[1].isdigit():
+      count = min(int(split_text[1]), config.LEAGUE_INVITES_MAX)
     # Check if league exists
     league_exists = await MongoClient.get_league(league_id=league_id)
     if not league_exists:
@@ -1939,11 +2079,11 @@ class TelegramCommands:
           chat_id=chat_id,
           message_text=f"The league with ID {league_id} doesn't exist!",
       )
-    result = await League.create_league_invite(
+    invite_codes = await League.create_league_invites(
         league_id=league_id,
-        invite_id=invite_id,
+        count=count,
     )
-    if not result:
+    if not invite_codes:
       return Utils.generate_outgoing_message(
           command="menu",
           chat_id=chat_id,
@@ -1952,10 +2092,11 @@ class TelegramCommands:
     return Utils.generate_outgoing_message(
         command="menu",
         chat_id=chat_id,
-        message_text=f"{invite_id}",
+        message_text="\n".join(invite_codes),
     )
 
   @classmethod
+  @registry.command("league_user_reg", payload=dict)
   async def create_league_player(
       cls,
       chat_id: str,
@@ -1969,7 +2110,7 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     telegram = message_dict.get("telegram")
     chat_id = message_dict.get("chat_id")
     league_id = message_dict.get("league_id")
@@ -1994,33 +2135,18 @@ class TelegramCommands:
           chat_id=chat_id,
           message_text=f"You are already registered in '{league_name}!",
       )
-    # Check if league invite exists
-    invite_exists = await MongoClient.get_league_invite(invite_code=league_user)
-    if not invite_exists:
-      return Utils.generate_outgoing_message(
-          command="leaguemenu",
-          chat_id=chat_id,
-          message_text=f"The invite code {league_user} doesn't exist!",
-      )
-    delete_result = await MongoClient.delete_league_invite(
-        invite_id=league_user,
-    )
-    if not delete_result:
-      return Utils.generate_outgoing_message(
-          command="leaguemenu",
-          chat_id=chat_id,
-          message_text=f"Failed to process the invite",
-      )
+    # Use up the invite and register the player
     result = await League.create_league_player(
         telegram=telegram,
         chat_id=chat_id,
         league_id=league_id,
+        invite_code=league_user,
     )
     if not result:
       return Utils.generate_outgoing_message(
           command="leaguemenu",
           chat_id=chat_id,
-          message_text=f"Failed to register a league player",
+          message_text=f"The invite code {league_user} is not valid!",
       )
     return Utils.generate_outgoing_message(
         command="leaguemenu",
@@ -2029,6 +2155,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("league_match_result_send", payload=dict)
   async def send_match_result(
       cls,
       chat_id: str,
@@ -2042,7 +2169,7 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     print("MESSAGE DICT\n")
     print(message_dict)
     league_id = message_dict.get("league_id")
@@ -2070,6 +2197,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("league_match_result_confirm", payload=dict)
   async def confirm_match_result(
       cls,
       chat_id: str,
@@ -2083,128 +2211,25 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     league_id = message_dict.get("league_id")
     player_one = message_dict.get("player_one")
     player_two = message_dict.get("player_two")
     match_result = message_dict.get("result")
-    league = await MongoClient.get_league(league_id=league_id)
-    player_one_data = await MongoClient.get_league_player(
-        telegram=player_one,
-        league_id=league_id,
-    )
-    player_two_data = await MongoClient.get_league_player(
-        telegram=player_two,
-        league_id=league_id,
-    )
-    # Check the total amount of standings against the same person allowed now
-    standings_total = league.get("current_week") * 3
-    print(f"TOTAL STANDING MATCHES: {standings_total}")
-    standings_same_player = league.get("current_week")
-    print(f"STANDINGS AGAINST SAME PLAYER ALLOWED: {standings_same_player}")
-    # Bools for determining if it is the standing match for players
-    player_one_standing_played = player_one_data.get("standing_matches_played")
-    player_two_standing_played = player_two_data.get("standing_matches_played")
-    player_one_standing = False
-    player_two_standing = False
-    # Check the amount of standing games player one has against player two
-    standing_player_1_vs = await MongoClient.get_player_standing_against_player(
-        player_one=player_one,
-        player_two=player_two,
-    )
-    standings_p1_vs_p2 = len(standing_player_1_vs)
-    print(f"Total standings P1 has against P2: {standings_p1_vs_p2}")
-    # Check the amount of standing games player two has against player one
-    standing_player_2_vs = await MongoClient.get_player_standing_against_player(
-        player_one=player_two,
-        player_two=player_one,
-    )
-    standings_p2_vs_p1 = len(standing_player_2_vs)
-    print(f"Total standings P2 has against P1: {standings_p2_vs_p1}")
-    # Allow standing for player one
-    if (player_one_standing_played < standings_total 
-        and
-        standings_p1_vs_p2 < standings_same_player 
-        ):
-      player_one_standing = True
-    # Allow standing for player two
-    if (player_two_standing_played < standings_total 
-        and
-        standings_p2_vs_p1 < standings_same_player 
-        ):
-      player_two_standing = True
-    # Add a match to the DB
-    match_added = await League.create_league_match(
+    (_, message) = await League.record_match(
         player_one=player_one,
         player_two=player_two,
         result=match_result,
         league_id=league_id,
-        player_one_standing=player_one_standing,
-        player_two_standing=player_two_standing,
-    )
-    if not match_added:
-      return Utils.generate_outgoing_message(
-          command="leaguemenu",
-          chat_id=chat_id,
-          message_text=f"Couldn't add a match to the DB, please try again!",
-      )
-    # Update player scores
-    player_one_streak = player_one_data.get("win_streak")
-    player_two_streak = player_two_data.get("win_streak")
-    results = match_result.split("-")
-    player_one_score = int(results[0])
-    player_two_score = int(results[1])
-    # Player 1 broke streak
-    if player_two_streak > 2 and player_one_score > player_two_score:
-      message = (
-          f"{player_one} broke {player_two}'s "
-          f"{player_two_streak} matches win streak!"
-      )
-      await League.league_broadcast_message(
-          league_id=league_id,
-          message=message,
-      )
-    # Player 2 broke streak
-    if player_one_streak > 2 and player_two_score > player_one_score:
-      message = (
-          f"{player_two} broke {player_one}'s "
-          f"{player_one_streak} matches win streak!"
-      )
-      await League.league_broadcast_message(
-          league_id=league_id,
-          message=message,
-      )
-    update_p1 = await MongoClient.update_player(
-        telegram=player_one,
-        win=player_one_score > player_two_score,
-        standing=player_one_standing,
-        broke_streak=player_two_streak > 2,
-    )
-    if not update_p1:
-      return Utils.generate_outgoing_message(
-          command="leaguemenu",
-          chat_id=chat_id,
-          message_text=f"Couldn't update player data, please contact admin!",
-      )
-    update_p2 = await MongoClient.update_player(
-        telegram=player_two,
-        win=player_one_score < player_two_score,
-        standing=player_two_standing,
-        broke_streak=player_one_streak > 2,
     )
-    if not update_p2:
-      return Utils.generate_outgoing_message(
-          command="leaguemenu",
-          chat_id=chat_id,
-          message_text=f"Couldn't update player data, please contact admin!",
-      )
     return Utils.generate_outgoing_message(
-          command="leaguemenu",
-          chat_id=chat_id,
-          message_text=f"Your match has been recorded!",
-      )
+        command="leaguemenu",
+        chat_id=chat_id,
+        message_text=message,
+    )
 
   @classmethod
+  @registry.command("league_standings_check", payload=dict)
   async def check_league_standings(
       cls,
       chat_id: str,
@@ -2218,7 +2243,7 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     league_id = message_dict.get("league_id")
     telegram = message_dict.get("telegram")
     league = await MongoClient.get_league(league_id=league_id)
@@ -2232,12 +2257,12 @@ class TelegramCommands:
           chat_id=chat_id,
           message_text=f"User {telegram} is not in that league!",
       )
-    all_players = await MongoClient.get_all_leagues_players(league_id=league_id)
     league_name = league.get("league_name")
     league_weeks_total = league.get("total_duration_weeks")
     league_current_week = league.get("current_week")
     date_joined = player_data.get("date_joined")
     total_points = player_data.get("total_points")
+    rank = player_data.get("rank", "-")
     standing_matches_ = player_data.get("standing_matches_played")
     standing_wins = player_data.get("standing_wins")
     standing_losses = player_data.get("standing_losses")
@@ -2251,6 +2276,7 @@ class TelegramCommands:
         f"Current week: {league_current_week}/{league_weeks_total}\n"
         f"You joined: {date_joined}\n"
         f"Your total points: {total_points}\n"
+        f"Your rank: {rank}\n"
         f"Total matches played: {total_played}\n"
         f"Total score: {total_wins}-{total_losses}\n"
         f"Standings matches played: {standing_matches_}/{total_standing}\n"
@@ -2264,6 +2290,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("league_stats_check", payload=dict)
   async def check_league_stats(
       cls,
       chat_id: str,
@@ -2277,7 +2304,7 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     league_id = message_dict.get("league_id")
     telegram = message_dict.get("telegram")
     league = await MongoClient.get_league(league_id=league_id)
@@ -2291,27 +2318,12 @@ class TelegramCommands:
           chat_id=chat_id,
           message_text=f"User {telegram} is not in that league!",
       )
-    all_players = await MongoClient.get_all_leagues_players(league_id=league_id)
     # Get the leaderboard
-    sorted_players = sorted(
-      all_players,
-      key=lambda x: x["total_points"],
-      reverse=True,
-    )
-    top_players = []
-    for player in sorted_players[:10]:
-      streak = ""
-      if player["win_streak"] >=3:
-        streak = f"🔥"
-      player_message = (
-          f"{player["telegram"]} "
-          f"{player["standing_wins"]}-{player["standing_losses"]} "
-          f"({player["total_points"]} points) {streak}"
-      )
-      top_players.append(player_message)
-    leaderboard_players = "\n".join(top_players)
-    leaderboard = "\n<b>Top 10 players:</b>\n" + leaderboard_players
-    player_count = len(all_players)
+    leaderboard = await League.create_leaderboard_message(
+        league_id=league_id,
+        top=10,
+    )
+    player_count = await MongoClient.count_league_players(league_id=league_id)
     league_name = league.get("league_name")
     league_weeks_total = league.get("total_duration_weeks")
     league_current_week = league.get("current_week")
@@ -2328,6 +2340,7 @@ class TelegramCommands:
     )
 
   @classmethod
+  @registry.command("league_matches_check", payload=dict)
   async def check_match_stats(
       cls,
       chat_id: str,
@@ -2341,59 +2354,59 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    message_dict = json.loads(message_text)
+    message_dict = Utils.load_payload(message_text)
     league_id = message_dict.get("league_id")
     telegram = message_dict.get("telegram")
+    page = message_dict.get("page", 1)
+    page_size = config.LEAGUE_MATCHES_PAGE_SIZE
     league = await MongoClient.get_league(league_id=league_id)
     league_name = league.get("league_name")
-    matches = await MongoClient.get_all_player_matches(telegram=telegram)
-    if not matches:
+    (matches, total) = await MongoClient.get_player_matches_page(
+        league_id=league_id,
+        telegram=telegram,
+        page=page,
+        page_size=page_size,
+    )
+    if not total:
       return Utils.generate_outgoing_message(
           command="leaguemenu",
           chat_id=chat_id,
           message_text="You have not played any matches yet!",
       )
-    sorted_standing_matches = sorted(
-    (match for match in matches if match["standings"].get(telegram) is True),
-    key=lambda x: datetime.strptime(x["date_played"], "%d.%m.%Y %H:%M")
-    )
-    result_message = (
-        f"<b>{league_name}</b>\n"
-        "<b>Your standing matches:</b>\n"
-    )
+    telegram = telegram.lower()
     standing_messages = []
-    for match in sorted_standing_matches:
+    tie_messages = []
+    for match in matches:
       if match["player_one"] == telegram:
         result = match["result"]
         message = f"{match["player_one"]} {result} {match["player_two"]}"
-      elif match["player_two"] == telegram:
+      else:
         result = match["result"][::-1]
         message = f"{match["player_two"]} {result} {match["player_one"]}"
-      standing_messages.append(message)
-    standing_message = "\n".join(standing_messages)
-    result_message += standing_message
-    sorted_tiebreaker_matches = sorted(
-    (match for match in matches if match["standings"].get(telegram) is False),
-    key=lambda x: datetime.strptime(x["date_played"], "%d.%m.%Y %H:%M")
-    )
-    if sorted_tiebreaker_matches:
-      result_message += "\n<b>Your tiebreaker matches:</b>\n"
-      tie_messages = []
-      for match in sorted_tiebreaker_matches:
-        if match["player_one"] == telegram:
-          result = match["result"]
-          message = f"{match["player_one"]} {result} {match["player_two"]}"
-        elif match["player_two"] == telegram:
-          result = match["result"][::-1]
-          message = f"{match["player_two"]} {result} {match["player_one"]}"
+      if match["standings"].get(telegram) is True:
+        standing_messages.append(message)
+      else:
         tie_messages.append(message)
-      tie_message = "\n".join(tie_messages)
-      result_message += tie_message
+    pages = (total + page_size - 1) // page_size
+    result_message = f"<b>{league_name}</b>\n"
+    if standing_messages:
+      result_message += "<b>Your standing matches:</b>\n"
+      result_message += "\n".join(standing_messages) + "\n"
+    if tie_messages:
+      result_message += "<b>Your tiebreaker matches:</b>\n"
+      result_message += "\n".join(tie_messages) + "\n"
+    if pages > 1:
+      result_message += f"\nPage {page}/{pages}"
     return Utils.generate_outgoing_message(
-          command="leaguemenu",
-          chat_id=chat_id,
-          message_text=result_message,
-      )
+        command="leaguematches",
+        chat_id=chat_id,
+        message_text=result_message,
+        options={
+            "league_id": league_id,
+            "page": page,
+            "pages": pages,
+        },
+    )
 
   @classmethod
   async def resolve_command(
@@ -2413,285 +2426,18 @@ class TelegramCommands:
     Returns:
       A dict with message encoded into bytes
     """
-    match command:
-      case "any_message" | "help":
-        return await cls.show_help(chat_id=chat_id)
-      case "dbhelp":
-        return await cls.show_deckbox_help(chat_id=chat_id)
-      case "confluxhelp":
-        return await cls.show_conflux_help(chat_id=chat_id)
-      case "leaguehelp":
-        return await cls.show_league_help(chat_id=chat_id)
-      # Verification message 
-      case "verification":
-        return await cls.show_verification(
-            chat_id=chat_id,
-            message_text=message_text,
-            message_thread_id=message_thread_id,
-        )
-      # Approval in chat 
-      case "approve":
-        return await cls.approve_user(
-            chat_id=chat_id,
-            message_text=message_text,
-            message_thread_id=message_thread_id,
-        )
-      # Disapproval in chat 
-      case "disapprove":
-        return await cls.disapprove_user(
-            chat_id=chat_id,
-            message_text=message_text,
-            message_thread_id=message_thread_id,
-        )
-      # Scryfall card URL fetcher
-      case "c":
-        return await cls.show_full_card_url(
-            chat_id=chat_id,
-            message_text=message_text,
-            message_thread_id=message_thread_id,
-        )
-      # Scryfall card image fetcher
-      case "ci":
-        return await cls.show_card_image(
-            chat_id=chat_id,
-            message_thread_id=message_thread_id,
-            message_text=message_text,
-        )
-      # Scryfall card price fetcher
-      case "cp":
-        return await cls.show_card_price(
-            chat_id=chat_id,
-            message_text=message_text,
-            message_thread_id=message_thread_id,
-        )
-      # Sending a message to user
-      case "sendmsg":
-        return await cls.send_freeform_message(
-            chat_id=chat_id,
-            message_text=message_text,
-            message_thread_id=message_thread_id,
-        )
-      # Registering a user
-      case "reg":
-        return await cls.register_user(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Registering a deckbox for a user
-      case "regdeckbox":
-        return await cls.add_deckbox_to_user(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Checking current registered deckbox
-      case "mydeckbox":
-        return await cls.check_user_deckbox(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Updating users deckbox
-      case "updatedeckbox":
-        return await cls.update_user_deckbox(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Adding a subscription to user
-      case "dbsub":
-        return await cls.add_subscription_to_user(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Removing a subscription from user
-      case "dbunsub":
-        return await cls.remove_subscription_from_user(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Checking user subscriptions
-      case "mydeckboxsubs":
-        return await cls.check_user_deckbox_subscriptions(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Searching for chosen cards
-      case "search":
-        return await cls.bulk_search_cards(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Searching for chosen cards in chosen deckboxes
-      case "dbsearch":
-        return await cls.deckboxes_search_cards(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Searching for cards from a wishlist
-      case "wish":
-        return await cls.search_cards_from_wishlist(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Searching for cards from a wishlist in chosen deckboxes
-      case "dbwish":
-        return await cls.deckboxes_search_cards_from_wishlist(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Sending a starting menu
-      case "start":
-        return await cls.get_user_menu(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Sending a deckbox menu
-      case "deckboxmenu":
-        return await cls.get_deckbox_menu(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Sending a conflux menu
-      case "confluxmenu":
-        return await cls.get_conflux_menu(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Sending a league menu
-      case "leaguemenu":
-        return await cls.get_league_menu(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Creating/forwarding a EDH danas poll
-      case "edhdanas":
-        return await cls.edh_danas_send_poll(
-            chat_id=chat_id,
-            message_text=message_text,
-            message_thread_id=message_thread_id,
-        )
-      # Sending a new quiz message
-      case "quiz":
-        return await cls.show_quiz_image(
-            chat_id=chat_id,
-        )
-      # Handling quiz replies
-      case "quiz_answer":
-        return await cls.handle_quiz_reply(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Handling quiz replies
-      case "addstore":
-        return await cls.add_store(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Subscribing to conflux
-      case "confluxsub":
-        return await cls.add_store_subscription_to_user(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Unsubscribing from conflux
-      case "confluxunsub":
-        return await cls.remove_store_subscription_from_user(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Searching for cards in conflux
-      case "consearch":
-        return await cls.conflux_search_cards(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Searching for cards from a wishlist in conflux
-      case "conwish":
-        return await cls.conflux_search_wishlist(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Re-caching all deckboxes manually
-      case "deckboxrecache":
-        return await cls.recache_deckboxes_manually(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Re-caching conflux manually
-      case "confluxcache":
-        return await cls.recache_conflux_manually(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Subscribing channel to a league
-      case "league_subscribe":
-        return await cls.subscribe_to_league(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Unsubscribing channel from a league
-      case "league_unsubscribe":
-        return await cls.unsubscribe_from_league(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Activating/Deactivating a league
-      case "league_status_change":
-        return await cls.change_league_status(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Creating a new league
-      case "league_create":
-        return await cls.create_league(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      case "league_invite":
-        return await cls.create_league_invite(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      case "league_user_reg":
-        return await cls.create_league_player(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      case "league_match_result_send":
-        return await cls.send_match_result(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      case "league_match_result_confirm":
-        return await cls.confirm_match_result(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      case "league_standings_check":
-        return await cls.check_league_standings(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      case "league_stats_check":
-        return await cls.check_league_stats(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      case "league_matches_check":
-        return await cls.check_match_stats(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Updating leagues manually
-      case "leagues_update":
-        return await cls.update_leagues_manually(
-            chat_id=chat_id,
-            message_text=message_text,
-        )
-      # Any unknown commands
-      case _:
-        text = f"Unkown command: {command}"
-        return Utils.generate_outgoing_message(
-            command="text",
-            chat_id=chat_id,
-            message_thread_id=message_thread_id,
-            message_text=text,
-        )
+    if not cls.registry.has(command):
+      text = f"Unkown command: {command}"
+      return Utils.generate_outgoing_message(
+          command="text",
+          chat_id=chat_id,
+          message_thread_id=message_thread_id,
+          message_text=text,
+      )
+    return await cls.registry.dispatch(
+        owner=cls,
+        name=command,
+        chat_id=chat_id,
+        message_text=message_text,
+        message_thread_id=message_thread_id,
+    )
@@ -14,6 +14,8 @@ RABBITMQ_PORT = os.getenv("RABBITMQ_PORT")
 EXCHANGE_NAME = os.getenv("EXCHANGE_NAME")
 FROM_USER_QUEUE_NAME = os.getenv("FROM_USER_QUEUE_NAME")
 TO_USER_QUEUE_NAME = os.getenv("TO_USER_QUEUE_NAME")
+# Codec of the queue messages, "json" or "msgpack" (needs msgpack installed)
+QUEUE_MESSAGE_CODEC = os.getenv("QUEUE_MESSAGE_CODEC", "json").lower()
 
 # Telegram bot token
 BOT_TOKEN = os.getenv("BOT_TOKEN")
@@ -29,15 +31,83 @@ AIO_PIKA_PARAMETERS = {
 LISTENER_RECONNECT_RETRIES = 20
 LISTENER_RECONNECT_DELAY = 5
 LISTENER_HEALTH_CHECK_DELAY = 120
+# Amount of messages a broadcast delivers at the same time
+BROADCAST_CONCURRENCY = 10
+# Amount of commands of a priority class the listeners run at the same time
+COMMAND_PRIORITY_LIMITS = {"bulk": 2, "admin": 1}
+
+# Metrics served in the Prometheus text format on /metrics by every process
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "").lower() == "true"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+# Leagues
+LEAGUE_MATCHES_PAGE_SIZE = 20
+# Amount of leagues processed at the same time during the weekly rollover
+LEAGUE_ROLLOVER_WORKERS = 5
+# Maximum amount of invites created with one command
+LEAGUE_INVITES_MAX = 100
 
 # MongoDB
 MONGO_CONNECTION = os.getenv("MONGO_CONNECTION")
+# Transactions need MongoDB running as a replica set
+MONGO_TRANSACTIONS = os.getenv("MONGO_TRANSACTIONS", "").lower() == "true"
+# Mongo commands slower than this many milliseconds are logged
+MONGO_SLOW_QUERY_MS = int(os.getenv("MONGO_SLOW_QUERY_MS", "100"))
+
+# EDH danas poll venues, "answer" is the text shown in the poll
+EDH_DANAS_VENUES = [
+    {"key": "ravnica", "name": "Ravnica", "answer": "Da, Ravnica"},
+    {"key": "underground", "name": "Underground", "answer": "Da, Underground"},
+    {"key": "dice_arena", "name": "Dice Arena", "answer": "Da, Dice Arena"},
+    {"key": "nbg", "name": "3D/Groot", "answer": "Da, Groot/3D"},
+]
+EDH_DANAS_OTHER_OPTIONS = ["Ne", "Ne znam"]
+EDH_DANAS_MIN_PLAYERS = 4
 
 # Deckbox
 DECKBOX_LOGIN = os.getenv("DECKBOX_LOGIN")
 DECKBOX_PASSWORD = os.getenv("DECKBOX_PASSWORD")
 DECKBOX_COOKIE = ""
 DECKBOX_COOKIE_LAST_LOGIN = ""
+# Keep a normalised copy of deckbox cards (one document per card) for searches
+DECKBOX_CARDS_NORMALISED = (
+    os.getenv("DECKBOX_CARDS_NORMALISED", "").lower() == "true"
+)
+
+# Scryfall local card database built from bulk data
+SCRYFALL_LOCAL_DB = os.getenv("SCRYFALL_LOCAL_DB", "").lower() == "true"
+SCRYFALL_LOCAL_DB_PATH = os.getenv(
+    "SCRYFALL_LOCAL_DB_PATH", "data/scryfall_cards.sqlite3"
+)
+# Build the database from this file instead of downloading the bulk data
+SCRYFALL_BULK_DATA_FILE = os.getenv("SCRYFALL_BULK_DATA_FILE")
+# Scryfall responses cache, TTLs are in seconds
+SCRYFALL_CACHE_SIZE = 2000
+SCRYFALL_CARD_TTL = 24 * 60 * 60
+SCRYFALL_PRICE_TTL = 60 * 60
+SCRYFALL_NEGATIVE_TTL = 10 * 60
+# Keep the cached responses in Mongo so they survive restarts
+SCRYFALL_CACHE_PERSISTENT = (
+    os.getenv("SCRYFALL_CACHE_PERSISTENT", "").lower() == "true"
+)
+# Scryfall asks to keep the traffic around 10 requests per second
+SCRYFALL_REQUESTS_PER_SECOND = 10
+SCRYFALL_REQUESTS_BURST = 10
+# Timeout in seconds of a single request and retries after 429/5xx answers
+SCRYFALL_TIMEOUT = 10
+SCRYFALL_MAX_RETRIES = 3
+SCRYFALL_RETRY_DELAY = 1
+# Maximum amount of cards in one /cards/collection request and in a batch
+SCRYFALL_COLLECTION_SIZE = 75
+SCRYFALL_BATCH_MAX_CARDS = 300
+# Random cards kept ready for quizzes and verifications
+SCRYFALL_CARD_POOL_SIZE = 50
+# Card price history, the snapshot is used by /cp while it's fresh enough
+PRICE_HISTORY_DAYS = 365
+PRICE_TREND_DAYS = 30
+PRICE_SNAPSHOT_MAX_AGE = 36 * 60 * 60
+# Telegram file IDs of sent images kept in memory
+MEDIA_CACHE_SIZE = 5000
 
 # Admins
 admins_str = os.getenv("ADMINS")
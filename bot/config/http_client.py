@@ -1,16 +1,57 @@
 """Module for initializing and closing the HTTP client sessions.
 """
 import aiohttp
+import re
+import time
+from urllib.parse import parse_qsl, urlsplit
+from bot.config import urls
+from bot.utils.metrics import COUNTER, HISTOGRAM, Metrics
+from bot.utils.tracing import Trace
+
+Metrics.define(
+    name="http_requests_total",
+    kind=COUNTER,
+    description="Upstream HTTP requests by host, endpoint and status",
+)
+Metrics.define(
+    name="http_dns_seconds",
+    kind=HISTOGRAM,
+    description="Time spent resolving upstream hosts",
+)
+Metrics.define(
+    name="http_connect_seconds",
+    kind=HISTOGRAM,
+    description="Time spent opening connections, TLS handshake included",
+)
+Metrics.define(
+    name="http_ttfb_seconds",
+    kind=HISTOGRAM,
+    description="Time from a ready connection to the response headers",
+)
+Metrics.define(
+    name="http_transfer_seconds",
+    kind=HISTOGRAM,
+    description="Time spent reading upstream response bodies",
+)
+Metrics.define(
+    name="http_connections_total",
+    kind=COUNTER,
+    description="Connections used by upstream requests, new or reused",
+)
 
 class HttpClient:
   HTTP_SESSION = None
+  # Endpoint templates built from the URLs the bot requests
+  ENDPOINTS = None
 
   @classmethod
   async def init_client(cls):
     """Initializes the new Http client session.
     """
     # Initialize the ClientSession
-    cls.HTTP_SESSION = aiohttp.ClientSession()
+    cls.HTTP_SESSION = aiohttp.ClientSession(
+        trace_configs=[cls.trace_config()],
+    )
 
   @classmethod
   async def close_client(cls):
@@ -18,3 +59,195 @@ class HttpClient:
     """
     # Close the ClientSession
     await cls.HTTP_SESSION.close()
+
+  @classmethod
+  def trace_config(cls) -> aiohttp.TraceConfig:
+    """Creates the hooks timing the requests made by the session.
+
+    Returns:
+      A trace config for the session
+    """
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(cls.on_request_start)
+    trace_config.on_dns_resolvehost_start.append(cls.on_dns_start)
+    trace_config.on_dns_resolvehost_end.append(cls.on_dns_end)
+    trace_config.on_connection_create_start.append(cls.on_connection_start)
+    trace_config.on_connection_create_end.append(cls.on_connection_end)
+    trace_config.on_connection_reuseconn.append(cls.on_connection_reused)
+    trace_config.on_request_end.append(cls.on_request_end)
+    trace_config.on_request_exception.append(cls.on_request_exception)
+    trace_config.on_response_chunk_received.append(cls.on_response_received)
+    return trace_config
+
+  @classmethod
+  def load_endpoints(cls) -> list[dict]:
+    """Builds the endpoint templates from the URLs in the urls module.
+
+    Path placeholders become patterns, query parameters with fixed values
+    have to match and are kept in the template name.
+
+    Returns:
+      A list of dicts with host, path pattern, fixed query parameters and
+      template name, the most specific templates first
+    """
+    endpoints = []
+    for value in vars(urls).values():
+      if not isinstance(value, str) or not value.startswith("http"):
+        continue
+      parts = urlsplit(value)
+      path = re.sub(r"\{\w+\}", "\0", parts.path)
+      pattern = "[^/]+".join(re.escape(part) for part in path.split("\0"))
+      query = {
+          key: item for (key, item)
+          in parse_qsl(parts.query, keep_blank_values=True)
+          if item and "{" not in item
+      }
+      name = parts.path
+      if query:
+        name += "?" + "&".join(f"{key}={item}" for (key, item) in query.items())
+      endpoints.append({
+          "host": parts.hostname,
+          "pattern": re.compile(f"^{pattern}$"),
+          "query": query,
+          "name": name,
+      })
+    endpoints.sort(
+        key=lambda endpoint: (len(endpoint["query"]), len(endpoint["name"])),
+        reverse=True,
+    )
+    return endpoints
+
+  @classmethod
+  def endpoint_template(cls, url) -> str:
+    """Finds the endpoint template of a requested URL.
+
+    Args:
+      url: yarl URL of the request
+    Returns:
+      A string with the template, URLs without a template get the path with
+      the segments containing digits replaced
+    """
+    if cls.ENDPOINTS is None:
+      cls.ENDPOINTS = cls.load_endpoints()
+    for endpoint in cls.ENDPOINTS:
+      if endpoint["host"] != url.host:
+        continue
+      if not endpoint["pattern"].match(url.path):
+        continue
+      query = endpoint["query"]
+      if all(url.query.get(key) == item for (key, item) in query.items()):
+        return endpoint["name"]
+    return re.sub(r"/[^/]*\d[^/]*", "/{id}", url.path)
+
+  @classmethod
+  def add_request_time(cls, trace_config_ctx) -> float:
+    """Adds the time since the last mark of the request to the command trace.
+
+    Args:
+      trace_config_ctx: aiohttp context of the request
+    Returns:
+      A float with the time since the last mark in seconds
+    """
+    now = time.perf_counter()
+    elapsed = now - trace_config_ctx.marked_at
+    trace = Trace.current()
+    if trace:
+      trace.add_http_time(elapsed)
+    trace_config_ctx.marked_at = now
+    return elapsed
+
+  @classmethod
+  async def on_request_start(cls, session, trace_config_ctx, params) -> None:
+    """Marks the start of a request."""
+    trace_config_ctx.marked_at = time.perf_counter()
+    trace_config_ctx.ready_at = trace_config_ctx.marked_at
+    # The connection signals don't carry the URL
+    trace_config_ctx.url = params.url
+    trace_config_ctx.dns_time = 0.0
+    trace_config_ctx.endpoint = None
+
+  @classmethod
+  async def on_dns_start(cls, session, trace_config_ctx, params) -> None:
+    """Marks the start of a host resolution."""
+    trace_config_ctx.dns_started_at = time.perf_counter()
+
+  @classmethod
+  async def on_dns_end(cls, session, trace_config_ctx, params) -> None:
+    """Records the time spent resolving a host."""
+    elapsed = time.perf_counter() - trace_config_ctx.dns_started_at
+    trace_config_ctx.dns_time += elapsed
+    Metrics.observe("http_dns_seconds", elapsed, host=params.host)
+
+  @classmethod
+  async def on_connection_start(cls, session, trace_config_ctx, params):
+    """Marks the start of a new connection."""
+    trace_config_ctx.connect_started_at = time.perf_counter()
+    trace_config_ctx.dns_time = 0.0
+
+  @classmethod
+  async def on_connection_end(cls, session, trace_config_ctx, params):
+    """Records the time spent opening a new connection."""
+    now = time.perf_counter()
+    # The connection includes the host resolution which is recorded apart
+    elapsed = (
+        now - trace_config_ctx.connect_started_at - trace_config_ctx.dns_time
+    )
+    url = trace_config_ctx.url
+    Metrics.observe(
+        "http_connect_seconds",
+        elapsed,
+        host=url.host,
+        tls="true" if url.scheme == "https" else "false",
+    )
+    Metrics.increment("http_connections_total", host=url.host, reused="false")
+    trace_config_ctx.ready_at = now
+
+  @classmethod
+  async def on_connection_reused(cls, session, trace_config_ctx, params):
+    """Counts a request sent on a pooled connection."""
+    url = trace_config_ctx.url
+    Metrics.increment("http_connections_total", host=url.host, reused="true")
+    trace_config_ctx.ready_at = time.perf_counter()
+
+  @classmethod
+  async def on_request_end(cls, session, trace_config_ctx, params) -> None:
+    """Records the time until the response headers."""
+    cls.add_request_time(trace_config_ctx=trace_config_ctx)
+    host = params.url.host
+    endpoint = cls.endpoint_template(url=params.url)
+    trace_config_ctx.endpoint = endpoint
+    Metrics.observe(
+        "http_ttfb_seconds",
+        trace_config_ctx.marked_at - trace_config_ctx.ready_at,
+        host=host,
+        endpoint=endpoint,
+    )
+    Metrics.increment(
+        "http_requests_total",
+        host=host,
+        endpoint=endpoint,
+        status=params.response.status,
+    )
+
+  @classmethod
+  async def on_request_exception(cls, session, trace_config_ctx, params):
+    """Counts a request that failed before getting a response."""
+    cls.add_request_time(trace_config_ctx=trace_config_ctx)
+    Metrics.increment(
+        "http_requests_total",
+        host=params.url.host,
+        endpoint=cls.endpoint_template(url=params.url),
+        status="error",
+    )
+
+  @classmethod
+  async def on_response_received(cls, session, trace_config_ctx, params):
+    """Records the time spent reading the response body."""
+    # aiohttp sends the chunk signal once the whole body is read
+    elapsed = cls.add_request_time(trace_config_ctx=trace_config_ctx)
+    Metrics.observe(
+        "http_transfer_seconds",
+        elapsed,
+        host=params.url.host,
+        endpoint=trace_config_ctx.endpoint or "unknown",
+    )
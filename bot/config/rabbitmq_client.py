@@ -0,0 +1,58 @@
+"""Module for publishing messages to RabbitMQ from outside of the listeners.
+"""
+import asyncio
+import aio_pika
+from bot.config import config
+from bot.utils.queue_message import QueueMessage
+
+class RabbitMQClient:
+  CONNECTION = None
+  EXCHANGE = None
+  # Concurrent first publishes share the connection opened by one of them
+  LOCK = asyncio.Lock()
+
+  @classmethod
+  async def init_client(cls):
+    """Opens a connection that is reused for all the published messages.
+    """
+    cls.CONNECTION = await aio_pika.connect_robust(
+        **config.AIO_PIKA_PARAMETERS,
+    )
+    channel = await cls.CONNECTION.channel()
+    cls.EXCHANGE = await channel.declare_exchange(
+        name=config.EXCHANGE_NAME,
+        type=aio_pika.ExchangeType.DIRECT,
+    )
+
+  @classmethod
+  async def close_client(cls):
+    """Closes the existing connection.
+    """
+    if cls.CONNECTION:
+      await cls.CONNECTION.close()
+    cls.CONNECTION = None
+    cls.EXCHANGE = None
+
+  @classmethod
+  async def publish(
+      cls,
+      message: bytes,
+      routing_key: str,
+  ) -> None:
+    """Publishes a message to the queue with a given routing key.
+
+    Args:
+      message: message encoded into bytes
+      routing_key: name of the queue
+    """
+    if cls.EXCHANGE is None:
+      async with cls.LOCK:
+        if cls.EXCHANGE is None:
+          await cls.init_client()
+    await cls.EXCHANGE.publish(
+        message=aio_pika.Message(
+            body=message,
+            content_type=QueueMessage.content_type(),
+        ),
+        routing_key=routing_key,
+    )
@@ -3,6 +3,8 @@
 
 SCRYFALL_GET_CARD_URL = "https://api.scryfall.com/cards/named?fuzzy={name}"
 SCRYFALL_GET_RANDOM_CARD_URL = "https://api.scryfall.com/cards/random"
+SCRYFALL_COLLECTION_URL = "https://api.scryfall.com/cards/collection"
+SCRYFALL_BULK_DATA_URL = "https://api.scryfall.com/bulk-data/oracle-cards"
 DECKBOX_TRADELIST_URL = "https://deckbox.org/sets/{deckbox_id}"
 DECKBOX_TRADELIST_CARDNAME_FILTER_URL = (
   "https://deckbox.org/sets/{deckbox_id}?f=17{card_name}"
@@ -1,8 +1,11 @@
 """Module for manipulating leagues.
 """
+import asyncio
 from datetime import datetime
+from bot.config import config
+from bot.config.rabbitmq_client import RabbitMQClient
 from bot.mongo.mongo_client import MongoClient
-from bot.telegram.bot import MagicBot
+from bot.utils.utils import Utils
 
 
 class League:
@@ -39,28 +42,37 @@ class League:
     return league_added
 
   @classmethod
-  async def create_league_invite(
+  async def create_league_invites(
       cls,
       league_id: str,
-      invite_id: str,
-  ) -> bool:
-    """Creates a new league invite in the DB.
+      count: int,
+  ) -> list[str]:
+    """Creates new league invites with unique codes in the DB.
 
     Args:
       league_id: ID of the league
-      invite_id: ID of the league invite
+      count: amount of invites to create
 
     Returns:
-      A bool with the result of the operation
+      A list with the codes of the created invites
     """
-    league_invite_object = {
-        "league_id": league_id,
-        "invite_code": invite_id,
-    }
-    invite_added = await MongoClient.add_league_invite(
-        object=league_invite_object,
-    )
-    return invite_added
+    invite_codes = []
+    # Retry if some of the generated codes were already taken
+    for _ in range(3):
+      missing = count - len(invite_codes)
+      if missing <= 0:
+        break
+      new_codes = set()
+      while len(new_codes) < missing:
+        new_codes.add(await Utils.generate_random_id(length=10))
+      league_invite_objects = [
+          {"league_id": league_id.lower(), "invite_code": invite_code}
+          for invite_code in new_codes
+      ]
+      invite_codes += await MongoClient.add_league_invites(
+          objects=league_invite_objects,
+      )
+    return invite_codes
 
   @classmethod
   async def create_league_player(
@@ -68,13 +80,15 @@ class League:
       telegram: str,
       chat_id: int,
       league_id: str,
+      invite_code: str,
   ) -> bool:
-    """Creates a new player in the DB.
+    """Redeems an invite and creates a new player in the DB.
 
     Args:
       telegram: name of the player
       chat_id: chat id of the player
       league_id: ID of the league
+      invite_code: code of the league invite
 
     Returns:
       A bool with the result of the operation
@@ -95,7 +109,16 @@ class League:
         "total_losses": 0,
         "win_streak": 0,
     }
-    player_added = await MongoClient.add_league_player(object=player_object)
+    player_added = await MongoClient.redeem_league_invite(
+        invite_code=invite_code,
+        player=player_object,
+    )
+    if player_added:
+      # New players have no points, only the players without points are tied
+      await MongoClient.update_league_ranks(
+          league_id=league_id,
+          points_range=(0, 0),
+      )
     return player_added
 
   @classmethod
@@ -122,7 +145,57 @@ class League:
     return message
 
   @classmethod
-  async def create_league_match(
+  async def create_leaderboard_message(
+      cls,
+      league_id: str,
+      top: int,
+  ) -> str:
+    """Creates a leaderboard message with the best players of a league.
+
+    Args:
+      league_id: ID of the league
+      top: amount of players to show
+
+    Returns:
+      A string with the leaderboard
+    """
+    top_players = await MongoClient.get_league_leaderboard(
+        league_id=league_id,
+        limit=top,
+    )
+    return cls.format_leaderboard(top_players=top_players, top=top)
+
+  @classmethod
+  def format_leaderboard(
+      cls,
+      top_players: list[dict],
+      top: int,
+  ) -> str:
+    """Creates a leaderboard message from already sorted players.
+
+    Args:
+      top_players: players sorted by their points
+      top: amount of players shown
+
+    Returns:
+      A string with the leaderboard
+    """
+    player_lines = []
+    for player in top_players:
+      streak = ""
+      if player["win_streak"] >= 3:
+        streak = f"🔥"
+      player_message = (
+          f"{player["telegram"]} "
+          f"{player["standing_wins"]}-{player["standing_losses"]} "
+          f"({player["total_points"]} points) {streak}"
+      )
+      player_lines.append(player_message)
+    leaderboard_players = "\n".join(player_lines)
+    return f"\n<b>Top {top} players:</b>\n" + leaderboard_players
+
+  @classmethod
+  def create_league_match_object(
       cls,
       player_one: str,
       player_two: str,
@@ -130,8 +203,8 @@ class League:
       league_id: str,
       player_one_standing: bool,
       player_two_standing: bool,
-  ) -> bool:
-    """Creates a new match in the DB.
+  ) -> dict:
+    """Creates a new match object.
 
     Args:
       player_one: name of the first player
@@ -142,7 +215,7 @@ class League:
       player_two_standing: is this a standing match for player two
 
     Returns:
-      A bool with the result of the operation
+      A dict with the match data
     """
     now = datetime.now()
     date_played = now.strftime("%d.%m.%Y %H:%M")
@@ -162,31 +235,153 @@ class League:
         "winner": winner,
         "result": result,
         "date_played": date_played,
+        "played_at": now,
+        "players": [player_one, player_two],
         "standings": {
             player_one: player_one_standing,
             player_two: player_two_standing,
         },
     }
-    match_added = await MongoClient.add_league_match(object=match_object)
-    return match_added
+    return match_object
+
+  @classmethod
+  async def record_match(
+      cls,
+      player_one: str,
+      player_two: str,
+      result: str,
+      league_id: str,
+  ) -> (bool, str):
+    """Records a confirmed match and updates the scores of both players.
+
+    Args:
+      player_one: name of the first player
+      player_two: name of the second player
+      result: result string
+      league_id: ID of the league
+
+    Returns:
+      A tuple with a boolean status of the operation and a message
+    """
+    (league, players, head_to_head) = await asyncio.gather(
+        MongoClient.get_league(league_id=league_id),
+        MongoClient.get_league_players(
+            league_id=league_id,
+            telegrams=[player_one, player_two],
+        ),
+        MongoClient.get_head_to_head_standings(
+            league_id=league_id,
+            player_one=player_one,
+            player_two=player_two,
+        ),
+    )
+    player_one_data = players.get(player_one.lower())
+    player_two_data = players.get(player_two.lower())
+    if not league or not player_one_data or not player_two_data:
+      return (False, "Couldn't find the players in that league!")
+    # Check the total amount of standings against the same person allowed now
+    standings_total = league.get("current_week") * 3
+    standings_same_player = league.get("current_week")
+    (standings_p1_vs_p2, standings_p2_vs_p1) = head_to_head
+    player_one_standing = (
+        player_one_data.get("standing_matches_played") < standings_total
+        and standings_p1_vs_p2 < standings_same_player
+    )
+    player_two_standing = (
+        player_two_data.get("standing_matches_played") < standings_total
+        and standings_p2_vs_p1 < standings_same_player
+    )
+    match_object = cls.create_league_match_object(
+        player_one=player_one,
+        player_two=player_two,
+        result=result,
+        league_id=league_id,
+        player_one_standing=player_one_standing,
+        player_two_standing=player_two_standing,
+    )
+    player_one_score = match_object.get("player_one_score")
+    player_two_score = match_object.get("player_two_score")
+    player_one_streak = player_one_data.get("win_streak")
+    player_two_streak = player_two_data.get("win_streak")
+    player_updates = {
+        player_one.lower(): MongoClient.create_player_match_update(
+            win=player_one_score > player_two_score,
+            standing=player_one_standing,
+            broke_streak=player_two_streak > 2,
+        ),
+        player_two.lower(): MongoClient.create_player_match_update(
+            win=player_one_score < player_two_score,
+            standing=player_two_standing,
+            broke_streak=player_one_streak > 2,
+        ),
+    }
+    recorded = await MongoClient.record_league_match(
+        object=match_object,
+        player_updates=player_updates,
+    )
+    if not recorded:
+      return (False, "Couldn't record the match, please try again!")
+    old_points = {
+        player: data.get("total_points", 0)
+        for (player, data) in (
+            (player_one.lower(), player_one_data),
+            (player_two.lower(), player_two_data),
+        )
+    }
+    new_points = [
+        points + player_updates[player]["$inc"]["total_points"]
+        for (player, points) in old_points.items()
+    ]
+    await MongoClient.update_league_ranks(
+        league_id=league_id,
+        points_range=(min(old_points.values()), max(new_points)),
+    )
+    # Player 1 broke streak
+    if player_two_streak > 2 and player_one_score > player_two_score:
+      message = (
+          f"{player_one} broke {player_two}'s "
+          f"{player_two_streak} matches win streak!"
+      )
+      await cls.league_broadcast_message(league_id=league_id, message=message)
+    # Player 2 broke streak
+    if player_one_streak > 2 and player_two_score > player_one_score:
+      message = (
+          f"{player_two} broke {player_one}'s "
+          f"{player_one_streak} matches win streak!"
+      )
+      await cls.league_broadcast_message(league_id=league_id, message=message)
+    return (True, "Your match has been recorded!")
 
   @classmethod
   async def league_broadcast_message(
       cls,
       message: str,
       league_id: str,
+      channels: list[str] | None = None,
   ) -> None:
     """Broadcasts a message to all channels who subscribe to the league.
 
+    A single broadcast job is published to the "to-user" queue which delivers
+    the message to every channel.
+
     Args:
       message: text of the message
       league_id: ID of the league
+      channels: subscribed channels, fetched from the league if None
     """
     print(f"Broadcasting a message to league: {league_id}")
-    league = await MongoClient.get_league(league_id=league_id)
-    channels = league.get("subscribed_channels")
-    for channel in channels.keys():
-      await MagicBot.send_message_to_user(
-          chat_id=channel,
-          message=message,
-      )
+    if channels is None:
+      league = await MongoClient.get_league(league_id=league_id)
+      channels = list(league.get("subscribed_channels", {}).keys())
+    if not channels:
+      return
+    broadcast = Utils.generate_outgoing_message(
+        command="broadcast",
+        chat_id="",
+        message_text=message,
+        options={"chat_ids": channels},
+    )
+    await RabbitMQClient.publish(
+        message=broadcast,
+        routing_key=config.TO_USER_QUEUE_NAME,
+    )
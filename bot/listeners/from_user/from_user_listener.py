@@ -1,13 +1,20 @@
 """A module that consumes messages in"to-user" queue in RabbitMQ.
 """
 import asyncio
+import time
 import aio_pika
-import json
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from bot.config import config
 from bot.config.http_client import HttpClient
 from bot.backend.commands import TelegramCommands
 from bot.backend.backend import Backend
+from bot.mongo.mongo_client import MongoClient
+from bot.scryfall.card_database import CardDatabase
+from bot.scryfall.card_pool import CardPool
+from bot.scryfall.price_history import PriceHistory
+from bot.utils.metrics import Metrics
+from bot.utils.queue_message import QueueMessage
+from bot.utils.tracing import Trace
 
 class FromUserListener:
   connection = None
@@ -78,20 +85,43 @@ class FromUserListener:
   async def callback(cls, message: aio_pika.IncomingMessage):
     """Consumes the messages and resolves the corresponding backend commands.
     """
-    async with message.process():
+    # Undecodable messages are rejected before the context would ack them
+    async with message.process(ignore_processed=True):
       async with cls.connection.channel() as channel:
-        decoded_string = message.body.decode("utf-8")
-        data_dict = json.loads(decoded_string)
-        command = data_dict.get("command")
-        chat_id = data_dict.get("chat_id")
-        message_thread_id = data_dict.get("message_thread_id")
-        message = data_dict.get("text")
-        return_message = await TelegramCommands.resolve_command(
-            chat_id=chat_id,
-            message_thread_id=message_thread_id,
-            command=command,
-            message_text=message,
+        try:
+          data = QueueMessage.decode(
+              body=message.body,
+              content_type=message.content_type,
+          )
+        except ValueError as e:
+          queue_name = config.FROM_USER_QUEUE_NAME
+          print(f"Rejected a message in the {queue_name} queue: {e}")
+          await message.reject()
+          return
+        # Unknown commands share a label to keep the metrics bounded
+        command = (
+            data.command if TelegramCommands.registry.has(data.command)
+            else "unknown"
         )
+        trace = Trace.start(context=data.trace, command=command)
+        if data.trace:
+          Trace.observe_queue_wait(
+              context={**data.trace, "command": command},
+              queue=config.FROM_USER_QUEUE_NAME,
+          )
+        start = time.perf_counter()
+        try:
+          return_message = await TelegramCommands.resolve_command(
+              chat_id=data.chat_id,
+              message_thread_id=data.message_thread_id,
+              command=data.command,
+              message_text=data.text,
+          )
+        finally:
+          trace.finish_backend(seconds=time.perf_counter() - start)
+        # Dropped commands have nothing to send back
+        if return_message is None:
+          return
         exchange = await channel.declare_exchange(
             name=config.EXCHANGE_NAME,
             type=aio_pika.ExchangeType.DIRECT,
@@ -99,14 +129,20 @@ class FromUserListener:
         if isinstance(return_message, list):
           for element in return_message:
             await exchange.publish(
-              message=aio_pika.Message(body=element),
+              message=aio_pika.Message(
+                  body=element,
+                  content_type=QueueMessage.content_type(),
+              ),
               routing_key=config.TO_USER_QUEUE_NAME,
             )
             if len(return_message) > 5:
               await asyncio.sleep(1)
         else:
           await exchange.publish(
-              message=aio_pika.Message(body=return_message),
+              message=aio_pika.Message(
+                  body=return_message,
+                  content_type=QueueMessage.content_type(),
+              ),
               routing_key=config.TO_USER_QUEUE_NAME,
           )
 
@@ -115,6 +151,15 @@ class FromUserListener:
     """Starts RabbitMQ listener.
     """
     await HttpClient.init_client()
+    await Metrics.start_server()
+    await MongoClient.create_indexes()
+    await MongoClient.backfill_head_to_head()
+    await MongoClient.backfill_league_ranks()
+    await MongoClient.migrate_league_matches()
+    await MongoClient.migrate_edh_danas()
+    await MongoClient.backfill_deckbox_cards()
+    await CardDatabase.init_database()
+    await CardPool.init_pool()
     # Scheduler
     scheduler = AsyncIOScheduler()
     scheduler.add_job(
@@ -131,6 +176,21 @@ class FromUserListener:
         minute=0,
         timezone="CET",
     )
+    scheduler.add_job(
+        CardDatabase.refresh_scheduled_job,
+        "cron",
+        hour=4,
+        minute=0,
+        timezone="CET",
+    )
+    # Runs after the card database refresh to use its prices
+    scheduler.add_job(
+        PriceHistory.snapshot_scheduled_job,
+        "cron",
+        hour=5,
+        minute=0,
+        timezone="CET",
+    )
     scheduler.add_job(
         Backend.league_new_week_scheduled_job,
         "cron",
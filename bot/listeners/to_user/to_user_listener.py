@@ -1,9 +1,13 @@
 """A module that consumes messages in"to-user" queue in RabbitMQ.
 """
 import asyncio
+import time
 import aio_pika
-import json
 from bot.config import config
+from bot.utils.command_registry import BULK, CommandRegistry
+from bot.utils.metrics import Metrics
+from bot.utils.queue_message import QueueMessage
+from bot.utils.tracing import Trace
 from bot.telegram.bot import MagicBot
 from bot.config.http_client import HttpClient
 
@@ -11,6 +15,11 @@ class ToUserListener:
   connection = None
   channel = None
   monitoring = True
+  registry = CommandRegistry(
+      name="to-user",
+      payload_argument="message",
+      limits=config.COMMAND_PRIORITY_LIMITS,
+  )
 
   @classmethod
   async def connect(cls):
@@ -76,120 +85,282 @@ class ToUserListener:
   async def callback(cls, message: aio_pika.IncomingMessage):
     """Consumes the messages and sends the corresponding messages to user.
     """
-    async with message.process():
+    # Undecodable messages are rejected before the context would ack them
+    async with message.process(ignore_processed=True):
       print(f"Received {message.body} in the {config.TO_USER_QUEUE_NAME} queue")
-      decoded_string = message.body.decode("utf-8")
-      data_dict = json.loads(decoded_string)
-      command = data_dict.get("command", "")
-      bot_type = data_dict.get("bot_type", "")
-      chat_id = data_dict.get("chat_id", "")
-      message = data_dict.get("text", "")
-      options = data_dict.get("options", dict())
-      message_thread_id = data_dict.get("message_thread_id")
+      try:
+        data = QueueMessage.decode(
+            body=message.body,
+            content_type=message.content_type,
+        )
+      except ValueError as e:
+        queue_name = config.TO_USER_QUEUE_NAME
+        print(f"Rejected a message in the {queue_name} queue: {e}")
+        await message.reject()
+        return
       # Telegram commands
-      if bot_type == "telegram":
-        match command:
-          case "text":
-            await MagicBot.send_message_to_user(
-                chat_id=chat_id,
-                message_thread_id=message_thread_id,
-                message=message,
-                disable_preview=options.get("disable_preview", True),
-            )
-          case "image":
-            await MagicBot.send_image_to_user(
-                chat_id=chat_id,
-                message_thread_id=message_thread_id,
-                image_url=message,
-            )
-          case "verification":
-            await MagicBot.send_verification_message_to_user(
-                chat_id=chat_id,
-                message_thread_id=message_thread_id,
-                image_url=message,
-                answers=options.get("answers"),
-                username=options.get("username"),
-                correct=options.get("correct"),
-                user_id=options.get("user_id"),
-            )
-          case "approve":
-            await MagicBot.approve_user(
-                chat_id=chat_id,
-                message_thread_id=message_thread_id,
-                user_id=options.get("user_id"),
-                username=options.get("username"),
-            )
-          case "disapprove":
-            await MagicBot.disapprove_user(
-                chat_id=chat_id,
-                message_thread_id=message_thread_id,
-                user_id=options.get("user_id"),
-                username=options.get("username"),
-            )
-          case "menu":
-            await MagicBot.send_menu_to_user(
-                chat_id=chat_id,
-                message=message,
-                registered=options.get("registered", True),
-                disable_preview=options.get("disable_preview", True),
-            )
-          case "deckboxmenu":
-            await MagicBot.send_deckbox_menu_to_user(
-                chat_id=chat_id,
-                message=message,
-                registered=options.get("registered", True),
-                disable_preview=options.get("disable_preview", True),
-            )
-          case "confluxmenu":
-            await MagicBot.send_conflux_menu_to_user(
-                chat_id=chat_id,
-                message=message,
-                registered=options.get("registered", True),
-                disable_preview=options.get("disable_preview", True),
-            )
-          case "leaguemenu":
-            await MagicBot.send_league_menu_to_user(
-                chat_id=chat_id,
-                message=message,
-                registered=options.get("registered", True),
-                disable_preview=options.get("disable_preview", True),
-            )
-          case "leaguematchconfirm":
-            await MagicBot.send_league_match_confirmation_to_user(
-                chat_id=chat_id,
-                message=message,
-                disable_preview=options.get("disable_preview", True),
-            )
-          case "poll":
-            await MagicBot.send_poll_to_channel(
-                chat_id=chat_id,
-                message_thread_id=message_thread_id,
-                message=message,
-                answers=options,
-            )
-          case "forward":
-            await MagicBot.forward_message_to_chat(
-                from_chat_id=options.get("chat_id", ""),
-                to_chat_id=chat_id,
-                message_thread_id=message_thread_id,
-                message_id=options.get("message_id", ""),
-            )
-          case "quiz":
-            card_name = options.get("card_name", "")
-            art = options.get("art", "")
-            await MagicBot.send_quiz_image_to_chat(
-                chat_id=chat_id,
-                card_name=card_name,
-                image_url=art,
-            )
-          case "void":
-            pass
+      if data.bot_type != "telegram" or not cls.registry.has(data.command):
+        return
+      if data.trace:
+        Trace.observe_queue_wait(
+            context=data.trace,
+            queue=config.TO_USER_QUEUE_NAME,
+        )
+      start = time.perf_counter()
+      await cls.registry.dispatch(
+          owner=cls,
+          name=data.command,
+          chat_id=data.chat_id,
+          message=data.text,
+          options=data.options,
+          message_thread_id=data.message_thread_id,
+      )
+      # The handlers return once Telegram acknowledged the message
+      if data.trace:
+        Trace.finish_delivery(
+            context=data.trace,
+            seconds=time.perf_counter() - start,
+        )
+
+  @classmethod
+  @registry.command("text")
+  async def send_text(
+      cls,
+      chat_id: str,
+      message: str,
+      options: dict,
+      message_thread_id: str | None,
+  ) -> None:
+    """Sends a text message to the chat."""
+    await MagicBot.send_message_to_user(
+        chat_id=chat_id,
+        message_thread_id=message_thread_id,
+        message=message,
+        disable_preview=options.get("disable_preview", True),
+    )
+
+  @classmethod
+  @registry.command("broadcast", priority=BULK)
+  async def send_broadcast(cls, message: str, options: dict) -> None:
+    """Sends a text message to several chats."""
+    await MagicBot.send_broadcast_message(
+        chat_ids=options.get("chat_ids", []),
+        message=message,
+        disable_preview=options.get("disable_preview", True),
+    )
+
+  @classmethod
+  @registry.command("image")
+  async def send_image(
+      cls,
+      chat_id: str,
+      message: str,
+      message_thread_id: str | None,
+  ) -> None:
+    """Sends an image to the chat."""
+    await MagicBot.send_image_to_user(
+        chat_id=chat_id,
+        message_thread_id=message_thread_id,
+        image_url=message,
+    )
+
+  @classmethod
+  @registry.command("verification")
+  async def send_verification(
+      cls,
+      chat_id: str,
+      message: str,
+      options: dict,
+      message_thread_id: str | None,
+  ) -> None:
+    """Sends a verification question to a new user."""
+    await MagicBot.send_verification_message_to_user(
+        chat_id=chat_id,
+        message_thread_id=message_thread_id,
+        image_url=message,
+        answers=options.get("answers"),
+        username=options.get("username"),
+        correct=options.get("correct"),
+        user_id=options.get("user_id"),
+    )
+
+  @classmethod
+  @registry.command("approve", payload=None)
+  async def approve_user(
+      cls,
+      chat_id: str,
+      options: dict,
+      message_thread_id: str | None,
+  ) -> None:
+    """Approves a verified user."""
+    await MagicBot.approve_user(
+        chat_id=chat_id,
+        message_thread_id=message_thread_id,
+        user_id=options.get("user_id"),
+        username=options.get("username"),
+    )
+
+  @classmethod
+  @registry.command("disapprove", payload=None)
+  async def disapprove_user(
+      cls,
+      chat_id: str,
+      options: dict,
+      message_thread_id: str | None,
+  ) -> None:
+    """Disapproves a user that failed the verification."""
+    await MagicBot.disapprove_user(
+        chat_id=chat_id,
+        message_thread_id=message_thread_id,
+        user_id=options.get("user_id"),
+        username=options.get("username"),
+    )
+
+  @classmethod
+  @registry.command("menu")
+  async def send_menu(cls, chat_id: str, message: str, options: dict) -> None:
+    """Sends the main menu to the user."""
+    await MagicBot.send_menu_to_user(
+        chat_id=chat_id,
+        message=message,
+        registered=options.get("registered", True),
+        disable_preview=options.get("disable_preview", True),
+    )
+
+  @classmethod
+  @registry.command("deckboxmenu")
+  async def send_deckbox_menu(
+      cls,
+      chat_id: str,
+      message: str,
+      options: dict,
+  ) -> None:
+    """Sends the deckbox menu to the user."""
+    await MagicBot.send_deckbox_menu_to_user(
+        chat_id=chat_id,
+        message=message,
+        registered=options.get("registered", True),
+        disable_preview=options.get("disable_preview", True),
+    )
+
+  @classmethod
+  @registry.command("confluxmenu")
+  async def send_conflux_menu(
+      cls,
+      chat_id: str,
+      message: str,
+      options: dict,
+  ) -> None:
+    """Sends the conflux menu to the user."""
+    await MagicBot.send_conflux_menu_to_user(
+        chat_id=chat_id,
+        message=message,
+        registered=options.get("registered", True),
+        disable_preview=options.get("disable_preview", True),
+    )
+
+  @classmethod
+  @registry.command("leaguemenu")
+  async def send_league_menu(
+      cls,
+      chat_id: str,
+      message: str,
+      options: dict,
+  ) -> None:
+    """Sends the league menu to the user."""
+    await MagicBot.send_league_menu_to_user(
+        chat_id=chat_id,
+        message=message,
+        registered=options.get("registered", True),
+        disable_preview=options.get("disable_preview", True),
+    )
+
+  @classmethod
+  @registry.command("leaguematches")
+  async def send_league_matches(
+      cls,
+      chat_id: str,
+      message: str,
+      options: dict,
+  ) -> None:
+    """Sends a page of league matches to the user."""
+    await MagicBot.send_league_matches_to_user(
+        chat_id=chat_id,
+        message=message,
+        league_id=options.get("league_id"),
+        page=options.get("page", 1),
+        pages=options.get("pages", 1),
+    )
+
+  @classmethod
+  @registry.command("leaguematchconfirm")
+  async def send_league_match_confirmation(
+      cls,
+      chat_id: str,
+      message: str,
+      options: dict,
+  ) -> None:
+    """Sends a league match confirmation to the user."""
+    await MagicBot.send_league_match_confirmation_to_user(
+        chat_id=chat_id,
+        message=message,
+        disable_preview=options.get("disable_preview", True),
+    )
+
+  @classmethod
+  @registry.command("poll")
+  async def send_poll(
+      cls,
+      chat_id: str,
+      message: str,
+      options: dict,
+      message_thread_id: str | None,
+  ) -> None:
+    """Sends a poll to the channel."""
+    await MagicBot.send_poll_to_channel(
+        chat_id=chat_id,
+        message_thread_id=message_thread_id,
+        message=message,
+        answers=options,
+    )
+
+  @classmethod
+  @registry.command("forward", payload=None)
+  async def forward_message(
+      cls,
+      chat_id: str,
+      options: dict,
+      message_thread_id: str | None,
+  ) -> None:
+    """Forwards a message to the chat."""
+    await MagicBot.forward_message_to_chat(
+        from_chat_id=options.get("chat_id", ""),
+        to_chat_id=chat_id,
+        message_thread_id=message_thread_id,
+        message_id=options.get("message_id", ""),
+    )
+
+  @classmethod
+  @registry.command("quiz", payload=None)
+  async def send_quiz(cls, chat_id: str, options: dict) -> None:
+    """Sends a quiz image to the chat."""
+    await MagicBot.send_quiz_image_to_chat(
+        chat_id=chat_id,
+        card_name=options.get("card_name", ""),
+        image_url=options.get("art", ""),
+    )
+
+  @classmethod
+  @registry.command("void", payload=None)
+  async def skip_message(cls) -> None:
+    """Ignores the message."""
 
   @classmethod
   async def run_listener(cls):
     """Starts RabbitMQ listener.
     """
     await HttpClient.init_client()
+    await Metrics.start_server()
     connection = await cls.connect()
     monitor_connection = asyncio.create_task(cls.monitor_connection())
     try:
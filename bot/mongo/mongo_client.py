@@ -1,16 +1,31 @@
 """Module for working with Mongo DB.
 """
 import motor.motor_asyncio
+import re
 from bot.config import config
+from bot.mongo.mongo_monitoring import MongoCommandListener, monitor_methods
 from bson import ObjectId
-from datetime import datetime
-
+from datetime import datetime, timedelta, timezone
+from pymongo import (
+    ASCENDING,
+    DESCENDING,
+    DeleteOne,
+    ReturnDocument,
+    UpdateOne,
+)
+from pymongo.errors import BulkWriteError, PyMongoError
+
+@monitor_methods
 class MongoClient:
-  mongo_client = motor.motor_asyncio.AsyncIOMotorClient(config.MONGO_CONNECTION)
+  mongo_client = motor.motor_asyncio.AsyncIOMotorClient(
+      config.MONGO_CONNECTION,
+      event_listeners=[MongoCommandListener()],
+  )
   db = mongo_client.mtgbot
   users_colletion = db.users
   deckbox_tradelist_colletion = db.deckbox_tradelists
   deckbox_wishlist_collection = db.deckbox_wishlists
+  deckbox_cards_collection = db.deckbox_cards
   edh_danas_collection = db.edh_danas
   quiz_collection = db.quiz
   status_collection = db.status
@@ -19,6 +34,65 @@ class MongoClient:
   league_invite_collection = db.league_invites
   league_players_collection = db.league_players
   league_matches_collection = db.league_matches
+  league_head_to_head_collection = db.league_head_to_head
+  scryfall_cache_collection = db.scryfall_cache
+  scryfall_card_pool_collection = db.scryfall_card_pool
+  media_cache_collection = db.media_cache
+  card_prices_collection = db.card_prices
+  migrations_collection = db.migrations
+
+  @classmethod
+  async def create_indexes(cls) -> None:
+    """Creates the indexes used by the bot queries if they don't exist yet.
+    """
+    await cls.league_players_collection.create_index(
+        [("league_id", ASCENDING), ("total_points", DESCENDING)],
+    )
+    await cls.league_matches_collection.create_index(
+        [
+            ("league_id", ASCENDING),
+            ("players", ASCENDING),
+            ("played_at", ASCENDING),
+        ],
+    )
+    await cls.league_invite_collection.create_index(
+        "invite_code",
+        unique=True,
+    )
+    await cls.league_head_to_head_collection.create_index(
+        [
+            ("league_id", ASCENDING),
+            ("player", ASCENDING),
+            ("opponent", ASCENDING),
+        ],
+        unique=True,
+    )
+    if "card_prices" not in await cls.db.list_collection_names():
+      await cls.db.create_collection(
+          "card_prices",
+          timeseries={
+              "timeField": "snapshot_at",
+              "metaField": "card",
+              "granularity": "hours",
+          },
+          expireAfterSeconds=config.PRICE_HISTORY_DAYS * 24 * 60 * 60,
+      )
+    await cls.card_prices_collection.create_index(
+        [("card", ASCENDING), ("snapshot_at", DESCENDING)],
+    )
+    if config.SCRYFALL_CACHE_PERSISTENT:
+      await cls.scryfall_cache_collection.create_index(
+          "expires_at",
+          expireAfterSeconds=0,
+      )
+    if config.DECKBOX_CARDS_NORMALISED:
+      await cls.deckbox_cards_collection.create_index(
+          [("deckbox_id", ASCENDING), ("card_name", ASCENDING)],
+          unique=True,
+      )
+      await cls.deckbox_cards_collection.create_index(
+          [("card_name", ASCENDING), ("deckbox_id", ASCENDING)],
+      )
 
   @classmethod
   async def get_user_data(
@@ -53,6 +127,28 @@ class MongoClient:
       )
     return user
 
+  @classmethod
+  async def get_users_by_deckbox_names(
+      cls,
+      deckbox_names: list[str],
+  ) -> dict:
+    """Fetches all users owning any of the given deckboxes in one query.
+
+    Args:
+      deckbox_names: a list of deckbox account names
+    Returns:
+      A dict with lowercase deckbox names as keys and user details as values
+    """
+    lower_names = list({name.lower() for name in deckbox_names if name})
+    if not lower_names:
+      return {}
+    query = {"deckbox_name": {"$in": lower_names}}
+    cursor = cls.users_colletion.find(query)
+    results = {}
+    async for user in cursor:
+      results[user.get("deckbox_name")] = user
+    return results
+
   @classmethod
   async def get_deckbox_data(
       cls,
@@ -280,6 +376,11 @@ class MongoClient:
       result = await cls.deckbox_tradelist_colletion.insert_one(object)
     if wishlist:
       result = await cls.deckbox_wishlist_collection.insert_one(object)
+    if result and config.DECKBOX_CARDS_NORMALISED:
+      await cls.sync_deckbox_cards(
+          deckbox_id=object.get("deckbox_id"),
+          cards=object.get("cards", {}),
+      )
     return result.acknowledged if result else result
 
   @classmethod
@@ -340,67 +441,75 @@ class MongoClient:
       cls,
       poll_id: str,
   ) -> list[tuple[str]]:
-    """Tries to fetch a store with a given name from the "stores" collection and
-    checks if the store exists.
+    """Finds registered voters that need to be alerted about a venue reaching
+    the minimum amount of players and marks them as alerted.
 
     Args:
       poll_id: poll ID to check
     Returns:
       A list of tuples with users to alert (chat_id, message)
     """
-    people_to_alert = []
-    result = {}
-    result = await cls.edh_danas_collection.find_one(
-        {"poll_id": poll_id.lower()}
+    min_players = {"$ifNull": ["$min_players", config.EDH_DANAS_MIN_PLAYERS]}
+    pipeline = [
+        {"$match": {"poll_id": poll_id}},
+        {"$unwind": "$venues"},
+        {"$project": {
+            "venue": "$venues",
+            "min_players": min_players,
+            "pending": {"$cond": [
+                {"$gte": [{"$size": "$venues.voters"}, min_players]},
+                {"$setDifference": ["$venues.voters", "$venues.alerted"]},
+                [],
+            ]},
+        }},
+        {"$unwind": "$pending"},
+        # Only registered users can be alerted
+        {"$lookup": {
+            "from": cls.users_colletion.name,
+            "localField": "pending",
+            "foreignField": "chat_id",
+            "as": "user",
+        }},
+        {"$match": {"user": {"$ne": []}}},
+        {"$group": {
+            "_id": "$venue.key",
+            "name": {"$first": "$venue.name"},
+            "min_players": {"$first": "$min_players"},
+            "voters": {"$addToSet": "$pending"},
+        }},
+    ]
+    cursor = cls.edh_danas_collection.aggregate(pipeline)
+    to_alert = [venue async for venue in cursor]
+    if not to_alert:
+      return []
+    # Mark everyone as alerted in one update and use the previous state of the
+    # document so concurrent votes don't alert the same person twice
+    update = {}
+    array_filters = []
+    for index, venue in enumerate(to_alert):
+      update[f"venues.$[v{index}].alerted"] = {"$each": venue.get("voters")}
+      array_filters.append({f"v{index}.key": venue.get("_id")})
+    previous = await cls.edh_danas_collection.find_one_and_update(
+        {"poll_id": poll_id},
+        {"$addToSet": update},
+        array_filters=array_filters,
+        return_document=ReturnDocument.BEFORE,
     )
-    ravnica_msg = "At least 4 players have voted for EDH in Ravnica!"
-    ug_msg = "At least 4 players have voted for EDH in Underground!"
-    da_msg = "At least 4 players have voted for EDH in Dice Arena!"
-    nbg_msg = "At least 4 players have voted for EDH in 3D/Groot!"
-    ravnica_voters = result.get("ravnica_yes_voters", [])
-    ravnica_alerted = result.get("ravnica_alerted", [])
-    underground_voters = result.get("underground_yes_voters", [])
-    underground_alerted = result.get("underground_alerted", [])
-    dice_arena_voters = result.get("dice_arena_yes_voters", [])
-    dice_arena_alerted = result.get("dice_arena_alerted", [])
-    nbg_voters = result.get("nbg_yes_voters", [])
-    nbg_alerted = result.get("nbg_alerted", [])
-    if len(ravnica_voters) > 3:
-      for voter in ravnica_voters:
-        is_registered = await cls.check_if_user_exists(chat_id=voter)
-        if is_registered and not voter in ravnica_alerted:
-          people_to_alert.append((voter, ravnica_msg))
-          await cls.edh_danas_collection.update_one(
-              {"poll_id": poll_id},
-              {"$addToSet": {"ravnica_alerted": voter},}
-          )
-    if len(underground_voters) > 3:
-      for voter in underground_voters:
-        is_registered = await cls.check_if_user_exists(chat_id=voter)
-        if is_registered and not voter in underground_alerted:
-          people_to_alert.append((voter, ug_msg))
-          await cls.edh_danas_collection.update_one(
-              {"poll_id": poll_id},
-              {"$addToSet": {"underground_alerted": voter},}
-          )
-    if len(dice_arena_voters) > 3:
-      for voter in dice_arena_voters:
-        is_registered = await cls.check_if_user_exists(chat_id=voter)
-        if is_registered and not voter in dice_arena_alerted:
-          people_to_alert.append((voter, da_msg))
-          await cls.edh_danas_collection.update_one(
-              {"poll_id": poll_id},
-              {"$addToSet": {"dice_arena_alerted": voter},}
-          )
-    if len(nbg_voters) > 3:
-      for voter in nbg_voters:
-        is_registered = await cls.check_if_user_exists(chat_id=voter)
-        if is_registered and not voter in nbg_alerted:
-          people_to_alert.append((voter, nbg_msg))
-          await cls.edh_danas_collection.update_one(
-              {"poll_id": poll_id},
-              {"$addToSet": {"nbg_alerted": voter},}
-          )
+    if not previous:
+      return []
+    already_alerted = {
+        venue.get("key"): venue.get("alerted", [])
+        for venue in previous.get("venues", [])
+    }
+    people_to_alert = []
+    for venue in to_alert:
+      message = (
+          f"At least {venue.get('min_players')} players have voted for EDH "
+          f"in {venue.get('name')}!"
+      )
+      for voter in venue.get("voters"):
+        if voter not in already_alerted.get(venue.get("_id"), []):
+          people_to_alert.append((voter, message))
     return people_to_alert
 
   @classmethod
@@ -409,126 +518,96 @@ class MongoClient:
       poll_id: str,
       user_id : str,
       votes: list[int],
-  ) -> None:
+  ) -> dict | None:
     """Updates the EDHdanas poll when a user voted.
 
+    All the previous votes of the user are replaced with the new ones in a
+    single atomic update.
+
     Args:
       poll_id: ID of the poll to update
       user_id: chat_id of the user
       votes: a list of user's vote choices
+    Returns:
+      A dict with the updated poll or None if the poll doesn't exist
     """
-    result = await cls.edh_danas_collection.find_one(
-        {"poll_id": poll_id}
+    min_players = {"$ifNull": ["$min_players", config.EDH_DANAS_MIN_PLAYERS]}
+    pipeline = [
+        {"$set": {
+            "all_voters": {
+                "$setUnion": [{"$ifNull": ["$all_voters", []]}, [user_id]],
+            },
+            "venues": {"$map": {
+                "input": "$venues",
+                "as": "venue",
+                "in": {"$mergeObjects": ["$$venue", {"voters": {"$setUnion": [
+                    {"$setDifference": ["$$venue.voters", [user_id]]},
+                    {"$cond": [
+                        {"$in": ["$$venue.option", votes]}, [user_id], [],
+                    ]},
+                ]}}]},
+            }},
+        }},
+        # After all votes were assigned check if any of them brought the total
+        # count to the minimum, meaning user will see it after they voted
+        # and we don't need to alert them and so we add them to alerted players
+        {"$set": {
+            "venues": {"$map": {
+                "input": "$venues",
+                "as": "venue",
+                "in": {"$mergeObjects": ["$$venue", {"alerted": {"$cond": [
+                    {"$and": [
+                        {"$in": [user_id, "$$venue.voters"]},
+                        {"$gte": [{"$size": "$$venue.voters"}, min_players]},
+                    ]},
+                    {"$setUnion": ["$$venue.alerted", [user_id]]},
+                    "$$venue.alerted",
+                ]}}]},
+            }},
+        }},
+    ]
+    # Polls created before venues were introduced are converted by
+    # migrate_edh_danas at startup
+    result = await cls.edh_danas_collection.find_one_and_update(
+        {"poll_id": poll_id, "venues": {"$exists": True}},
+        pipeline,
+        return_document=ReturnDocument.AFTER,
     )
-    all_voters = result.get("all_voters", [])
-    # Check if the voting user has already voted
-    if user_id in all_voters:
-      # Remove all the old results first
-      await cls.edh_danas_collection.update_one(
-          {"poll_id": poll_id},
-          {"$pull": {"all_voters": user_id},}
-      )
-      ravnica_voters = result.get("ravnica_yes_voters", [])
-      underground_voters = result.get("underground_yes_voters", [])
-      dice_arena_voters = result.get("dice_arena_yes_voters", [])
-      nbg_voters = result.get("nbg_yes_voters", [])
-      if user_id in ravnica_voters:
-        await cls.edh_danas_collection.update_one(
-            {"poll_id": poll_id},
-            {
-              "$pull": {"ravnica_yes_voters": user_id},
-            }
-        )
-      if user_id in underground_voters:
-        await cls.edh_danas_collection.update_one(
-            {"poll_id": poll_id},
-            {
-              "$pull": {"underground_yes_voters": user_id},
-            }
-        )
-      if user_id in dice_arena_voters:
-        await cls.edh_danas_collection.update_one(
-            {"poll_id": poll_id},
-            {
-              "$pull": {"dice_arena_yes_voters": user_id},
-            }
-        )
-      if user_id in nbg_voters:
-        await cls.edh_danas_collection.update_one(
-            {"poll_id": poll_id},
-            {
-              "$pull": {"nbg_yes_voters": user_id},
-            }
-        )
-    # If user votes for the first time
-    await cls.edh_danas_collection.update_one(
-          {"poll_id": poll_id},
-          {
-            "$addToSet": {"all_voters": user_id},
-          }
-      )
-    if 0 in votes:
-      # If they voted for Ravnica
-      await cls.edh_danas_collection.update_one(
-          {"poll_id": poll_id},
-          {
-            "$addToSet": {"ravnica_yes_voters": user_id},
-          }
-      )
-    if 1 in votes:
-      # If they voted for Underground
-      await cls.edh_danas_collection.update_one(
-          {"poll_id": poll_id},
-          {
-            "$addToSet": {"underground_yes_voters": user_id},
-          }
-      )
-    if 2 in votes:
-      # If they voted for Dice Arena
-      await cls.edh_danas_collection.update_one(
-          {"poll_id": poll_id},
-          {
-            "$addToSet": {"dice_arena_yes_voters": user_id},
-          }
-      )
-    if 3 in votes:
-      # If they voted for NBG
-      await cls.edh_danas_collection.update_one(
-          {"poll_id": poll_id},
-          {
-            "$addToSet": {"nbg_yes_voters": user_id},
-          }
-      )
-    # After all votes were assigned check if any of them brought the total
-    # count to 4, meaning user will see the 4+ players after they voted
-    # and we don't need to alert them and so we add them to alerted players
-    new_result = await cls.edh_danas_collection.find_one(
-        {"poll_id": poll_id}
+    return result
+
+  @classmethod
+  async def migrate_edh_danas(cls) -> None:
+    """Moves the votes of the polls created before venues were introduced
+    from the per-venue fields into the venues list.
+
+    The old polls had the configured venues as their first answers.
+    """
+    venues = []
+    legacy_fields = []
+    for (index, venue) in enumerate(config.EDH_DANAS_VENUES):
+      key = venue.get("key")
+      venues.append({
+          "key": key,
+          "name": venue.get("name"),
+          "option": index,
+          "voters": {"$ifNull": [f"${key}_yes_voters", []]},
+          "alerted": {"$ifNull": [f"${key}_alerted", []]},
+      })
+      legacy_fields += [f"{key}_yes_voters", f"{key}_alerted"]
+    result = await cls.edh_danas_collection.update_many(
+        {"venues": {"$exists": False}},
+        [
+            {"$set": {
+                "venues": venues,
+                "min_players": {"$ifNull": [
+                    "$min_players", config.EDH_DANAS_MIN_PLAYERS,
+                ]},
+            }},
+            {"$unset": legacy_fields},
+        ],
     )
-    new_ravnica_voters = new_result.get("ravnica_yes_voters", [])
-    if len(new_ravnica_voters) > 3:
-      await cls.edh_danas_collection.update_one(
-          {"poll_id": poll_id},
-          {"$addToSet": {"ravnica_alerted": user_id},}
-      )
-    new_underground_voters = new_result.get("underground_yes_voters", [])
-    if len(new_underground_voters) > 3:
-      await cls.edh_danas_collection.update_one(
-          {"poll_id": poll_id},
-          {"$addToSet": {"underground_alerted": user_id},}
-      )
-    new_dice_arena_voters = new_result.get("dice_arena_yes_voters", [])
-    if len(new_dice_arena_voters) > 3:
-      await cls.edh_danas_collection.update_one(
-          {"poll_id": poll_id},
-          {"$addToSet": {"dice_arena_alerted": user_id},}
-      )
-    new_nbg_voters = new_result.get("nbg_yes_voters", [])
-    if len(new_nbg_voters) > 3:
-      await cls.edh_danas_collection.update_one(
-          {"poll_id": poll_id},
-          {"$addToSet": {"nbg_alerted": user_id},}
-      )
+    if result.modified_count:
+      print(f"Migrated {result.modified_count} EDHdanas polls to venues")
 
   @classmethod
   async def delete_edh_danas(
@@ -585,6 +664,11 @@ class MongoClient:
     if not result:
       return (False, "Something went wrong! Please try again!")
     else:
+      if config.DECKBOX_CARDS_NORMALISED and "cards" in object:
+        await cls.sync_deckbox_cards(
+            deckbox_id=deckbox,
+            cards=object.get("cards"),
+        )
       if result.modified_count > 0:
         return (True, f"Tradelist updated successfully.")
       else:
@@ -882,6 +966,385 @@ class MongoClient:
       card_dict = result.get("cards", {})
     return card_dict
 
+  @classmethod
+  async def sync_deckbox_cards(
+      cls,
+      deckbox_id: str,
+      cards: dict,
+  ) -> None:
+    """Brings the normalised cards of a deckbox in line with its cached cards
+    by writing only the changed rows.
+
+    Args:
+      deckbox_id: id of the deckbox
+      cards: a dict with card names as keys and counts as values
+    """
+    deckbox_id = deckbox_id.lower()
+    existing = {}
+    cursor = cls.deckbox_cards_collection.find(
+        {"deckbox_id": deckbox_id},
+        {"_id": 0, "card_name": 1, "count": 1},
+    )
+    async for row in cursor:
+      existing[row.get("card_name")] = row.get("count")
+    operations = []
+    for card_name, count in cards.items():
+      if existing.get(card_name) != count:
+        operations.append(UpdateOne(
+            {"deckbox_id": deckbox_id, "card_name": card_name},
+            {"$set": {"count": count}},
+            upsert=True,
+        ))
+    for card_name in existing.keys() - cards.keys():
+      operations.append(DeleteOne(
+          {"deckbox_id": deckbox_id, "card_name": card_name},
+      ))
+    if operations:
+      await cls.deckbox_cards_collection.bulk_write(operations, ordered=False)
+
+  @classmethod
+  async def backfill_deckbox_cards(cls) -> None:
+    """Mirrors the cards of the deckboxes that were cached before the
+    normalised cards were enabled.
+    """
+    if not config.DECKBOX_CARDS_NORMALISED:
+      return
+    mirrored = set(await cls.deckbox_cards_collection.distinct("deckbox_id"))
+    total = 0
+    for collection in (
+        cls.deckbox_tradelist_colletion,
+        cls.deckbox_wishlist_collection,
+    ):
+      cursor = collection.find(
+          {"deckbox_id": {"$nin": list(mirrored)}},
+          {"_id": 0, "deckbox_id": 1, "cards": 1},
+      )
+      async for deckbox in cursor:
+        if not deckbox.get("deckbox_id") or not deckbox.get("cards"):
+          continue
+        await cls.sync_deckbox_cards(
+            deckbox_id=deckbox.get("deckbox_id"),
+            cards=deckbox.get("cards"),
+        )
+        total += 1
+    if total:
+      print(f"Mirrored the cards of {total} deckboxes")
+
+  @classmethod
+  async def find_cards_in_deckboxes(
+      cls,
+      deckbox_ids: list[str],
+      card_names: list[str],
+      exact: bool = True,
+  ) -> dict:
+    """Looks for cards in several deckboxes using the normalised cards.
+
+    Args:
+      deckbox_ids: ids of the deckboxes to search in
+      card_names: lowercase names of the cards to look for
+      exact: set to False to match cards containing any of the names
+    Returns:
+      A dict with deckbox ids as keys and lists of (card, count) as values
+    """
+    found = {deckbox_id: [] for deckbox_id in deckbox_ids}
+    if not deckbox_ids or not card_names:
+      return found
+    if exact:
+      names_filter = card_names
+    else:
+      # Substring patterns scan the cards of the deckboxes found by the
+      # deckbox_id index
+      names_filter = [re.compile(re.escape(name)) for name in card_names]
+    cursor = cls.deckbox_cards_collection.find(
+        {
+            "deckbox_id": {"$in": [db_id.lower() for db_id in deckbox_ids]},
+            "card_name": {"$in": names_filter},
+        },
+        {"_id": 0, "deckbox_id": 1, "card_name": 1, "count": 1},
+    ).sort([("deckbox_id", ASCENDING), ("card_name", ASCENDING)])
+    async for row in cursor:
+      found.setdefault(row.get("deckbox_id"), []).append(
+          (row.get("card_name"), row.get("count"))
+      )
+    return found
+
+  @classmethod
+  async def get_scryfall_cache(
+      cls,
+      key: str,
+  ) -> dict | None:
+    """Fetches a cached scryfall response.
+
+    Args:
+      key: normalised card query
+    Returns:
+      A dict with the response, its timestamp and TTL or None if it's missing
+    """
+    result = await cls.scryfall_cache_collection.find_one({"_id": key})
+    return result
+
+  @classmethod
+  async def set_scryfall_cache(
+      cls,
+      key: str,
+      response: dict,
+      stored_at: float,
+      ttl: float,
+  ) -> None:
+    """Stores a scryfall response until its TTL runs out.
+
+    Args:
+      key: normalised card query
+      response: scryfall response
+      stored_at: timestamp of the response
+      ttl: time in seconds the response is valid for
+    """
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+    await cls.scryfall_cache_collection.replace_one(
+        {"_id": key},
+        {
+            "response": response,
+            "stored_at": stored_at,
+            "ttl": ttl,
+            "expires_at": expires_at,
+        },
+        upsert=True,
+    )
+
+  @classmethod
+  async def get_card_pool(cls) -> list[dict]:
+    """Fetches all the cards saved in the random card pool.
+
+    Returns:
+      A list of dicts with card data
+    """
+    cursor = cls.scryfall_card_pool_collection.find({})
+    result = await cursor.to_list(length=None)
+    return result
+
+  @classmethod
+  async def add_card_pool_entry(
+      cls,
+      object: dict,
+  ) -> ObjectId:
+    """Adds a card to the random card pool.
+
+    Args:
+      object: a dictionary with card data to be added
+    Returns:
+      An ObjectId of the added card
+    """
+    result = await cls.scryfall_card_pool_collection.insert_one(object)
+    return result.inserted_id
+
+  @classmethod
+  async def delete_card_pool_entry(
+      cls,
+      entry_id: ObjectId,
+  ) -> bool:
+    """Deletes a card taken from the random card pool.
+
+    Args:
+      entry_id: ObjectId of the card
+    Returns:
+      A bool with status of the operation
+    """
+    result = await cls.scryfall_card_pool_collection.delete_one(
+        {"_id": entry_id}
+    )
+    return result.deleted_count > 0
+
+  @classmethod
+  async def get_tracked_card_names(cls) -> list[str]:
+    """Fetches the names of all the cards on cached tradelists and wishlists.
+
+    Returns:
+      A list of lowercase card names
+    """
+    card_names_stages = [
+        {"$project": {
+            "card_name": {
+                "$map": {
+                    "input": {"$objectToArray": "$cards"},
+                    "in": "$$this.k",
+                },
+            },
+        }},
+        {"$unwind": "$card_name"},
+    ]
+    pipeline = [
+        *card_names_stages,
+        {"$unionWith": {
+            "coll": cls.deckbox_wishlist_collection.name,
+            "pipeline": card_names_stages,
+        }},
+        {"$group": {"_id": "$card_name"}},
+    ]
+    cursor = cls.deckbox_tradelist_colletion.aggregate(pipeline)
+    return [row["_id"] async for row in cursor]
+
+  @classmethod
+  async def add_card_price_snapshots(
+      cls,
+      objects: list[dict],
+  ) -> None:
+    """Adds card prices to the "card_prices" time series collection.
+
+    Args:
+      objects: a list of dicts with card prices
+    """
+    await cls.card_prices_collection.insert_many(objects, ordered=False)
+
+  @classmethod
+  async def get_card_price_history(
+      cls,
+      card: str,
+      since: datetime,
+  ) -> list[dict]:
+    """Fetches the price snapshots of a card.
+
+    Args:
+      card: normalised name of the card
+      since: date of the oldest snapshot to fetch
+    Returns:
+      A list of dicts with prices sorted from the oldest to the newest
+    """
+    cursor = cls.card_prices_collection.find(
+        {"card": card, "snapshot_at": {"$gte": since}},
+        {"_id": 0},
+    ).sort("snapshot_at", ASCENDING)
+    result = await cursor.to_list(length=None)
+    return result
+
+  @classmethod
+  async def get_latest_card_prices(
+      cls,
+      cards: list[str],
+  ) -> dict:
+    """Fetches the latest price snapshot of every card.
+
+    Args:
+      cards: normalised names of the cards
+    Returns:
+      A dict with card names as keys and regular USD prices as values
+    """
+    pipeline = [
+        {"$match": {"card": {"$in": cards}}},
+        {"$sort": {"card": 1, "snapshot_at": -1}},
+        {"$group": {"_id": "$card", "usd": {"$first": "$usd"}}},
+    ]
+    cursor = cls.card_prices_collection.aggregate(pipeline)
+    return {row["_id"]: row["usd"] async for row in cursor}
+
+  @classmethod
+  async def get_deckbox_card_prices(
+      cls,
+      deckbox_ids: list[str],
+  ) -> dict:
+    """Fetches the card prices saved by the valuation of tradelists.
+
+    Args:
+      deckbox_ids: ids of the tradelists
+    Returns:
+      A dict with deckbox ids as keys and dicts of card prices as values
+    """
+    lower_ids = [deckbox_id.lower() for deckbox_id in deckbox_ids]
+    cursor = cls.deckbox_tradelist_colletion.find(
+        {"deckbox_id": {"$in": lower_ids}},
+        {"_id": 0, "deckbox_id": 1, "card_prices": 1},
+    )
+    return {
+        document.get("deckbox_id"): document.get("card_prices", {})
+        async for document in cursor
+    }
+
+  @classmethod
+  async def get_deckbox_values(
+      cls,
+      account_name: str,
+  ) -> dict:
+    """Fetches the total values of the tradelist and the wishlist of a
+    deckbox account.
+
+    Args:
+      account_name: name of the deckbox account
+    Returns:
+      A dict with "tradelist" and "wishlist" keys and dicts with the total
+      value, the amount of priced cards and the amount of cards as values,
+      None for lists that aren't cached
+    """
+    projection = {
+        "_id": 0,
+        "total_value": 1,
+        "priced_cards": 1,
+        "card_count": {
+            "$size": {"$objectToArray": {"$ifNull": ["$cards", {}]}},
+        },
+    }
+    tradelist = await cls.deckbox_tradelist_colletion.find_one(
+        {"account_name": account_name.lower()},
+        projection,
+    )
+    wishlist = await cls.deckbox_wishlist_collection.find_one(
+        {"account_name": account_name.lower()},
+        projection,
+    )
+    return {"tradelist": tradelist, "wishlist": wishlist}
+
+  @classmethod
+  async def get_media_file_id(
+      cls,
+      url: str,
+  ) -> str | None:
+    """Fetches the telegram file ID of an image and counts the send.
+
+    Args:
+      url: url of the image
+    Returns:
+      A string with the file ID or None if the image wasn't sent before
+    """
+    result = await cls.media_cache_collection.find_one_and_update(
+        {"_id": url},
+        {"$inc": {"sends": 1}},
+        projection={"file_id": 1},
+    )
+    if result:
+      return result.get("file_id")
+    return None
+
+  @classmethod
+  async def set_media_file_id(
+      cls,
+      url: str,
+      file_id: str,
+  ) -> None:
+    """Stores the telegram file ID of an image.
+
+    Args:
+      url: url of the image
+      file_id: telegram file ID of the sent image
+    """
+    await cls.media_cache_collection.update_one(
+        {"_id": url},
+        {
+            "$set": {"file_id": file_id, "updated_at": datetime.now()},
+            "$inc": {"sends": 1},
+        },
+        upsert=True,
+    )
+
+  @classmethod
+  async def delete_media_file_id(
+      cls,
+      url: str,
+  ) -> None:
+    """Deletes the telegram file ID of an image.
+
+    Args:
+      url: url of the image
+    """
+    await cls.media_cache_collection.delete_one({"_id": url})
+
   @classmethod
   async def add_status(
       cls,
@@ -1121,6 +1584,30 @@ class MongoClient:
     result = await cls.league_players_collection.find_one(query)
     return result
 
+  @classmethod
+  async def get_league_players(
+      cls,
+      league_id: str,
+      telegrams: list[str],
+  ) -> dict:
+    """Fetches the data of several players of a league in one query.
+
+    Args:
+      league_id: ID of the league
+      telegrams: telegram names of the players
+    Returns:
+      A dict with lowercase telegram names as keys and player data as values
+    """
+    query = {
+        "league_id": league_id.lower(),
+        "telegram": {"$in": [telegram.lower() for telegram in telegrams]},
+    }
+    cursor = cls.league_players_collection.find(query)
+    results = {}
+    async for player in cursor:
+      results[player.get("telegram")] = player
+    return results
+
   @classmethod
   async def check_if_player_in_league(
       cls,
@@ -1160,42 +1647,74 @@ class MongoClient:
       return False
 
   @classmethod
-  async def add_league_invite(
+  async def add_league_invites(
       cls,
-      object: dict,
-  ) -> bool:
-    """Adds a new object with the user data to the "league_invites" collection.
+      objects: list[dict],
+  ) -> list[str]:
+    """Adds several invites to the "league_invites" collection at once.
+
+    Invites with codes that already exist are skipped.
 
     Args:
-      object: a dictionary with user data to be added
+      objects: a list of dictionaries with invite data to be added
     Returns:
-      A boolean with status of the operation
+      A list with the codes of the added invites
     """
-    result = await cls.league_invite_collection.insert_one(object)
-    if result:
-      return result.acknowledged
-    else:
-      return False
+    failed = set()
+    try:
+      await cls.league_invite_collection.insert_many(objects, ordered=False)
+    except BulkWriteError as e:
+      failed = {error.get("index") for error in e.details.get("writeErrors")}
+    return [
+        invite.get("invite_code") for index, invite in enumerate(objects)
+        if index not in failed
+    ]
 
   @classmethod
-  async def delete_league_invite(cls, invite_id: str) -> bool:
-    """
-    Deletes an object with the specified invite_id from the 
-    "league_invites" collection.
+  async def redeem_league_invite(
+      cls,
+      invite_code: str,
+      player: dict,
+  ) -> bool:
+    """Uses up a league invite and adds the player to its league.
 
-    Args:
-      invite_id: the ID of the invite to be deleted
+    The invite is removed atomically so it can't be used twice. Without
+    transactions the invite is restored if the player couldn't be added.
 
+    Args:
+      invite_code: code of the league invite
+      player: a dictionary with player data to be added
     Returns:
-      A boolean indicating the success status of the operation
+      A boolean with status of the operation
     """
-    result = await cls.league_invite_collection.delete_one(
-      {"invite_code": invite_id}
-    )
-    if result:
-        return result.deleted_count > 0
-    else:
-        return False
+    query = {
+        "invite_code": invite_code.lower(),
+        "league_id": player.get("league_id").lower(),
+    }
+    if config.MONGO_TRANSACTIONS:
+      async with await cls.mongo_client.start_session() as session:
+        async with session.start_transaction():
+          invite = await cls.league_invite_collection.find_one_and_delete(
+              query,
+              session=session,
+          )
+          if not invite:
+            return False
+          await cls.league_players_collection.insert_one(
+              player,
+              session=session,
+          )
+      return True
+    invite = await cls.league_invite_collection.find_one_and_delete(query)
+    if not invite:
+      return False
+    try:
+      await cls.league_players_collection.insert_one(player)
+    except Exception as e:
+      print(f"Failed to add a player, restoring invite {invite_code}: {e}")
+      await cls.league_invite_collection.insert_one(invite)
+      return False
+    return True
 
   @classmethod
   async def get_league(
@@ -1247,6 +1766,145 @@ class MongoClient:
     result = await cursor.to_list(length=None)
     return result
 
+  @classmethod
+  async def get_league_leaderboard(
+      cls,
+      league_id: str,
+      limit: int,
+  ) -> list[dict]:
+    """Fetches the players with the most points in a league.
+
+    Args:
+      league_id: ID of the league
+      limit: amount of players to fetch
+    Returns:
+      A list of player dicts sorted by total points
+    """
+    cursor = cls.league_players_collection.find(
+        {"league_id": league_id}
+    ).sort("total_points", DESCENDING).limit(limit)
+    result = await cursor.to_list(length=limit)
+    return result
+
+  @classmethod
+  async def get_leagues_leaderboards(
+      cls,
+      league_ids: list[str],
+      limit: int,
+  ) -> dict:
+    """Fetches the players with the most points for several leagues at once.
+
+    Args:
+      league_ids: IDs of the leagues
+      limit: amount of players to fetch for every league
+    Returns:
+      A dict with league IDs as keys and lists of sorted players as values
+    """
+    pipeline = [
+        {"$match": {"league_id": {"$in": league_ids}}},
+        {"$setWindowFields": {
+            "partitionBy": "$league_id",
+            "sortBy": {"total_points": -1},
+            "output": {"position": {"$documentNumber": {}}},
+        }},
+        {"$match": {"position": {"$lte": limit}}},
+        {"$sort": {"league_id": 1, "position": 1}},
+    ]
+    leaderboards = {league_id: [] for league_id in league_ids}
+    cursor = cls.league_players_collection.aggregate(pipeline)
+    async for player in cursor:
+      leaderboards[player.get("league_id")].append(player)
+    return leaderboards
+
+  @classmethod
+  async def count_league_players(
+      cls,
+      league_id: str,
+  ) -> int:
+    """Counts the players in a league.
+
+    Args:
+      league_id: ID of the league
+    Returns:
+      An int with the amount of players
+    """
+    return await cls.league_players_collection.count_documents(
+        {"league_id": league_id}
+    )
+
+  @classmethod
+  async def update_league_ranks(
+      cls,
+      league_id: str,
+      points_range: tuple[int, int] | None = None,
+  ) -> None:
+    """Recalculates the ranks of the players in a league by total points.
+
+    Ranks are competition ranks and points only grow, so after a change only
+    the players with points between the lowest old and the highest new points
+    of the changed players can move. With a range only those players are
+    ranked again, otherwise the whole league is.
+
+    Args:
+      league_id: ID of the league
+      points_range: a tuple with the lowest and the highest affected points
+    """
+    if points_range is None:
+      pipeline = [
+          {"$match": {"league_id": league_id}},
+          {"$setWindowFields": {
+              "sortBy": {"total_points": -1},
+              "output": {"rank": {"$rank": {}}},
+          }},
+          {"$project": {"_id": 1, "rank": 1}},
+          {"$merge": {
+              "into": cls.league_players_collection.name,
+              "on": "_id",
+              "whenMatched": "merge",
+              "whenNotMatched": "discard",
+          }},
+      ]
+      cursor = cls.league_players_collection.aggregate(pipeline)
+      await cursor.to_list(length=None)
+      return
+    (low, high) = points_range
+    above = await cls.league_players_collection.count_documents(
+        {"league_id": league_id, "total_points": {"$gt": high}},
+    )
+    cursor = cls.league_players_collection.find(
+        {"league_id": league_id, "total_points": {"$gte": low, "$lte": high}},
+        {"_id": 1, "total_points": 1, "rank": 1},
+    ).sort("total_points", DESCENDING)
+    players = await cursor.to_list(length=None)
+    operations = []
+    rank = above + 1
+    previous_points = None
+    for (index, player) in enumerate(players):
+      if player.get("total_points") != previous_points:
+        rank = above + index + 1
+        previous_points = player.get("total_points")
+      if player.get("rank") != rank:
+        operations.append(UpdateOne(
+            {"_id": player.get("_id")},
+            {"$set": {"rank": rank}},
+        ))
+    if operations:
+      await cls.league_players_collection.bulk_write(
+          operations,
+          ordered=False,
+      )
+
+  @classmethod
+  async def backfill_league_ranks(cls) -> None:
+    """Ranks the leagues with players that joined before ranks were kept.
+    """
+    league_ids = await cls.league_players_collection.distinct(
+        "league_id",
+        {"rank": {"$exists": False}},
+    )
+    for league_id in league_ids:
+      await cls.update_league_ranks(league_id=league_id)
+
   @classmethod
   async def get_all_leagues_for_player(
       cls,
@@ -1272,59 +1930,84 @@ class MongoClient:
     return active_leagues
 
   @classmethod
-  async def get_all_player_matches(
+  async def get_player_matches_page(
       cls,
+      league_id: str,
       telegram: str,
-  ) -> dict:
-    """Fetches all matches for a chosen player.
+      page: int,
+      page_size: int,
+  ) -> (list[dict], int):
+    """Fetches one page of player's matches in a league, newest first.
 
     Args:
+      league_id: ID of the league
       telegram: telegram name of the player
+      page: number of the page starting from 1
+      page_size: amount of matches on a page
 
     Returns:
-      A string with the username associated with the decklist ID
+      A tuple with a list of matches and the total amount of matches
     """
-    player_cursor = cls.league_matches_collection.find({
-        "$or": [
-            {"player_one": telegram.lower()},
-            {"player_two": telegram.lower()}
-        ]
-    })
-    result = await player_cursor.to_list(length=None)
-    return result
+    pipeline = [
+        {"$match": {"league_id": league_id, "players": telegram.lower()}},
+        {"$sort": {"played_at": -1}},
+        {"$facet": {
+            "matches": [
+                {"$skip": (page - 1) * page_size},
+                {"$limit": page_size},
+            ],
+            "total": [{"$count": "count"}],
+        }},
+    ]
+    result = await cls.league_matches_collection.aggregate(
+        pipeline
+    ).to_list(length=1)
+    matches = result[0].get("matches", [])
+    total = result[0].get("total", [])
+    return (matches, total[0].get("count") if total else 0)
 
   @classmethod
-  async def get_league_invite(
-      cls,
-      invite_code: str,
-  ) -> dict:
-    """Fetches the league invite data for chosen invite code.
+  async def migrate_league_matches(cls) -> None:
+    """Adds a datetime and a list of players to the matches that were
+    recorded before they were introduced.
 
-    Args:
-      invite_code: code of the league invite
-    Returns:
-      A dict with league invite
+    Runs once, matches without a readable date get a null datetime.
     """
-    result = await cls.league_invite_collection.find_one(
-        {"invite_code": invite_code.lower()}
+    migration = {"_id": "league_matches_played_at"}
+    if await cls.migrations_collection.find_one(migration):
+      return
+    result = await cls.league_matches_collection.update_many(
+        {"played_at": {"$exists": False}},
+        [{"$set": {
+            "played_at": {"$dateFromString": {
+                "dateString": "$date_played",
+                "format": "%d.%m.%Y %H:%M",
+                "onError": None,
+                "onNull": None,
+            }},
+            "players": ["$player_one", "$player_two"],
+        }}],
+    )
+    print(f"Migrated {result.modified_count} league matches")
+    await cls.migrations_collection.insert_one(
+        {**migration, "applied_at": datetime.now(timezone.utc)},
     )
-    return result
 
   @classmethod
-  async def update_player(
+  def create_player_match_update(
       cls,
-      telegram : str,
       win: bool,
       standing: bool,
       broke_streak: bool,
-  ) -> bool:
-    """Updates the player scores.
+  ) -> dict:
+    """Creates an update for the player scores after a match.
 
     Args:
-      store_name: name of the store to update
-      cards: a dictionary with cards data to be added
+      win: True if the player won the match
+      standing: True if it was a standing match for the player
+      broke_streak: True if the opponent had a win streak of 3 or more
     Returns:
-      A tuple with a boolean status of the operation and a message
+      A dict with the update operators
     """
     win_points = 0
     loss_points = 0
@@ -1334,79 +2017,276 @@ class MongoClient:
       win_points += 2
       loss_points = 1
     if win:
-      result = await cls.league_players_collection.update_one(
-          {"telegram": telegram.lower()},
-          {"$inc": {
-              "total_points": win_points,
-              "total_played": 1,
-              "total_wins": 1,
-              "standing_matches_played": 1 if standing else 0,
-              "standing_wins": 1 if standing else 0,
-              "win_streak": 1,
-          }}
-      )
-    if not win:
-      result = await cls.league_players_collection.update_one(
-          {"telegram": telegram.lower()},
-          {"$inc": {
-              "total_points": loss_points,
-              "total_played": 1,
-              "total_losses": 1,
-              "standing_matches_played": 1 if standing else 0,
-              "standing_losses": 1 if standing else 0,
-          },
-          "$set": {"win_streak": 0}
-          },
-      )
-    if not result:
-      return False
-    else:
-      return True
+      return {"$inc": {
+          "total_points": win_points,
+          "total_played": 1,
+          "total_wins": 1,
+          "standing_matches_played": 1 if standing else 0,
+          "standing_wins": 1 if standing else 0,
+          "win_streak": 1,
+      }}
+    return {
+        "$inc": {
+            "total_points": loss_points,
+            "total_played": 1,
+            "total_losses": 1,
+            "standing_matches_played": 1 if standing else 0,
+            "standing_losses": 1 if standing else 0,
+        },
+        "$set": {"win_streak": 0},
+    }
+
+  @classmethod
+  def create_player_undo_update(cls, update: dict, before: dict) -> dict:
+    """Creates an update reverting a player update.
+
+    Args:
+      update: the applied player update
+      before: the player document before the update
+    Returns:
+      A dict with the update operators
+    """
+    undo = {
+        "$inc": {
+            field: -value for (field, value) in update.get("$inc", {}).items()
+        },
+    }
+    fields = update.get("$set", {}).keys()
+    restored = {field: before[field] for field in fields if field in before}
+    removed = {field: "" for field in fields if field not in before}
+    if restored:
+      undo["$set"] = restored
+    if removed:
+      undo["$unset"] = removed
+    return undo
 
   @classmethod
-  async def update_league(
+  async def record_league_match(
       cls,
-      league_id : str,
+      object: dict,
+      player_updates: dict,
   ) -> bool:
-    """Updates the league and moves it 1 week forward.
+    """Adds a match and updates the scores of its players together.
+
+    The writes run in one transaction when transactions are enabled.
+    Otherwise the players are updated one by one after the match, and if one
+    of them can't be updated the applied updates are reverted and the match
+    is deleted again.
 
     Args:
-      league_id: ID of the league
+      object: a dictionary with match data to be added
+      player_updates: a dict with telegram names as keys and player updates
+      as values
     Returns:
-      A tuple with a boolean status of the operation and a message
+      True if the match is recorded, False if nothing was written
     """
-    result = await cls.league_collection.update_one(
-        {"league_id": league_id},
-        {"$inc": {
-            "current_week": 1,
-        }}
-    )
-    if not result:
-      return False
-    else:
+    league_id = object.get("league_id")
+    # Head-to-head counters of both players against each other
+    player_one = object.get("player_one")
+    player_two = object.get("player_two")
+    standings = object.get("standings", {})
+    counters = [
+        UpdateOne(
+            {"league_id": league_id, "player": player, "opponent": opponent},
+            {"$inc": {
+                "matches": 1,
+                "standings": 1 if standings.get(player) else 0,
+            }},
+            upsert=True,
+        )
+        for (player, opponent) in (
+            (player_one, player_two),
+            (player_two, player_one),
+        )
+    ]
+    if config.MONGO_TRANSACTIONS:
+      operations = [
+          UpdateOne({"telegram": telegram, "league_id": league_id}, update)
+          for (telegram, update) in player_updates.items()
+      ]
+      async with await cls.mongo_client.start_session() as session:
+        async with session.start_transaction():
+          await cls.league_matches_collection.insert_one(
+              object,
+              session=session,
+          )
+          result = await cls.league_players_collection.bulk_write(
+              operations,
+              session=session,
+          )
+          if result.matched_count != len(operations):
+            await session.abort_transaction()
+            return False
+          await cls.league_head_to_head_collection.bulk_write(
+              counters,
+              session=session,
+          )
       return True
+    inserted = await cls.league_matches_collection.insert_one(object)
+    if not inserted.acknowledged:
+      return False
+    # Player filters with their updates and documents before the updates
+    applied = []
+    failed = False
+    for (telegram, update) in player_updates.items():
+      player_filter = {"telegram": telegram, "league_id": league_id}
+      try:
+        before = await cls.league_players_collection.find_one_and_update(
+            player_filter,
+            update,
+            projection={field: 1 for field in update.get("$set", {})},
+            return_document=ReturnDocument.BEFORE,
+        )
+      except PyMongoError as e:
+        text = (
+            f"Couldn't update {telegram} in match {inserted.inserted_id}: {e}"
+        )
+        print(text)
+        before = None
+      if before is None:
+        failed = True
+        break
+      applied.append((player_filter, update, before))
+    if failed:
+      try:
+        for (player_filter, update, before) in applied:
+          await cls.league_players_collection.update_one(
+              player_filter,
+              cls.create_player_undo_update(update=update, before=before),
+          )
+        await cls.league_matches_collection.delete_one(
+            {"_id": inserted.inserted_id},
+        )
+      except PyMongoError as e:
+        # The match is still stored, it's reported as recorded so a retry
+        # doesn't add it again
+        text = (
+            f"Couldn't revert match {inserted.inserted_id}, "
+            f"its players need to be checked: {e}"
+        )
+        print(text)
+        return True
+      return False
+    try:
+      await cls.league_head_to_head_collection.bulk_write(counters)
+    except PyMongoError as e:
+      # The match and the scores are recorded, only the counters are behind
+      print(f"Couldn't update head-to-head counters of {league_id}: {e}")
+    return True
 
   @classmethod
-  async def get_player_standing_against_player(
+  async def advance_leagues(
       cls,
+      league_ids: list[str],
+  ) -> set[str]:
+    """Moves several leagues 1 week forward in one update.
+
+    Args:
+      league_ids: IDs of the leagues
+    Returns:
+      A set with IDs of the leagues that were moved forward
+    """
+    if not league_ids:
+      return set()
+    # The update is marked so the leagues it moved can be read back
+    rollover_id = ObjectId()
+    await cls.league_collection.update_many(
+        {"league_id": {"$in": league_ids}},
+        {
+            "$inc": {"current_week": 1},
+            "$set": {"rollover_id": rollover_id},
+        },
+    )
+    cursor = cls.league_collection.find(
+        {"league_id": {"$in": league_ids}, "rollover_id": rollover_id},
+        {"_id": 0, "league_id": 1},
+    )
+    return {league.get("league_id") async for league in cursor}
+
+  @classmethod
+  async def get_head_to_head_standings(
+      cls,
+      league_id: str,
       player_one: str,
       player_two: str,
-  ) -> list:
-    """fetches all the standings for player one against player two.
+  ) -> tuple[int, int]:
+    """Fetches the standing matches both players have against each other.
 
     Args:
+      league_id: ID of the league
       player_one: telegram username of player one
-      player_two telegram username of player two
+      player_two: telegram username of player two
     Returns:
-      A string with the username associated with the decklist ID
+      A tuple with standing matches of player one and player two
     """
     query = {
-        f"standings.{player_one}": True,
-        f"standings.{player_two}": {"$exists": True}
+        "league_id": league_id,
+        "player": {"$in": [player_one, player_two]},
+        "opponent": {"$in": [player_one, player_two]},
     }
-    cursor = cls.league_matches_collection.find(query)
-    result = await cursor.to_list(length=None)
-    return result
+    cursor = cls.league_head_to_head_collection.find(
+        query,
+        {"_id": 0, "player": 1, "standings": 1},
+    )
+    standings = {}
+    async for counter in cursor:
+      standings[counter.get("player")] = counter.get("standings", 0)
+    return (standings.get(player_one, 0), standings.get(player_two, 0))
+
+  @classmethod
+  async def backfill_head_to_head(cls) -> None:
+    """Builds the head-to-head counters from the recorded matches if the
+    counters collection is still empty.
+    """
+    collection = cls.league_head_to_head_collection
+    if await collection.estimated_document_count():
+      return
+    print("Building head-to-head counters from league matches")
+    pipeline = [
+        {"$project": {
+            "league_id": 1,
+            "pairs": [
+                {"player": "$player_one", "opponent": "$player_two"},
+                {"player": "$player_two", "opponent": "$player_one"},
+            ],
+            "standings": 1,
+        }},
+        {"$unwind": "$pairs"},
+        {"$group": {
+            "_id": {
+                "league_id": "$league_id",
+                "player": "$pairs.player",
+                "opponent": "$pairs.opponent",
+            },
+            "matches": {"$sum": 1},
+            "standings": {"$sum": {"$cond": [
+                {"$first": {"$filter": {
+                    "input": {"$objectToArray": "$standings"},
+                    "cond": {"$and": [
+                        {"$eq": ["$$this.k", "$pairs.player"]},
+                        "$$this.v",
+                    ]},
+                }}},
+                1,
+                0,
+            ]}},
+        }},
+        {"$project": {
+            "_id": 0,
+            "league_id": "$_id.league_id",
+            "player": "$_id.player",
+            "opponent": "$_id.opponent",
+            "matches": 1,
+            "standings": 1,
+        }},
+        {"$merge": {
+            "into": cls.league_head_to_head_collection.name,
+            "on": ["league_id", "player", "opponent"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }},
+    ]
+    await cls.league_matches_collection.aggregate(pipeline).to_list(length=None)
 
   @classmethod
   async def add_league_subscription(
@@ -0,0 +1,208 @@
+"""Module for monitoring the commands sent to Mongo DB.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import re
+import threading
+from pymongo import monitoring
+from bot.config import config
+from bot.utils.metrics import COUNTER, HISTOGRAM, Metrics
+from bot.utils.tracing import Trace
+
+Metrics.define(
+    name="mongo_operations_total",
+    kind=COUNTER,
+    description="Mongo commands sent by MongoClient methods",
+)
+Metrics.define(
+    name="mongo_operation_seconds",
+    kind=HISTOGRAM,
+    description="Duration of Mongo commands sent by MongoClient methods",
+)
+Metrics.define(
+    name="mongo_slow_operations_total",
+    kind=COUNTER,
+    description="Mongo commands slower than the slow query threshold",
+)
+
+# Name of the MongoClient method running in the current task, Motor copies
+# the context into the threads running Mongo commands
+current_method = contextvars.ContextVar("current_method", default="other")
+
+# Fields holding the filters of the commands, update and delete commands keep
+# them in the "q" field of each statement
+FILTER_FIELDS = {
+    "find": "filter",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+    "aggregate": "pipeline",
+    "update": "updates",
+    "delete": "deletes",
+}
+
+# Fields keyed by chat ids or names the users chose, their keys are hidden in
+# the logged filters
+DYNAMIC_FIELDS = frozenset((
+    "deckbox_subscriptions",
+    "store_subscriptions",
+    "subscribed_channels",
+))
+
+
+def monitor_methods(cls: type) -> type:
+  """Makes the async class methods name the Mongo commands they send.
+
+  Args:
+    cls: class with the methods querying Mongo
+  Returns:
+    The class with wrapped methods
+  """
+  def wrap(name: str, function):
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+      token = current_method.set(name)
+      try:
+        return await function(*args, **kwargs)
+      finally:
+        current_method.reset(token)
+    return wrapper
+
+  for (name, attribute) in list(vars(cls).items()):
+    if not isinstance(attribute, classmethod):
+      continue
+    if inspect.iscoroutinefunction(attribute.__func__):
+      setattr(cls, name, classmethod(wrap(name, attribute.__func__)))
+  return cls
+
+
+def key_shape(key: str) -> tuple[str, bool]:
+  """Replaces the dynamic segments of a field path with placeholders.
+
+  Numeric segments like chat ids and the segments following a dynamic field
+  are replaced.
+
+  Args:
+    key: a field path or an operator
+  Returns:
+    A tuple with the shaped key and True if the keys nested under it are
+    dynamic
+  """
+  segments = []
+  dynamic = False
+  for segment in key.split("."):
+    if dynamic or re.fullmatch(r"-?\d+", segment):
+      segments.append("?")
+      dynamic = False
+    else:
+      segments.append(segment)
+      dynamic = segment in DYNAMIC_FIELDS
+  return (".".join(segments), dynamic)
+
+
+def filter_shape(value, dynamic: bool = False):
+  """Replaces the values of a filter with placeholders.
+
+  Args:
+    value: a filter, pipeline or a part of them
+    dynamic: True if the keys of a dict value are chat ids or user names
+  Returns:
+    The filter with operators and static field names kept, dynamic field
+    names and values replaced
+  """
+  if isinstance(value, dict):
+    shape = {}
+    for (key, item) in value.items():
+      if dynamic and not key.startswith("$"):
+        (key, nested) = ("?", False)
+      else:
+        (key, nested) = key_shape(key)
+      shape[key] = filter_shape(item, dynamic=nested)
+    return shape
+  if isinstance(value, (list, tuple)):
+    if any(isinstance(item, (dict, list, tuple)) for item in value):
+      return [filter_shape(item) for item in value]
+    return ["?"]
+  return "?"
+
+
+class MongoCommandListener(monitoring.CommandListener):
+  """Records the Mongo commands per MongoClient method and adds their
+  duration to the traced bot command."""
+
+  def __init__(self):
+    # Started commands waiting for their end, keyed by connection and request
+    self.pending = {}
+    self.lock = threading.Lock()
+
+  def started(self, event: monitoring.CommandStartedEvent) -> None:
+    """Remembers the method and the command document of a started command."""
+    with self.lock:
+      self.pending[(event.connection_id, event.request_id)] = (
+          current_method.get(),
+          event.command,
+      )
+
+  def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+    """Records a finished command."""
+    self.record(event=event, status="ok")
+
+  def failed(self, event: monitoring.CommandFailedEvent) -> None:
+    """Records a failed command."""
+    self.record(event=event, status="error")
+
+  def command_filter(self, command_name: str, command: dict):
+    """Finds the filter of a command.
+
+    Args:
+      command_name: name of the command
+      command: command document
+    Returns:
+      The filter shape or None if the command has no filter
+    """
+    field = FILTER_FIELDS.get(command_name)
+    if field is None or field not in command:
+      return None
+    value = command[field]
+    if command_name in ("update", "delete"):
+      value = [statement.get("q") for statement in value]
+    return filter_shape(value)
+
+  def record(self, event, status: str) -> None:
+    """Updates the metrics and the trace with a finished command and logs it
+    if it's slow.
+
+    Args:
+      event: pymongo event of a finished command
+      status: "ok" or "error"
+    """
+    with self.lock:
+      (method, command) = self.pending.pop(
+          (event.connection_id, event.request_id),
+          (current_method.get(), None),
+      )
+    seconds = event.duration_micros / 1e6
+    labels = {"method": method, "command": event.command_name}
+    Metrics.increment("mongo_operations_total", status=status, **labels)
+    Metrics.observe("mongo_operation_seconds", seconds, **labels)
+    trace = Trace.current()
+    if trace:
+      trace.add_mongo_time(seconds)
+    if seconds * 1000 < config.MONGO_SLOW_QUERY_MS:
+      return
+    Metrics.increment("mongo_slow_operations_total", **labels)
+    shape = None
+    if command is not None:
+      shape = self.command_filter(
+          command_name=event.command_name,
+          command=command,
+      )
+    collection = command.get(event.command_name) if command else None
+    text = (
+        f"Slow Mongo {event.command_name} on {collection} "
+        f"from MongoClient.{method}: {seconds * 1000:.0f} ms, "
+        f"filter {json.dumps(shape)}"
+    )
+    print(text)
@@ -0,0 +1,88 @@
+"""Module for caching scryfall responses in memory.
+"""
+import time
+from collections import OrderedDict
+
+
+class CardCache:
+  """A least recently used cache with an expiry time for every entry."""
+
+  def __init__(self, max_size: int):
+    self.max_size = max_size
+    self.entries = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  def get(
+      self,
+      key: str,
+      max_age: float | None = None,
+      count: bool = True,
+  ) -> dict | None:
+    """Fetches a value that hasn't expired yet.
+
+    Args:
+      key: key of the value
+      max_age: maximum age of the value in seconds, overrides its TTL if lower
+      count: set to False to not count the lookup in the hit ratio
+    Returns:
+      The cached value or None if it is missing or too old
+    """
+    value = None
+    entry = self.entries.get(key)
+    if entry:
+      (stored_value, stored_at, ttl) = entry
+      age = time.time() - stored_at
+      if age >= ttl:
+        del self.entries[key]
+      elif max_age is None or age < max_age:
+        self.entries.move_to_end(key)
+        value = stored_value
+    if count:
+      self.record_lookup(hit=value is not None)
+    return value
+
+  def record_lookup(self, hit: bool) -> None:
+    """Counts a lookup in the hit ratio.
+
+    Args:
+      hit: True if the value was found
+    """
+    if hit:
+      self.hits += 1
+    else:
+      self.misses += 1
+
+  def set(
+      self,
+      key: str,
+      value: dict,
+      ttl: float,
+      stored_at: float | None = None,
+  ) -> None:
+    """Stores a value and drops the least recently used ones over the limit.
+
+    Args:
+      key: key of the value
+      value: value to store
+      ttl: time in seconds the value is valid for
+      stored_at: timestamp of the value, current time if None
+    """
+    self.entries[key] = (value, stored_at or time.time(), ttl)
+    self.entries.move_to_end(key)
+    while len(self.entries) > self.max_size:
+      self.entries.popitem(last=False)
+
+  def stats(self) -> dict:
+    """Returns the cache counters.
+
+    Returns:
+      A dict with size, hits, misses and hit ratio of the cache
+    """
+    requests = self.hits + self.misses
+    return {
+        "size": len(self.entries),
+        "hits": self.hits,
+        "misses": self.misses,
+        "hit_ratio": self.hits / requests if requests else 0.0,
+    }
@@ -0,0 +1,392 @@
+"""Module for answering card lookups from a local copy of scryfall bulk data.
+"""
+import asyncio
+import difflib
+import json
+import os
+import sqlite3
+import sys
+import unicodedata
+from bot.config import config
+from bot.config.http_client import HttpClient
+from bot.config.urls import SCRYFALL_BULK_DATA_URL
+
+# Only these fields are kept from the bulk data to keep the database small
+CARD_FIELDS = (
+    "name",
+    "scryfall_uri",
+    "prices",
+    "image_uris",
+    "cmc",
+    "type_line",
+)
+FACE_FIELDS = ("name", "image_uris")
+
+
+class CardDatabase:
+  connection = None
+  card_names = []
+  # Names the slow search didn't find, kept until the database is reopened
+  missing_names = {}
+
+  @classmethod
+  def normalise_name(cls, card_name: str) -> str:
+    """Normalises a card name for lookups.
+
+    Args:
+      card_name: name of the card
+    Returns:
+      A lowercase string without accents, punctuation and extra spaces
+    """
+    card_name = card_name.replace("\u2019", "'")
+    decomposed = unicodedata.normalize("NFKD", card_name)
+    characters = [
+        char if char.isalnum() else " "
+        for char in decomposed.lower()
+        if not unicodedata.combining(char) and char != "'"
+    ]
+    return " ".join("".join(characters).split())
+
+  @classmethod
+  def iterate_json_array(
+      cls,
+      file,
+      chunk_size: int = 1024 * 1024,
+  ):
+    """Yields objects of a JSON array file one by one without loading the
+    whole file into memory.
+
+    Args:
+      file: a text file object with a JSON array
+      chunk_size: amount of characters read at once
+    Yields:
+      Dicts with the array elements
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+    finished = False
+    while not finished:
+      chunk = file.read(chunk_size)
+      buffer += chunk
+      position = 0
+      while True:
+        # Skip whitespace and separators between the objects
+        while position < len(buffer) and buffer[position] in " \t\r\n,[]":
+          if buffer[position] == "[":
+            started = True
+          elif buffer[position] == "]" and started:
+            finished = True
+          position += 1
+        if finished or position >= len(buffer):
+          break
+        try:
+          (element, end) = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+          # The object continues in the next chunk
+          break
+        yield element
+        position = end
+      buffer = buffer[position:]
+      if not chunk:
+        break
+
+  @classmethod
+  def compact_card(cls, card: dict) -> dict:
+    """Keeps only the fields the bot uses from a scryfall card.
+
+    Args:
+      card: a dict with scryfall card data
+    Returns:
+      A dict with the compact card data
+    """
+    compact = {"object": "card"}
+    for field in CARD_FIELDS:
+      if field in card:
+        compact[field] = card[field]
+    faces = card.get("card_faces")
+    if faces:
+      compact["card_faces"] = [
+          {field: face[field] for field in FACE_FIELDS if field in face}
+          for face in faces
+      ]
+    return compact
+
+  @classmethod
+  def build_database(
+      cls,
+      bulk_file_path: str,
+      database_path: str,
+  ) -> int:
+    """Builds the card database from a scryfall bulk data file.
+
+    The database is written next to the old one and swapped in when ready.
+
+    Args:
+      bulk_file_path: path to the scryfall bulk data JSON file
+      database_path: path to the SQLite database
+    Returns:
+      An int with the amount of cards added
+    """
+    temporary_path = f"{database_path}.tmp"
+    if os.path.exists(temporary_path):
+      os.remove(temporary_path)
+    directory = os.path.dirname(database_path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(temporary_path)
+    connection.execute(
+        "CREATE TABLE cards (card_key TEXT PRIMARY KEY, data TEXT NOT NULL)"
+    )
+    connection.execute(
+        "CREATE TABLE names (name TEXT PRIMARY KEY, card_key TEXT NOT NULL)"
+    )
+    total = 0
+    with open(bulk_file_path, "r", encoding="utf-8") as bulk_file:
+      for card in cls.iterate_json_array(file=bulk_file):
+        if card.get("object") != "card" or not card.get("name"):
+          continue
+        card_key = cls.normalise_name(card["name"])
+        compact = cls.compact_card(card=card)
+        connection.execute(
+            "INSERT OR REPLACE INTO cards VALUES (?, ?)",
+            (card_key, json.dumps(compact, separators=(",", ":"))),
+        )
+        # Cards can be found by their full name and by any of their faces
+        names = {card_key}
+        for face in card.get("card_faces", []):
+          if face.get("name"):
+            names.add(cls.normalise_name(face["name"]))
+        connection.executemany(
+            "INSERT OR IGNORE INTO names VALUES (?, ?)",
+            [(name, card_key) for name in names],
+        )
+        total += 1
+    connection.commit()
+    connection.close()
+    os.replace(temporary_path, database_path)
+    return total
+
+  @classmethod
+  def open_database(cls, database_path: str) -> bool:
+    """Opens an existing card database.
+
+    Args:
+      database_path: path to the SQLite database
+    Returns:
+      True if the database was opened, False if it doesn't exist
+    """
+    if not os.path.exists(database_path):
+      return False
+    connection = sqlite3.connect(database_path, check_same_thread=False)
+    names = [row[0] for row in connection.execute("SELECT name FROM names")]
+    old_connection = cls.connection
+    cls.connection = connection
+    cls.card_names = names
+    cls.missing_names = {}
+    if old_connection:
+      old_connection.close()
+    print(f"Card database loaded with {len(names)} card names")
+    return True
+
+  @classmethod
+  def is_loaded(cls) -> bool:
+    """Checks if the card database can answer lookups.
+
+    Returns:
+      True if the database is loaded
+    """
+    return cls.connection is not None
+
+  @classmethod
+  def load_card(cls, card_key: str) -> dict | None:
+    """Loads a card by its key.
+
+    Args:
+      card_key: normalised name of the card
+    Returns:
+      A dict with card data or None if it doesn't exist
+    """
+    row = cls.connection.execute(
+        "SELECT data FROM cards WHERE card_key = ?",
+        (card_key,),
+    ).fetchone()
+    return json.loads(row[0]) if row else None
+
+  @classmethod
+  def get_exact_card(cls, card_name: str) -> dict | None:
+    """Finds a card by its exact name or the name of one of its faces.
+
+    Args:
+      card_name: name of the card
+    Returns:
+      A dict with card data or None if the card wasn't found
+    """
+    if not cls.is_loaded():
+      return None
+    row = cls.connection.execute(
+        "SELECT card_key FROM names WHERE name = ?",
+        (cls.normalise_name(card_name),),
+    ).fetchone()
+    return cls.load_card(card_key=row[0]) if row else None
+
+  @classmethod
+  def search_card(cls, name: str) -> dict | None:
+    """Finds a card by a part of its name and then by similarity.
+
+    Both steps go through all the names, so they run in a thread.
+
+    Args:
+      name: normalised name of the card
+    Returns:
+      A dict with card data, an error dict if the name is ambiguous or None
+      if the card wasn't found
+    """
+    rows = cls.connection.execute(
+        "SELECT DISTINCT card_key FROM names WHERE instr(name, ?) > 0 "
+        "LIMIT 2",
+        (name,),
+    ).fetchall()
+    if len(rows) == 1:
+      return cls.load_card(card_key=rows[0][0])
+    if len(rows) > 1:
+      return {"object": "error", "type": "ambiguous"}
+    close_matches = difflib.get_close_matches(
+        name,
+        cls.card_names,
+        n=1,
+        cutoff=0.8,
+    )
+    if close_matches:
+      row = cls.connection.execute(
+          "SELECT card_key FROM names WHERE name = ?",
+          (close_matches[0],),
+      ).fetchone()
+      return cls.load_card(card_key=row[0])
+    return None
+
+  @classmethod
+  async def get_card(cls, card_name: str) -> dict | None:
+    """Finds a card the same way the scryfall fuzzy search does.
+
+    The name is matched exactly, then as a prefix, then as a part of a name
+    and finally by similarity.
+
+    Args:
+      card_name: name of the card
+    Returns:
+      A dict with card data, an error dict if the name is ambiguous or None
+      if the card wasn't found
+    """
+    if not cls.is_loaded():
+      return None
+    name = cls.normalise_name(card_name)
+    if not name:
+      return None
+    row = cls.connection.execute(
+        "SELECT card_key FROM names WHERE name = ?",
+        (name,),
+    ).fetchone()
+    if row:
+      return cls.load_card(card_key=row[0])
+    # The prefix search is a range on the primary key index
+    rows = cls.connection.execute(
+        "SELECT DISTINCT card_key FROM names WHERE name >= ? AND name < ? "
+        "LIMIT 2",
+        (name, name + "\uffff"),
+    ).fetchall()
+    if len(rows) == 1:
+      return cls.load_card(card_key=rows[0][0])
+    if len(rows) > 1:
+      return {"object": "error", "type": "ambiguous"}
+    if name in cls.missing_names:
+      return None
+    card = await asyncio.to_thread(cls.search_card, name)
+    if card is None:
+      cls.missing_names[name] = True
+      if len(cls.missing_names) > config.SCRYFALL_CACHE_SIZE:
+        del cls.missing_names[next(iter(cls.missing_names))]
+    return card
+
+  @classmethod
+  async def download_bulk_data(cls, file_path: str) -> bool:
+    """Streams the latest scryfall bulk data into a file.
+
+    Args:
+      file_path: path of the file to save the data to
+    Returns:
+      True if the file was downloaded
+    """
+    response = await HttpClient.HTTP_SESSION.get(url=SCRYFALL_BULK_DATA_URL)
+    if response.status != 200:
+      print(f"Couldn't get scryfall bulk data info: {response.status}")
+      return False
+    bulk_info = await response.json()
+    download_uri = bulk_info.get("download_uri")
+    if not download_uri:
+      return False
+    response = await HttpClient.HTTP_SESSION.get(url=download_uri)
+    if response.status != 200:
+      print(f"Couldn't download scryfall bulk data: {response.status}")
+      return False
+    with open(file_path, "wb") as bulk_file:
+      async for chunk in response.content.iter_chunked(1024 * 1024):
+        bulk_file.write(chunk)
+    return True
+
+  @classmethod
+  async def refresh_database(cls) -> bool:
+    """Rebuilds the card database from the configured bulk data file or from
+    freshly downloaded scryfall bulk data.
+
+    Returns:
+      True if the database was rebuilt
+    """
+    database_path = config.SCRYFALL_LOCAL_DB_PATH
+    bulk_file_path = config.SCRYFALL_BULK_DATA_FILE
+    downloaded = False
+    if not bulk_file_path:
+      bulk_file_path = f"{database_path}.json"
+      downloaded = await cls.download_bulk_data(file_path=bulk_file_path)
+      if not downloaded:
+        return False
+    try:
+      total = await asyncio.to_thread(
+          cls.build_database,
+          bulk_file_path,
+          database_path,
+      )
+    finally:
+      if downloaded:
+        os.remove(bulk_file_path)
+    print(f"Card database rebuilt with {total} cards")
+    return cls.open_database(database_path=database_path)
+
+  @classmethod
+  async def init_database(cls) -> None:
+    """Opens the card database or builds it if it doesn't exist yet.
+    """
+    if not config.SCRYFALL_LOCAL_DB:
+      return
+    if not cls.open_database(database_path=config.SCRYFALL_LOCAL_DB_PATH):
+      await cls.refresh_database()
+
+  @classmethod
+  async def refresh_scheduled_job(cls) -> None:
+    """Refreshes the card database with the latest scryfall data.
+    """
+    if not config.SCRYFALL_LOCAL_DB:
+      return
+    print("Refreshing the card database")
+    await cls.refresh_database()
+
+
+if __name__ == "__main__":
+  # Builds a database from a bulk data file and looks up the given names:
+  # python -m bot.scryfall.card_database <bulk file> <database> <names...>
+  (bulk_file, database, *card_names) = sys.argv[1:]
+  print(f"Added {CardDatabase.build_database(bulk_file, database)} cards")
+  CardDatabase.open_database(database_path=database)
+  for card_name in card_names:
+    card = asyncio.run(CardDatabase.get_card(card_name=card_name))
+    print(card_name, card)
@@ -0,0 +1,129 @@
+"""Module for keeping a pool of random cards ready for quizzes and
+verifications.
+"""
+import asyncio
+from bot.config import config
+from bot.mongo.mongo_client import MongoClient
+from bot.scryfall.scryfall import ScryfallFetcher
+
+
+class CardPool:
+  cards = []
+  refill_task = None
+
+  @classmethod
+  def compact_card(cls, card: dict) -> dict | None:
+    """Keeps only the card data needed by quizzes and verifications.
+
+    Args:
+      card: a dict with scryfall card data
+    Returns:
+      A dict with card name, CMC, art and image or None if the card has no
+      images
+    """
+    image_uris = card.get("image_uris")
+    faces = card.get("card_faces")
+    # Double faced cards keep their images on the faces
+    if not image_uris and faces:
+      image_uris = faces[0].get("image_uris")
+    if not image_uris:
+      return None
+    art = image_uris.get("art_crop")
+    image = image_uris.get("normal")
+    if not art or not image:
+      return None
+    return {
+        "card_name": card.get("name"),
+        "cmc": card.get("cmc", 0),
+        "art": art,
+        "image": image,
+    }
+
+  @classmethod
+  async def init_pool(cls) -> None:
+    """Loads the cards saved by a previous run and fills the pool up.
+    """
+    cls.cards = await MongoClient.get_card_pool()
+    print(f"Card pool loaded with {len(cls.cards)} cards")
+    cls.schedule_refill()
+
+  @classmethod
+  def schedule_refill(cls) -> None:
+    """Starts filling the pool in the background if it isn't full.
+    """
+    if len(cls.cards) >= config.SCRYFALL_CARD_POOL_SIZE:
+      return
+    if cls.refill_task and not cls.refill_task.done():
+      return
+    cls.refill_task = asyncio.create_task(cls.refill())
+
+  @classmethod
+  async def refill(cls) -> None:
+    """Fetches random cards until the pool reaches its target size.
+    """
+    while len(cls.cards) < config.SCRYFALL_CARD_POOL_SIZE:
+      card = await ScryfallFetcher.get_random_card()
+      # Scryfall is unavailable, the next taken card will try again
+      if not card:
+        break
+      entry = cls.compact_card(card=card)
+      if not entry:
+        continue
+      entry["_id"] = await MongoClient.add_card_pool_entry(object=entry)
+      cls.cards.append(entry)
+
+  @classmethod
+  async def take_card(
+      cls,
+      non_zero_cmc: bool = False,
+  ) -> dict | None:
+    """Takes a card out of the pool or fetches one if the pool is empty.
+
+    Args:
+      non_zero_cmc: set to True to take only cards with CMC >= 1
+    Returns:
+      A dict with card name, CMC, art and image or None if there are no cards
+    """
+    entry = None
+    for (index, card) in enumerate(cls.cards):
+      if not non_zero_cmc or card.get("cmc", 0) >= 1:
+        entry = cls.cards.pop(index)
+        break
+    cls.schedule_refill()
+    if entry:
+      await MongoClient.delete_card_pool_entry(entry_id=entry.get("_id"))
+      return entry
+    card = await ScryfallFetcher.get_random_card(non_zero_cmc=non_zero_cmc)
+    if card:
+      return cls.compact_card(card=card)
+    return None
+
+  @classmethod
+  async def get_quiz_card(cls) -> dict | None:
+    """Takes a card for a quiz.
+
+    Returns:
+      A dict with card name and art
+    """
+    entry = await cls.take_card()
+    if entry:
+      return {
+          "card_name": entry.get("card_name"),
+          "art": entry.get("art"),
+      }
+    return None
+
+  @classmethod
+  async def get_verification_card(cls) -> dict | None:
+    """Takes a card with CMC >= 1 for a verification.
+
+    Returns:
+      A dict with card CMC and image
+    """
+    entry = await cls.take_card(non_zero_cmc=True)
+    if entry:
+      return {
+          "cmc": entry.get("cmc"),
+          "image": entry.get("image"),
+      }
+    return None
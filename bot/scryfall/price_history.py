@@ -0,0 +1,219 @@
+"""Module for keeping the price history of the cards on tradelists and
+wishlists.
+"""
+from bot.config import config
+from bot.mongo.mongo_client import MongoClient
+from bot.scryfall.card_database import CardDatabase
+from bot.scryfall.scryfall import ScryfallFetcher
+from datetime import datetime, timedelta, timezone
+
+
+class PriceHistory:
+
+  @classmethod
+  def parse_price(cls, price: str | None) -> float | None:
+    """Converts a scryfall price into a number.
+
+    Args:
+      price: a string with the price or None
+    Returns:
+      A float with the price or None if there is no price
+    """
+    try:
+      return float(price)
+    except (TypeError, ValueError):
+      return None
+
+  @classmethod
+  async def snapshot_prices(cls) -> int:
+    """Saves the current prices of all the cards on cached tradelists and
+    wishlists.
+
+    Returns:
+      An int with the amount of saved prices
+    """
+    card_names = await MongoClient.get_tracked_card_names()
+    cards = await ScryfallFetcher.get_cards(
+        card_names=card_names,
+        max_age=config.SCRYFALL_PRICE_TTL,
+    )
+    # Mongo returns naive UTC datetimes, so they are stored the same way
+    snapshot_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    objects = {}
+    for card in cards.values():
+      if card.get("object") != "card":
+        continue
+      key = CardDatabase.normalise_name(card.get("name", ""))
+      prices = card.get("prices", {})
+      objects[key] = {
+          "card": key,
+          "name": card.get("name"),
+          "snapshot_at": snapshot_at,
+          "usd": cls.parse_price(prices.get("usd")),
+          "usd_foil": cls.parse_price(prices.get("usd_foil")),
+      }
+    if objects:
+      await MongoClient.add_card_price_snapshots(
+          objects=list(objects.values()),
+      )
+    return len(objects)
+
+  @classmethod
+  async def snapshot_scheduled_job(cls) -> None:
+    """Saves the daily price snapshot.
+    """
+    print("Saving card prices snapshot")
+    total = await cls.snapshot_prices()
+    print(f"Saved prices of {total} cards")
+
+  @classmethod
+  async def value_deckbox(cls, deckbox: dict) -> dict:
+    """Adds the card prices and the total value to a cached deckbox list.
+
+    Prices are taken from the latest snapshots and from the local card
+    database for cards without a snapshot.
+
+    Args:
+      deckbox: a dict created by Deckbox.cache_deckbox_list
+    Returns:
+      A dict with the deckbox list with card prices, the total value of the
+      priced cards or None if no card has a price, and the amount of priced
+      cards
+    """
+    # Caching might have failed and returned an error tuple
+    if not isinstance(deckbox, dict):
+      return deckbox
+    cards = deckbox.get("cards", {})
+    keys = {
+        card_name: CardDatabase.normalise_name(card_name)
+        for card_name in cards.keys()
+    }
+    prices = await MongoClient.get_latest_card_prices(
+        cards=list(set(keys.values())),
+    )
+    card_prices = {}
+    for (card_name, key) in keys.items():
+      price = prices.get(key)
+      if price is None:
+        card = CardDatabase.get_exact_card(card_name=card_name)
+        if card:
+          price = cls.parse_price(card.get("prices", {}).get("usd"))
+      if price is not None:
+        card_prices[card_name] = price
+    total = sum(
+        price * cards[card_name] for (card_name, price) in card_prices.items()
+    )
+    deckbox["card_prices"] = card_prices
+    # Lists registered after the last snapshot might have no prices at all
+    deckbox["total_value"] = round(total, 2) if card_prices else None
+    deckbox["priced_cards"] = len(card_prices)
+    deckbox["valued_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return deckbox
+
+  @classmethod
+  def format_price(cls, price: float | None) -> str:
+    """Formats a price for a message.
+
+    Args:
+      price: price in USD or None
+    Returns:
+      A string with the price
+    """
+    return f"${price:.2f}" if price is not None else "n/a"
+
+  @classmethod
+  def format_trend(cls, history: list[dict]) -> str:
+    """Describes how the regular price changed over the history.
+
+    Args:
+      history: price snapshots sorted from the oldest to the newest
+    Returns:
+      A string with the trend or an empty string if there is no trend
+    """
+    prices = [
+        snapshot for snapshot in history if snapshot.get("usd") is not None
+    ]
+    if len(prices) < 2:
+      return ""
+    first = prices[0]
+    last = prices[-1]
+    days = (last["snapshot_at"] - first["snapshot_at"]).days
+    if days < 1 or not first["usd"]:
+      return ""
+    change = (last["usd"] - first["usd"]) / first["usd"] * 100
+    return (
+        f"\n{days} day trend: {change:+.1f}% "
+        f"(from {cls.format_price(first["usd"])})"
+    )
+
+  @classmethod
+  async def resolve_card_name(cls, card_name: str) -> str:
+    """Finds the full name of a card without asking scryfall.
+
+    Args:
+      card_name: name of the card, partial or misspelled
+    Returns:
+      A string with the full name from the scryfall cache or the local card
+      database, or the given name if neither knows the card
+    """
+    key = CardDatabase.normalise_name(card_name)
+    card = ScryfallFetcher.card_cache.get(key=key, count=False)
+    if not card and CardDatabase.is_loaded():
+      card = await CardDatabase.get_card(card_name=card_name)
+    if card and card.get("object") == "card":
+      return card.get("name", card_name)
+    return card_name
+
+  @classmethod
+  async def get_card_prices(cls, card_name: str) -> str:
+    """Creates a message with the card prices and their trend.
+
+    The name is resolved locally and the latest snapshot of the card is used
+    if it's recent enough, otherwise the prices are fetched from scryfall.
+
+    Args:
+      card_name: name of the card
+    Returns:
+      A string with prices or "ambiguous", "not_found" or "unavailable"
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    since = now - timedelta(days=config.PRICE_TREND_DAYS)
+    full_name = await cls.resolve_card_name(card_name=card_name)
+    history = await MongoClient.get_card_price_history(
+        card=CardDatabase.normalise_name(full_name),
+        since=since,
+    )
+    max_age = timedelta(seconds=config.PRICE_SNAPSHOT_MAX_AGE)
+    if history and now - history[-1]["snapshot_at"] < max_age:
+      latest = history[-1]
+      full_name = latest.get("name")
+      (usd, usd_foil) = (latest.get("usd"), latest.get("usd_foil"))
+    else:
+      response = await ScryfallFetcher.get_card(
+          card_name=card_name,
+          max_age=config.SCRYFALL_PRICE_TTL,
+      )
+      if response.get("object") == "error":
+        match response.get("type"):
+          case "ambiguous":
+            return "ambiguous"
+          case "unavailable":
+            return "unavailable"
+          case _:
+            return "not_found"
+      full_name = response.get("name")
+      prices = response.get("prices", {})
+      usd = cls.parse_price(prices.get("usd"))
+      usd_foil = cls.parse_price(prices.get("usd_foil"))
+      history = await MongoClient.get_card_price_history(
+          card=CardDatabase.normalise_name(full_name),
+          since=since,
+      )
+      history.append({"snapshot_at": now, "usd": usd})
+    text = (
+        f"Scryfall prices for '{full_name}':\n"
+        f"Regular: {cls.format_price(usd)}\n"
+        f"Foil: {cls.format_price(usd_foil)}"
+        f"{cls.format_trend(history=history)}"
+    )
+    return text
@@ -0,0 +1,50 @@
+"""Module for limiting the rate of requests to an external API.
+"""
+import asyncio
+import time
+
+
+class RateLimiter:
+  """A token bucket shared by all the coroutines making requests."""
+
+  def __init__(self, rate: float, burst: int):
+    self.rate = rate
+    self.burst = burst
+    self.tokens = float(burst)
+    self.updated_at = time.monotonic()
+    self.paused_until = 0.0
+    self.lock = asyncio.Lock()
+
+  def refill(self) -> None:
+    """Adds the tokens earned since the last refill."""
+    now = time.monotonic()
+    self.tokens = min(
+        self.burst,
+        self.tokens + (now - self.updated_at) * self.rate,
+    )
+    self.updated_at = now
+
+  async def acquire(self) -> None:
+    """Waits until a request can be made and takes a token for it."""
+    # The lock makes the waiting coroutines take tokens in arrival order
+    async with self.lock:
+      while True:
+        pause = self.paused_until - time.monotonic()
+        if pause > 0:
+          await asyncio.sleep(pause)
+          continue
+        self.refill()
+        if self.tokens >= 1:
+          self.tokens -= 1
+          return
+        await asyncio.sleep((1 - self.tokens) / self.rate)
+
+  def pause(self, seconds: float) -> None:
+    """Stops handing out tokens for a while, e.g. after a 429 answer.
+
+    Args:
+      seconds: time in seconds to wait before the next request
+    """
+    self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+    self.tokens = 0.0
+    self.updated_at = self.paused_until
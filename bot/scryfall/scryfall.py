@@ -1,24 +1,319 @@
 """Module for working with scryfall API.
 """
-from bot.config.urls import SCRYFALL_GET_CARD_URL, SCRYFALL_GET_RANDOM_CARD_URL
+import aiohttp
+import asyncio
+import re
+import time
+from bot.config import config
+from bot.config.urls import (
+    SCRYFALL_COLLECTION_URL,
+    SCRYFALL_GET_CARD_URL,
+    SCRYFALL_GET_RANDOM_CARD_URL,
+)
 from bot.config.http_client import HttpClient
+from bot.mongo.mongo_client import MongoClient
+from bot.scryfall.card_cache import CardCache
+from bot.scryfall.card_database import CardDatabase
+from bot.scryfall.rate_limiter import RateLimiter
+from bot.utils.metrics import COUNTER, GAUGE, Metrics
+
+Metrics.define(
+    name="scryfall_cache_lookups_total",
+    kind=COUNTER,
+    description="Card lookups by cache layer and result",
+)
+Metrics.define(
+    name="scryfall_cache_entries",
+    kind=GAUGE,
+    description="Scryfall responses kept in memory",
+)
 
 class ScryfallFetcher:
+  card_cache = CardCache(max_size=config.SCRYFALL_CACHE_SIZE)
+  card_requests = {}
+  rate_limiter = RateLimiter(
+      rate=config.SCRYFALL_REQUESTS_PER_SECOND,
+      burst=config.SCRYFALL_REQUESTS_BURST,
+  )
+
+  @classmethod
+  async def request_json(
+      cls,
+      url: str,
+      payload: dict | None = None,
+  ) -> dict:
+    """Makes a rate limited request to scryfall API.
+
+    Answers with 429 or 5xx status, timeouts and connection errors are retried
+    with an increasing delay.
+
+    Args:
+      url: URL of the request
+      payload: JSON body of a POST request, a GET request is made if None
+    Returns:
+      A dict with the response json or an error dict with "unavailable" type
+      if scryfall couldn't answer
+    """
+    timeout = aiohttp.ClientTimeout(total=config.SCRYFALL_TIMEOUT)
+    status = None
+    details = ""
+    delay = 0
+    for attempt in range(config.SCRYFALL_MAX_RETRIES + 1):
+      if delay:
+        await asyncio.sleep(delay)
+      delay = config.SCRYFALL_RETRY_DELAY * 2 ** attempt
+      await cls.rate_limiter.acquire()
+      try:
+        async with HttpClient.HTTP_SESSION.request(
+            method="POST" if payload else "GET",
+            url=url,
+            json=payload,
+            timeout=timeout,
+        ) as response:
+          status = response.status
+          if status == 429 or status >= 500:
+            details = f"Scryfall answered with status {status}"
+            try:
+              delay = max(delay, float(response.headers.get("Retry-After")))
+            except (TypeError, ValueError):
+              pass
+            # Too many requests slows down everyone sharing the limiter
+            if status == 429:
+              cls.rate_limiter.pause(delay)
+              delay = 0
+            continue
+          try:
+            return await response.json(content_type=None)
+          except ValueError:
+            details = f"Scryfall answered with non-JSON body ({status})"
+            break
+      except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        status = None
+        details = f"Scryfall request failed: {type(e).__name__}"
+    print(f"{details} for {url}")
+    return {
+        "object": "error",
+        "type": "unavailable",
+        "status": status,
+        "details": details,
+    }
 
   @classmethod
-  async def get_card(cls, card_name: str) -> dict | None:
+  async def get_card(
+      cls,
+      card_name: str,
+      max_age: float | None = None,
+  ) -> dict | None:
     """Fetches card info from scryfall API by name
 
     Args:
       card_name: name of the card
+      max_age: maximum age in seconds of a cached response
+    Returns:
+      A dict with card json data
+    """
+    if CardDatabase.is_loaded():
+      card = await CardDatabase.get_card(card_name=card_name)
+      cls.record_cache_lookup(layer="local_db", hit=bool(card))
+      # Cards missing from the local data might be newer than the last refresh
+      if card:
+        return card
+    key = CardDatabase.normalise_name(card_name)
+    cached = await cls.get_cached_card(key=key, max_age=max_age)
+    if cached:
+      return cached
+    if not key:
+      return await cls.fetch_card(card_name=card_name, key=key)
+    # Identical queries that arrive while one is in flight share its result
+    request = cls.card_requests.get(key)
+    if not request:
+      request = asyncio.ensure_future(
+          cls.fetch_card(card_name=card_name, key=key)
+      )
+      cls.card_requests[key] = request
+      request.add_done_callback(lambda _: cls.card_requests.pop(key, None))
+    return await asyncio.shield(request)
+
+  @classmethod
+  async def get_cached_card(
+      cls,
+      key: str,
+      max_age: float | None = None,
+  ) -> dict | None:
+    """Fetches a cached scryfall response from memory or Mongo.
+
+    Args:
+      key: normalised name of the card
+      max_age: maximum age in seconds of a cached response
+    Returns:
+      A dict with card json data or None if it isn't cached
+    """
+    cached = cls.card_cache.get(key=key, max_age=max_age, count=False)
+    cls.record_cache_lookup(layer="memory", hit=cached is not None)
+    # Responses cached by a previous run are loaded from Mongo
+    if not cached and key and config.SCRYFALL_CACHE_PERSISTENT:
+      stored = await MongoClient.get_scryfall_cache(key=key)
+      if stored:
+        cls.card_cache.set(
+            key=key,
+            value=stored.get("response"),
+            ttl=stored.get("ttl"),
+            stored_at=stored.get("stored_at"),
+        )
+        cached = cls.card_cache.get(key=key, max_age=max_age, count=False)
+      cls.record_cache_lookup(layer="mongo", hit=cached is not None)
+    cls.card_cache.record_lookup(hit=cached is not None)
+    Metrics.set("scryfall_cache_entries", len(cls.card_cache.entries))
+    return cached
+
+  @classmethod
+  async def fetch_card(
+      cls,
+      card_name: str,
+      key: str,
+  ) -> dict | None:
+    """Fetches card info from scryfall API and caches the answer.
+
+    Args:
+      card_name: name of the card
+      key: normalised name of the card used as a cache key
     Returns:
       A dict with card json data
     """
     url = SCRYFALL_GET_CARD_URL.format(name=card_name)
-    response = await HttpClient.HTTP_SESSION.get(url=url)
-    response_json = await response.json()
+    response_json = await cls.request_json(url=url)
+    if key:
+      await cls.cache_card(key=key, response_json=response_json)
     return response_json
 
+  @classmethod
+  async def cache_card(
+      cls,
+      key: str,
+      response_json: dict,
+  ) -> None:
+    """Caches a scryfall answer for a card.
+
+    Args:
+      key: normalised name of the card used as a cache key
+      response_json: scryfall answer
+    """
+    # Only cards and "not found" or "ambiguous" answers are cached
+    if response_json.get("object") == "card":
+      ttl = config.SCRYFALL_CARD_TTL
+    elif response_json.get("type") == "unavailable":
+      return
+    elif response_json.get("status") == 404:
+      ttl = config.SCRYFALL_NEGATIVE_TTL
+    else:
+      return
+    stored_at = time.time()
+    cls.card_cache.set(
+        key=key,
+        value=response_json,
+        ttl=ttl,
+        stored_at=stored_at,
+    )
+    if config.SCRYFALL_CACHE_PERSISTENT:
+      await MongoClient.set_scryfall_cache(
+          key=key,
+          response=response_json,
+          stored_at=stored_at,
+          ttl=ttl,
+      )
+
+  @classmethod
+  async def get_cards(
+      cls,
+      card_names: list[str],
+      max_age: float | None = None,
+  ) -> dict:
+    """Fetches info for many cards at once.
+
+    Cards are taken from the local card database and the cache first, the rest
+    are requested from the scryfall collection endpoint in chunks. Names the
+    endpoint doesn't know exactly are looked up one by one with fuzzy search.
+
+    Args:
+      card_names: names of the cards
+      max_age: maximum age in seconds of a cached response
+    Returns:
+      A dict with card names as keys and card json data or error dicts as
+      values
+    """
+    results = {}
+    # Normalised names mapped to all the requested names spelled that way
+    missing = {}
+    for card_name in card_names:
+      if card_name in results:
+        continue
+      key = CardDatabase.normalise_name(card_name)
+      if key in missing:
+        if card_name not in missing[key]:
+          missing[key].append(card_name)
+        continue
+      if CardDatabase.is_loaded():
+        card = await CardDatabase.get_card(card_name=card_name)
+        cls.record_cache_lookup(layer="local_db", hit=bool(card))
+        if card:
+          results[card_name] = card
+          continue
+      cached = await cls.get_cached_card(key=key, max_age=max_age)
+      if cached:
+        results[card_name] = cached
+      elif key:
+        missing[key] = [card_name]
+      else:
+        results[card_name] = {"object": "error", "status": 404}
+    keys = list(missing.keys())
+    fuzzy_keys = []
+    for start in range(0, len(keys), config.SCRYFALL_COLLECTION_SIZE):
+      chunk = keys[start:start + config.SCRYFALL_COLLECTION_SIZE]
+      response_json = await cls.request_json(
+          url=SCRYFALL_COLLECTION_URL,
+          payload={
+              "identifiers": [{"name": missing[key][0]} for key in chunk],
+          },
+      )
+      if response_json.get("object") == "error":
+        for key in chunk:
+          results.update(dict.fromkeys(missing[key], response_json))
+        continue
+      # Cards can be requested by their full name or by any of their faces
+      found = {}
+      for card in response_json.get("data", []):
+        found[CardDatabase.normalise_name(card.get("name", ""))] = card
+        for face in card.get("card_faces", []):
+          found[CardDatabase.normalise_name(face.get("name", ""))] = card
+      for key in chunk:
+        card = found.get(key)
+        if card:
+          await cls.cache_card(key=key, response_json=card)
+          results.update(dict.fromkeys(missing[key], card))
+        else:
+          fuzzy_keys.append(key)
+    fuzzy_cards = await asyncio.gather(*[
+        cls.get_card(card_name=missing[key][0], max_age=max_age)
+        for key in fuzzy_keys
+    ])
+    for (key, card) in zip(fuzzy_keys, fuzzy_cards):
+      results.update(dict.fromkeys(missing[key], card))
+    return results
+
+  @classmethod
+  def record_cache_lookup(cls, layer: str, hit: bool) -> None:
+    """Counts a card lookup in the metrics.
+
+    Args:
+      layer: "local_db", "memory" or "mongo"
+      hit: True if the card was found in the layer
+    """
+    Metrics.increment(
+        "scryfall_cache_lookups_total",
+        layer=layer,
+        result="hit" if hit else "miss",
+    )
+
   @classmethod
   async def get_random_card(
       cls,
@@ -35,14 +330,10 @@ class ScryfallFetcher:
     url = SCRYFALL_GET_RANDOM_CARD_URL
     if non_zero_cmc:
       url += "?q=cmc%3E%3D1"
-    response = await HttpClient.HTTP_SESSION.get(url=url)
-    if response.status == 200:
-      response_json = await response.json()
-      if response_json.get("object") == "card":
-        return response_json
-      return None
-    else:
-      return None
+    response_json = await cls.request_json(url=url)
+    if response_json.get("object") == "card":
+      return response_json
+    return None
 
   @classmethod
   async def get_card_image(
@@ -73,6 +364,8 @@ class ScryfallFetcher:
     response_type = response.get("type")
     if response_object == "error" and response_type == "ambiguous":
       return "ambiguous"
+    elif response_object == "error" and response_type == "unavailable":
+      return "unavailable"
     elif response_object == "error" and not response_type:
       return "not_found"
     faces = response.get("card_faces", None)
@@ -124,6 +417,8 @@ class ScryfallFetcher:
     response_type = response.get("type")
     if response_object == "error" and response_type == "ambiguous":
       return "ambiguous"
+    elif response_object == "error" and response_type == "unavailable":
+      return "unavailable"
     elif response_object == "error" and not response_type:
       return "not_found"
     card_url = None
@@ -132,30 +427,91 @@ class ScryfallFetcher:
     return card_url
 
   @classmethod
-  async def get_card_prices(cls, card_name: str) -> str | None:
-    """Fetches card prices from scryfall API by name
+  def parse_card_line(cls, line: str) -> tuple[int, str]:
+    """Splits a decklist line like "4 Lightning Bolt" or "1x Sol Ring" into
+    the amount and the card name.
 
     Args:
-      card_name: name of the card
+      line: a line of the decklist
     Returns:
-      A string with prices or None if card doesn't exist
+      A tuple with the amount and the card name
     """
-    response = await cls.get_card(card_name=card_name)
-    response_object = response.get("object")
-    response_type = response.get("type")
-    if response_object == "error" and response_type == "ambiguous":
-      return "ambiguous"
-    elif response_object == "error" and not response_type:
-      return "not_found"
-    text = None
-    if response:
-      full_name = response.get("name")
-      scryfall_prices = response.get("prices")
-      usd = scryfall_prices.get("usd")
-      usd_foil = scryfall_prices.get("usd_foil")
-      text = (
-          f"Scryfall prices for '{full_name}':\n"
-          f"Regular: ${usd if usd else "n/a"}\n"
-          f"Foil: ${usd_foil if usd_foil else "n/a"}"
+    match = re.match(r"^(\d+)\s*x?\s+(.+)$", line.strip(), re.IGNORECASE)
+    if match:
+      return (int(match.group(1)), match.group(2).strip())
+    return (1, line.strip())
+
+  @classmethod
+  async def get_cards_prices(cls, card_lines: list[str]) -> list[str]:
+    """Creates a price report for a list of cards.
+
+    Args:
+      card_lines: decklist lines with card names and optional amounts
+    Returns:
+      A list of message strings
+    """
+    amounts = {}
+    max_lines = config.SCRYFALL_BATCH_MAX_CARDS
+    ignored = sum(1 for line in card_lines[max_lines:] if line.strip())
+    for line in card_lines[:max_lines]:
+      (amount, card_name) = cls.parse_card_line(line=line)
+      if card_name:
+        amounts[card_name] = amounts.get(card_name, 0) + amount
+    if not amounts:
+      return ["No cards to check."]
+    cards = await cls.get_cards(
+        card_names=list(amounts.keys()),
+        max_age=config.SCRYFALL_PRICE_TTL,
+    )
+    messages = []
+    message = f"Scryfall prices for {sum(amounts.values())} cards:\n"
+    if ignored:
+      message += (
+          f"Only the first {max_lines} lines are checked, "
+          f"{ignored} lines were ignored\n"
       )
-    return text
+    total = 0.0
+    no_price = 0
+    not_found = []
+    ambiguous = []
+    unavailable = []
+    for (card_name, amount) in amounts.items():
+      card = cards.get(card_name, {})
+      if card.get("object") != "card":
+        match card.get("type"):
+          case "ambiguous":
+            ambiguous.append(card_name)
+          case "unavailable":
+            unavailable.append(card_name)
+          case _:
+            not_found.append(card_name)
+        continue
+      usd = card.get("prices", {}).get("usd")
+      if usd:
+        value = float(usd) * amount
+        total += value
+        message += f"{amount}x {card.get("name")}: ${usd} (${value:.2f})\n"
+      else:
+        no_price += amount
+        message += f"{amount}x {card.get("name")}: n/a\n"
+      if len(message) > 1800:
+        messages.append(message)
+        message = ""
+    summary = [f"\nTotal: ${total:.2f}"]
+    if no_price:
+      summary.append(f"Cards without a price: {no_price}")
+    errors = (
+        ("Not found", not_found),
+        ("Please be more specific", ambiguous),
+        ("Scryfall didn't answer for", unavailable),
+    )
+    for (title, card_names) in errors:
+      if card_names:
+        summary.append(f"{title}: {", ".join(card_names)}")
+    for line in summary:
+      if len(message) + len(line) > 1800:
+        messages.append(message)
+        message = ""
+      message += f"{line}\n"
+    messages.append(message)
+    return messages
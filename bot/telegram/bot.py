@@ -1,12 +1,11 @@
 """Module for running the telegram bot.
 """
 import asyncio
-import json
 import time
 import secrets
 import string
+from collections import OrderedDict
 from datetime import datetime
-from aio_pika import (connect_robust, ExchangeType, Message)
 from telegram import (
     Bot,
     Update,
@@ -17,6 +16,7 @@ from telegram import (
     ChatPermissions
 )
 from telegram.ext import (
+    Application,
     ApplicationBuilder,
     CallbackContext,
     CommandHandler,
@@ -28,7 +28,11 @@ from telegram.ext import (
     PollAnswerHandler,
 )
 from telegram import ReplyKeyboardRemove
+from telegram.error import BadRequest
 from bot.config import config
+from bot.config.rabbitmq_client import RabbitMQClient
+from bot.utils.metrics import Metrics
+from bot.utils.tracing import Trace
 from bot.utils.utils import Utils
 from bot.mongo.mongo_client import MongoClient
 
@@ -38,6 +42,7 @@ class MagicBot:
   dbsearch_input = 0
   consearch_input = 0
   dbwish_input = 0
+  prices_input = 0
   dbsub_input = 0
   dbunsub_input = 0
   dbreg_input = 0
@@ -50,6 +55,11 @@ class MagicBot:
   # Antispam measures
   new_users = {}
   verification_messages = {}
+  # Telegram file IDs of the images that were already sent by URL, the least
+  # recently sent images are evicted first
+  media_file_ids = OrderedDict()
+  # Errors telegram returns for file IDs it can't serve anymore
+  stale_file_id_errors = ("wrong file identifier", "file reference expired")
 
   @classmethod
   async def schedule_user_disapproval(
@@ -69,11 +79,10 @@ class MagicBot:
     """
     await asyncio.sleep(time)
     message_object = {"user_id": user_id, "username": username}
-    message_string = json.dumps(message_object)
     await cls.send_message_to_queue(
         command="disapprove",
         chat_id=chat_id,
-        message_text=message_string,
+        message_text=message_object,
     )
 
   @classmethod
@@ -94,11 +103,10 @@ class MagicBot:
     cls.new_users[user_id] = username
     chat_id = update.effective_chat.id
     message_object = {"user_id": user_id, "username": username}
-    message_string = json.dumps(message_object)
     await cls.send_message_to_queue(
         command="verification",
         chat_id=chat_id,
-        message_text=message_string,
+        message_text=message_object,
     )
     await cls.mute_user(
         context=context,
@@ -126,19 +134,18 @@ class MagicBot:
     if query.data.startswith("answer_"):
       user_id_from_query = int(query.data.split('_')[1])
       message_object = {"user_id": user_id, "username": user.username}
-      message_string = json.dumps(message_object)
       if user_id == user_id_from_query:
         if query.data.endswith("_correct"):
           await cls.send_message_to_queue(
               command="approve",
               chat_id=update.effective_chat.id,
-              message_text=message_string,
+              message_text=message_object,
           )
         else:
           await cls.send_message_to_queue(
               command="disapprove",
               chat_id=update.effective_chat.id,
-              message_text=message_string,
+              message_text=message_object,
           )
       else:
         print("Someone else pressed a button")
@@ -483,7 +490,6 @@ class MagicBot:
         "player_two": all_res[3],
         "result": all_res[2],
       }
-      message_string = json.dumps(message_object)
       await query.edit_message_text(
           text="League match result pending"
       )
@@ -495,7 +501,7 @@ class MagicBot:
       await cls.send_message_to_queue(
           command="league_match_result_send",
           chat_id=update.effective_chat.id,
-          message_text=message_string,
+          message_text=message_object,
       )
     # League result confirmation
     elif query.data.startswith("lryes_"):
@@ -507,14 +513,13 @@ class MagicBot:
         "player_two": all_res[3],
         "result": all_res[2],
       }
-      message_string = json.dumps(message_object)
       await query.edit_message_text(
           text="Thanks for confirming the result!"
       )
       await cls.send_message_to_queue(
           command="league_match_result_confirm",
           chat_id=update.effective_chat.id,
-          message_text=message_string,
+          message_text=message_object,
       )
     # League standings confirmation
     elif query.data.startswith("lsc_"):
@@ -526,11 +531,10 @@ class MagicBot:
           "league_id": result_string,
           "telegram": f"@{username}",
       }
-      message_string = json.dumps(message_object)
       await cls.send_message_to_queue(
           command="league_standings_check",
           chat_id=update.effective_chat.id,
-          message_text=message_string,
+          message_text=message_object,
       )
     # League stats confirmation
     elif query.data.startswith("llc_"):
@@ -542,27 +546,30 @@ class MagicBot:
           "league_id": result_string,
           "telegram": f"@{username}",
       }
-      message_string = json.dumps(message_object)
       await cls.send_message_to_queue(
           command="league_stats_check",
           chat_id=update.effective_chat.id,
-          message_text=message_string,
+          message_text=message_object,
       )
     # League stats confirmation
     elif query.data.startswith("lmc_"):
       result_string = query.data[4:]
+      page = 1
+      if "%" in result_string:
+        (result_string, page_string) = result_string.split("%")
+        page = int(page_string)
       await query.edit_message_text(
-          text="League chosen"
+          text="League chosen" if page == 1 else f"Page {page} chosen"
       )
       message_object = {
           "league_id": result_string,
           "telegram": f"@{username}",
+          "page": page,
       }
-      message_string = json.dumps(message_object)
       await cls.send_message_to_queue(
           command="league_matches_check",
           chat_id=update.effective_chat.id,
-          message_text=message_string,
+          message_text=message_object,
       )
 
   @classmethod
@@ -677,6 +684,42 @@ class MagicBot:
         disable_web_page_preview=disable_preview,
     )
 
+  @classmethod
+  async def send_broadcast_message(
+      cls,
+      chat_ids: list[str],
+      message: str,
+      disable_preview: bool = True,
+  ) -> int:
+    """Sends the same message to several chats at once.
+
+    A failed chat is only logged and doesn't stop the delivery to the others.
+
+    Args:
+      chat_ids: ids of the chats to send the message to
+      message: message that will be sent to the chats
+      disable_preview: set true to disable previews of pages
+    Returns:
+      An int with the amount of chats the message was delivered to
+    """
+    semaphore = asyncio.Semaphore(config.BROADCAST_CONCURRENCY)
+
+    async def deliver(chat_id: str) -> bool:
+      async with semaphore:
+        try:
+          await cls.send_message_to_user(
+              chat_id=chat_id,
+              message=message,
+              disable_preview=disable_preview,
+          )
+          return True
+        except Exception as e:
+          print(f"Broadcast to {chat_id} failed: {e}")
+          return False
+
+    results = await asyncio.gather(*(deliver(chat_id) for chat_id in chat_ids))
+    return sum(results)
+
   @classmethod
   async def forward_message_to_chat(
       cls,
@@ -851,6 +894,43 @@ class MagicBot:
         disable_web_page_preview=disable_preview,
     )
 
+  @classmethod
+  async def send_league_matches_to_user(
+      cls,
+      chat_id: str,
+      message: str,
+      league_id: str,
+      page: int,
+      pages: int,
+  ) -> None:
+    """Sends a page of league matches with buttons to switch pages.
+
+    Args:
+      chat_id: id of the chat with the user
+      message: message that will be sent to the user
+      league_id: ID of the league
+      page: number of the current page
+      pages: total amount of pages
+    """
+    buttons = []
+    if page > 1:
+      buttons.append(InlineKeyboardButton(
+          text="Previous",
+          callback_data=f"lmc_{league_id}%{page - 1}",
+      ))
+    if page < pages:
+      buttons.append(InlineKeyboardButton(
+          text="Next",
+          callback_data=f"lmc_{league_id}%{page + 1}",
+      ))
+    reply_markup = InlineKeyboardMarkup([buttons]) if buttons else None
+    await cls.bot.send_message(
+        chat_id=chat_id,
+        text=message,
+        parse_mode="HTML",
+        reply_markup=reply_markup,
+    )
+
   @classmethod
   async def send_league_match_confirmation_to_user(
       cls,
@@ -917,6 +997,17 @@ class MagicBot:
     poll_id = poll_message.poll.id
     now = datetime.now()
     datetime_string = now.strftime("%Y-%m-%d")
+    # Every venue keeps its own voters, matched by the index of its answer
+    venues = []
+    for venue in config.EDH_DANAS_VENUES:
+      if venue.get("answer") in answers:
+        venues.append({
+            "key": venue.get("key"),
+            "name": venue.get("name"),
+            "option": answers.index(venue.get("answer")),
+            "voters": [],
+            "alerted": [],
+        })
     edh_danas_object = {
       "chat_id": chat_id,
       "message_id": message_id,
@@ -924,14 +1015,8 @@ class MagicBot:
       "poll_id": poll_id,
       "timestamp": datetime_string,
       "all_voters": [],
-      "ravnica_yes_voters": [],
-      "underground_yes_voters": [],
-      "dice_arena_yes_voters": [],
-      "nbg_yes_voters": [],
-      "ravnica_alerted": [],
-      "underground_alerted": [],
-      "dice_arena_alerted": [],
-      "nbg_alerted": [],
+      "min_players": config.EDH_DANAS_MIN_PLAYERS,
+      "venues": venues,
     }
     result = await MongoClient.add_edh_danas(object=edh_danas_object)
     return result
@@ -990,6 +1075,34 @@ class MagicBot:
     )
     return cls.search_input
 
+  @classmethod
+  async def start_bulk_price_check(
+      cls,
+      update: Update,
+      context: ContextTypes.DEFAULT_TYPE,
+  ) -> int:
+    """Handles opening the input for checking prices of cards.
+
+    Args:
+      update: telegram-bot parameter
+      context: telegram-bot parameter
+    Returns:
+      An input ID
+    """
+    if update.effective_chat.type != "private":
+      return
+    result_text = (
+      "Please enter the list of cards to check prices for.\n"
+      "Each card must be on a separate line, amounts like '4 Lightning Bolt'"
+      " are supported.\n"
+      "To cancel the command type /cancel.\n"
+    )
+    await update.message.reply_text(
+        result_text,
+        reply_markup=ReplyKeyboardRemove(),
+    )
+    return cls.prices_input
+
   @classmethod
   async def start_conflux_search(
       cls,
@@ -1126,12 +1239,11 @@ class MagicBot:
             "cards": cards,
             "deckboxes": deckboxes,
         }
-      message_string = json.dumps(message_object)
       await update.message.reply_text("Searching...")
       await cls.send_message_to_queue(
           command="dbsearch",
           chat_id=update.effective_chat.id,
-          message_text=message_string,
+          message_text=message_object,
       )
     return ConversationHandler.END
 
@@ -1212,11 +1324,10 @@ class MagicBot:
             "telegram": username,
             "deckbox": line,
         }
-        message_string = json.dumps(message_object)
         await cls.send_message_to_queue(
             command="dbsub",
             chat_id=update.effective_chat.id,
-            message_text=message_string,
+            message_text=message_object,
         )
     return ConversationHandler.END
 
@@ -1242,11 +1353,10 @@ class MagicBot:
           "username": username,
           "message_id": message_id,
       }
-      message_string = json.dumps(message_object)
       await cls.send_message_to_queue(
           command="quiz_answer",
           chat_id=update.effective_chat.id,
-          message_text=message_string,
+          message_text=message_object,
       )
 
   @classmethod
@@ -1273,14 +1383,39 @@ class MagicBot:
             "telegram": username,
             "deckbox": line,
         }
-        message_string = json.dumps(message_object)
         await cls.send_message_to_queue(
             command="dbunsub",
             chat_id=update.effective_chat.id,
-            message_text=message_string,
+            message_text=message_object,
         )
     return ConversationHandler.END
 
+  @classmethod
+  async def handle_bulk_price_check(
+      cls,
+      update: Update,
+      context: CallbackContext
+  ) -> int:
+    """Processes the input for checking prices of cards.
+
+    Args:
+      update: telegram-bot parameter
+      context: telegram-bot parameter
+    Returns:
+      A conversation handler that stops the conversation with the user
+    """
+    if update.effective_chat.type == "private":
+      user_input = update.message.text
+      lines = [line.strip() for line in user_input.split("\n") if line.strip()]
+      message_object = {"cards": lines}
+      await update.message.reply_text("Checking prices...")
+      await cls.send_message_to_queue(
+          command="prices",
+          chat_id=update.effective_chat.id,
+          message_text=message_object,
+      )
+    return ConversationHandler.END
+
   @classmethod
   async def handle_bulk_card_search(
       cls,
@@ -1305,7 +1440,6 @@ class MagicBot:
             "cards": lines,
             "search": "all",
         }
-      message_string = json.dumps(message_object)
       await update.message.reply_text("Searching...")
       user_store_subs = await MongoClient.get_user_store_subscriptions(
           telegram=f"@{username}"
@@ -1314,13 +1448,13 @@ class MagicBot:
         await cls.send_message_to_queue(
             command="consearch",
             chat_id=update.effective_chat.id,
-            message_text=message_string,
+            message_text=message_object,
         )
         await asyncio.sleep(len(lines) / 10)
       await cls.send_message_to_queue(
           command="search",
           chat_id=update.effective_chat.id,
-          message_text=message_string,
+          message_text=message_object,
       )
     return ConversationHandler.END
 
@@ -1348,12 +1482,11 @@ class MagicBot:
             "cards": lines,
             "search": "conflux",
         }
-      message_string = json.dumps(message_object)
       await update.message.reply_text("Searching...")
       await cls.send_message_to_queue(
           command="consearch",
           chat_id=update.effective_chat.id,
-          message_text=message_string,
+          message_text=message_object,
       )
     return ConversationHandler.END
 
@@ -1376,7 +1509,6 @@ class MagicBot:
           "telegram": username,
           "search": "main",
       }
-      message_string = json.dumps(message_object)
       await update.message.reply_text("Searching...")
       user_store_subs = await MongoClient.get_user_store_subscriptions(
           telegram=f"@{username}"
@@ -1402,7 +1534,7 @@ class MagicBot:
       await cls.send_message_to_queue(
           command="wish",
           chat_id=update.effective_chat.id,
-          message_text=message_string,
+          message_text=message_object,
       )
 
   @classmethod
@@ -1427,12 +1559,11 @@ class MagicBot:
           "search": "deckbox",
           "deckboxes": lines,
       }
-      message_string = json.dumps(message_object)
       await update.message.reply_text("Searching...")
       await cls.send_message_to_queue(
           command="dbwish",
           chat_id=update.effective_chat.id,
-          message_text=message_string,
+          message_text=message_object,
       )
       return ConversationHandler.END
 
@@ -1481,6 +1612,71 @@ class MagicBot:
     )
     return ConversationHandler.END
 
+  @classmethod
+  async def send_photo_cached(
+      cls,
+      chat_id: str,
+      image_url: str,
+      **kwargs,
+  ):
+    """Sends a photo reusing the file ID telegram returned the last time the
+    same image was sent, so telegram doesn't download it again.
+
+    Args:
+      chat_id: id of the chat with the user
+      image_url: url of the image that will be sent to the user
+      kwargs: other parameters of the telegram send_photo call
+    Returns:
+      A telegram message with the photo
+    """
+    file_id = cls.media_file_ids.get(image_url)
+    if file_id:
+      cls.media_file_ids.move_to_end(image_url)
+    else:
+      file_id = await MongoClient.get_media_file_id(url=image_url)
+    if file_id:
+      try:
+        message = await cls.bot.send_photo(
+            chat_id=chat_id,
+            photo=file_id,
+            **kwargs,
+        )
+        cls.remember_file_id(image_url=image_url, file_id=file_id)
+        return message
+      except BadRequest as e:
+        if not any(
+            error in str(e).lower() for error in cls.stale_file_id_errors
+        ):
+          raise
+        # The file ID is no longer valid, the image is sent by URL again
+        print(f"Cached file ID for {image_url} failed: {e}")
+        cls.media_file_ids.pop(image_url, None)
+        await MongoClient.delete_media_file_id(url=image_url)
+    message = await cls.bot.send_photo(
+        chat_id=chat_id,
+        photo=image_url,
+        **kwargs,
+    )
+    if message.photo:
+      # The largest size is the one telegram made from the original image
+      file_id = message.photo[-1].file_id
+      cls.remember_file_id(image_url=image_url, file_id=file_id)
+      await MongoClient.set_media_file_id(url=image_url, file_id=file_id)
+    return message
+
+  @classmethod
+  def remember_file_id(cls, image_url: str, file_id: str) -> None:
+    """Keeps the file ID of a sent image in memory.
+
+    Args:
+      image_url: url of the sent image
+      file_id: telegram file ID of the image
+    """
+    cls.media_file_ids[image_url] = file_id
+    cls.media_file_ids.move_to_end(image_url)
+    if len(cls.media_file_ids) > config.MEDIA_CACHE_SIZE:
+      cls.media_file_ids.popitem(last=False)
+
   @classmethod
   async def send_image_to_user(
       cls,
@@ -1495,9 +1691,9 @@ class MagicBot:
       image_url: url of the image that will be sent to the user
       message_thread_id: ID of the thread in the group
     """
-    await cls.bot.send_photo(
+    await cls.send_photo_cached(
         chat_id=chat_id,
-        photo=image_url,
+        image_url=image_url,
         message_thread_id=message_thread_id,
     )
 
@@ -1530,9 +1726,9 @@ class MagicBot:
         [InlineKeyboardButton(answer, callback_data=f"answer_{user_id}_{random_string}{'_correct' if answer == correct else ''}")]
       )
     keyboard_markup = InlineKeyboardMarkup(keyboard)
-    message = await cls.bot.send_photo(
+    message = await cls.send_photo_cached(
         chat_id=chat_id,
-        photo=image_url,
+        image_url=image_url,
         message_thread_id=message_thread_id,
         caption=(
             f"@{username} Добро пожаловать в группу Magic the Gathering в Белграде!\n"
@@ -1557,7 +1753,7 @@ class MagicBot:
       chat_id: id of the chat with the user
       image_url: url of the image that will be sent to the user
     """
-    reply = await cls.bot.send_photo(chat_id=chat_id, photo=image_url)
+    reply = await cls.send_photo_cached(chat_id=chat_id, image_url=image_url)
     reply_message_id = reply.message_id
     await MongoClient.add_quiz_object(
         card_name=card_name,
@@ -1569,7 +1765,7 @@ class MagicBot:
       cls,
       command: str,
       chat_id: str,
-      message_text: str,
+      message_text: str | dict,
       message_thread_id: str | None = None,
   ) -> None:
     """Sends a message to a "from-user" rabbitmq queue.
@@ -1577,26 +1773,26 @@ class MagicBot:
     Args:
       command: name of the command that should be processed
       chat_id: id of the chat with the user
-      message_text: message that will be sent to the user
+      message_text: message text or a dict with command data
       message_thread_id: ID of the thread in the group
     """
+    start = time.perf_counter()
     message = Utils.generate_outgoing_message(
         command=command,
         chat_id=chat_id,
         message_thread_id=message_thread_id,
         message_text=message_text,
+        trace=Trace.new_context(command=command),
     )
-    connection = await connect_robust(**config.AIO_PIKA_PARAMETERS)
-    channel = await connection.channel()
-    exchange = await channel.declare_exchange(
-        name="bot-exchange",
-        type=ExchangeType.DIRECT,
-    )
-    await exchange.publish(
-        message=Message(body=message),
+    await RabbitMQClient.publish(
+        message=message,
         routing_key=config.FROM_USER_QUEUE_NAME,
     )
-    await connection.close()
+    Metrics.observe(
+        "command_publish_seconds",
+        time.perf_counter() - start,
+        command=command,
+    )
 
   @classmethod
   async def any_message_handler(
@@ -1737,21 +1933,15 @@ class MagicBot:
     message_object = {
         "message": "EDH danas?",
         "options": [
-            "Da, Ravnica",
-            "Da, Underground",
-            "Da, Dice Arena",
-            "Da, Groot/3D",
-            "Ne",
-            "Ne znam",
-        ],
+            venue.get("answer") for venue in config.EDH_DANAS_VENUES
+        ] + config.EDH_DANAS_OTHER_OPTIONS,
         "chat_type": chat_type,
     }
-    message_string = json.dumps(message_object)
     await cls.send_message_to_queue(
         command="edhdanas",
         chat_id=update.effective_chat.id,
         message_thread_id=update.message.message_thread_id,
-        message_text=message_string,
+        message_text=message_object,
     )
 
   @classmethod
@@ -1798,11 +1988,10 @@ class MagicBot:
           "telegram": username,
           "deckbox": deckbox,
       }
-      message_string = json.dumps(message_object)
       await cls.send_message_to_queue(
           command="regdeckbox",
           chat_id=update.effective_chat.id,
-          message_text=message_string,
+          message_text=message_object,
       )
       return ConversationHandler.END
 
@@ -2081,11 +2270,10 @@ class MagicBot:
         "telegram": username,
         "store": "conflux",
     }
-    message_string = json.dumps(message_object)
     await cls.send_message_to_queue(
         command="confluxsub",
         chat_id=update.effective_chat.id,
-        message_text=message_string,
+        message_text=message_object,
     )
 
   @classmethod
@@ -2108,11 +2296,10 @@ class MagicBot:
         "telegram": username,
         "store": "conflux",
     }
-    message_string = json.dumps(message_object)
     await cls.send_message_to_queue(
         command="confluxunsub",
         chat_id=update.effective_chat.id,
-        message_text=message_string,
+        message_text=message_object,
     )
 
   @classmethod
@@ -2146,11 +2333,10 @@ class MagicBot:
         "league_name": league_name,
         "league_length": league_length,
     }
-    message_string = json.dumps(message_object)
     await cls.send_message_to_queue(
         command="league_create",
         chat_id=update.effective_chat.id,
-        message_text=message_string,
+        message_text=message_object,
     )
 
   @classmethod
@@ -2184,11 +2370,10 @@ class MagicBot:
         "league_id": league_id,
         "status": status,
     }
-    message_string = json.dumps(message_object)
     await cls.send_message_to_queue(
         command="league_status_change",
         chat_id=update.effective_chat.id,
-        message_text=message_string,
+        message_text=message_object,
     )
 
   @classmethod
@@ -2218,11 +2403,10 @@ class MagicBot:
           "league_id": league_id,
           "chat_id": update.effective_chat.id,
       }
-    message_string = json.dumps(message_object)
     await cls.send_message_to_queue(
         command="league_subscribe",
         chat_id=update.effective_chat.id,
-        message_text=message_string,
+        message_text=message_object,
     )
 
   @classmethod
@@ -2252,11 +2436,10 @@ class MagicBot:
           "league_id": league_id,
           "chat_id": update.effective_chat.id,
       }
-    message_string = json.dumps(message_object)
     await cls.send_message_to_queue(
         command="league_unsubscribe",
         chat_id=update.effective_chat.id,
-        message_text=message_string,
+        message_text=message_object,
     )
 
   @classmethod
@@ -2281,6 +2464,7 @@ class MagicBot:
     split_message = message_text.split("/invite ")
     if len(split_message) < 2:
       return
+    # League ID can be followed by the amount of invites to create
     league_id = split_message[1]
     await cls.send_message_to_queue(
         command="league_invite",
@@ -2367,11 +2551,10 @@ class MagicBot:
             "league_id": league_id,
             "league_user": league_user,
         }
-      message_string = json.dumps(message_object)
       await cls.send_message_to_queue(
           command="league_user_reg",
           chat_id=update.effective_chat.id,
-          message_text=message_string,
+          message_text=message_object,
       )
     return ConversationHandler.END
 
@@ -2487,15 +2670,12 @@ class MagicBot:
     poll_id = update.poll_answer.poll_id
     user_id = poll_answer.user.id
     options = poll_answer.option_ids
-    check = await MongoClient.check_if_edhdanas_exists(
-        poll_id=poll_id
+    poll = await MongoClient.update_edhdanas(
+        poll_id=poll_id,
+        user_id=user_id,
+        votes=options,
     )
-    if check:
-      await MongoClient.update_edhdanas(
-          poll_id=poll_id,
-          user_id=user_id,
-          votes=options,
-      )
+    if poll:
       users_to_alert = await MongoClient.check_edhdanas_completed_pods(
           poll_id=poll_id,
       )
@@ -2506,6 +2686,15 @@ class MagicBot:
             message_text=user_tuple[1],
         )
 
+  @classmethod
+  async def start_metrics_server(cls, app: Application) -> None:
+    """Starts serving metrics once the bot application is initialized.
+
+    Args:
+      app: telegram-bot application
+    """
+    await Metrics.start_server()
+
   @classmethod
   def run_bot(cls):
     """A function that creates command handlers and runs the bot.
@@ -2538,6 +2727,13 @@ class MagicBot:
         },
         fallbacks=[CommandHandler("cancel", cls.cancel_conversation)]
     )
+    card_prices_handler = ConversationHandler(
+        entry_points=[CommandHandler("prices", cls.start_bulk_price_check)],
+        states={cls.prices_input: [MessageHandler(
+            filters.TEXT & ~filters.COMMAND, cls.handle_bulk_price_check)]
+        },
+        fallbacks=[CommandHandler("cancel", cls.cancel_conversation)]
+    )
     conflux_search_handler = ConversationHandler(
         entry_points=[CommandHandler("consearch", cls.start_conflux_search)],
         states={cls.consearch_input: [MessageHandler(
@@ -2591,7 +2787,12 @@ class MagicBot:
         },
         fallbacks=[CommandHandler('cancel', cls.cancel_conversation)]
     )
-    app = ApplicationBuilder().token(token=config.BOT_TOKEN).build()
+    app = (
+        ApplicationBuilder()
+        .token(token=config.BOT_TOKEN)
+        .post_init(cls.start_metrics_server)
+        .build()
+    )
     app.add_handler(league_match_handler)
     app.add_handler(CallbackQueryHandler(
       callback=cls.verify,
@@ -2602,6 +2803,7 @@ class MagicBot:
     app.add_handler(deckbox_bulk_unsubscribe_handler)
     app.add_handler(deckbox_register_handler)
     app.add_handler(card_search_handler)
+    app.add_handler(card_prices_handler)
     app.add_handler(conflux_search_handler)
     app.add_handler(deckbox_search_handler)
     app.add_handler(deckbox_wish_handler)
@@ -0,0 +1,160 @@
+"""Module for registering queue command handlers and dispatching commands to
+them.
+"""
+import asyncio
+import inspect
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+from bot.utils.metrics import COUNTER, HISTOGRAM, Metrics
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+ADMIN = "admin"
+
+Metrics.define(
+    name="registry_commands_total",
+    kind=COUNTER,
+    description="Dispatched commands by registry, command and status",
+)
+Metrics.define(
+    name="registry_command_seconds",
+    kind=HISTOGRAM,
+    description="Time the command handlers took, priority waits excluded",
+)
+
+
+@dataclass(slots=True)
+class Command:
+  """A registered command with its handler."""
+  name: str
+  handler: Callable
+  parameters: frozenset
+  payload: type | None
+  priority: str
+
+
+@dataclass
+class CommandRegistry:
+  """Maps command names to handlers declared with the command decorator.
+
+  Handlers receive only the dispatched arguments their signature accepts.
+  Commands of a priority class with a limit share a semaphore, so slow bulk
+  commands can't take over the listener.
+  """
+  name: str
+  payload_argument: str
+  limits: dict = field(default_factory=dict)
+  commands: dict = field(default_factory=dict)
+  semaphores: dict = field(default_factory=dict)
+
+  def command(
+      self,
+      *names: str,
+      payload: type | None = str,
+      priority: str = INTERACTIVE,
+  ) -> Callable:
+    """Registers a function as the handler of the commands.
+
+    The decorator goes under @classmethod, the class is passed to the handler
+    by dispatch.
+
+    Args:
+      names: names of the commands handled by the function
+      payload: expected type of the payload argument, None if it isn't used
+      priority: priority class of the commands
+    Returns:
+      A decorator returning the function unchanged
+    """
+    def decorator(function: Callable) -> Callable:
+      parameters = frozenset(inspect.signature(function).parameters)
+      for name in names:
+        if name in self.commands:
+          raise ValueError(f"Command {name} is already registered")
+        self.commands[name] = Command(
+            name=name,
+            handler=function,
+            parameters=parameters,
+            payload=payload,
+            priority=priority,
+        )
+      return function
+    return decorator
+
+  def has(self, name: str) -> bool:
+    """Checks if a command is registered.
+
+    Args:
+      name: name of the command
+    Returns:
+      True if the command has a handler
+    """
+    return name in self.commands
+
+  def check_payload(self, command: Command, arguments: dict) -> None:
+    """Checks the payload argument against the type declared by the command.
+
+    Args:
+      command: the registered command
+      arguments: arguments of the dispatched command
+    Raises:
+      ValueError: if the payload doesn't match the declared type
+    """
+    payload = arguments.get(self.payload_argument)
+    if command.payload is None or payload is None:
+      return
+    # Dict payloads used to be sent as JSON strings
+    if command.payload is dict and isinstance(payload, str):
+      payload = json.loads(payload)
+      arguments[self.payload_argument] = payload
+    if not isinstance(payload, command.payload):
+      raise ValueError(
+          f"Command {command.name} expects {command.payload.__name__} "
+          f"payload, got {type(payload).__name__}"
+      )
+
+  async def dispatch(self, owner: type, name: str, **arguments):
+    """Runs the handler of a command and updates its metrics.
+
+    Commands with a payload of the wrong type are logged and dropped.
+
+    Args:
+      owner: class the handler is defined in
+      name: name of the command
+      arguments: arguments available to the handler
+    Returns:
+      The value returned by the handler or None if the command was dropped
+    """
+    command = self.commands[name]
+    labels = {"registry": self.name, "command": name}
+    try:
+      self.check_payload(command=command, arguments=arguments)
+    except ValueError as e:
+      print(f"Dropped {self.name} command {name}: {e}")
+      Metrics.increment("registry_commands_total", status="dropped", **labels)
+      return None
+    semaphore = self.semaphores.get(command.priority)
+    limit = self.limits.get(command.priority)
+    if semaphore is None and limit:
+      semaphore = asyncio.Semaphore(limit)
+      self.semaphores[command.priority] = semaphore
+    status = "ok"
+    start = time.perf_counter()
+    try:
+      handler_arguments = {
+          key: value for (key, value) in arguments.items()
+          if key in command.parameters
+      }
+      if semaphore:
+        async with semaphore:
+          start = time.perf_counter()
+          return await command.handler(owner, **handler_arguments)
+      return await command.handler(owner, **handler_arguments)
+    except Exception:
+      status = "error"
+      raise
+    finally:
+      elapsed = time.perf_counter() - start
+      Metrics.increment("registry_commands_total", status=status, **labels)
+      Metrics.observe("registry_command_seconds", elapsed, **labels)
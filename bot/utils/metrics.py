@@ -0,0 +1,215 @@
+"""Module for collecting metrics and serving them in the Prometheus text
+format.
+"""
+import bisect
+import threading
+from aiohttp import web
+from bot.config import config
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60,
+)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metrics:
+  # Metric names mapped to their type, description and buckets
+  definitions = {}
+  # Metric names mapped to dicts with label tuples as keys
+  values = {}
+  # Metrics are also updated from the threads running Mongo commands
+  lock = threading.Lock()
+  runner = None
+
+  @classmethod
+  def define(
+      cls,
+      name: str,
+      kind: str,
+      description: str,
+      buckets: tuple = DEFAULT_BUCKETS,
+  ) -> None:
+    """Declares a metric, declaring it again does nothing.
+
+    Args:
+      name: name of the metric
+      kind: "counter", "gauge" or "histogram"
+      description: text shown in the HELP line
+      buckets: upper bounds of the buckets of a histogram
+    """
+    if name in cls.definitions:
+      return
+    cls.definitions[name] = {
+        "kind": kind,
+        "description": description,
+        "buckets": tuple(buckets),
+    }
+    cls.values[name] = {}
+
+  @classmethod
+  def labels_key(cls, labels: dict) -> tuple:
+    """Converts labels into a key of the metric values.
+
+    Args:
+      labels: a dict with label names and values
+    Returns:
+      A tuple of label pairs sorted by name
+    """
+    return tuple(sorted((key, str(value)) for (key, value) in labels.items()))
+
+  @classmethod
+  def increment(cls, name: str, value: float = 1, **labels) -> None:
+    """Increases a counter.
+
+    Args:
+      name: name of the counter
+      value: amount to add
+      labels: labels of the counter
+    """
+    key = cls.labels_key(labels)
+    with cls.lock:
+      values = cls.values[name]
+      values[key] = values.get(key, 0) + value
+
+  @classmethod
+  def set(cls, name: str, value: float, **labels) -> None:
+    """Sets the value of a gauge.
+
+    Args:
+      name: name of the gauge
+      value: new value
+      labels: labels of the gauge
+    """
+    key = cls.labels_key(labels)
+    with cls.lock:
+      cls.values[name][key] = value
+
+  @classmethod
+  def observe(cls, name: str, value: float, **labels) -> None:
+    """Adds an observation to a histogram.
+
+    Args:
+      name: name of the histogram
+      value: observed value, seconds for latencies
+      labels: labels of the histogram
+    """
+    buckets = cls.definitions[name]["buckets"]
+    key = cls.labels_key(labels)
+    with cls.lock:
+      values = cls.values[name]
+      histogram = values.get(key)
+      if histogram is None:
+        histogram = {"buckets": [0] * len(buckets), "sum": 0.0, "count": 0}
+        values[key] = histogram
+      index = bisect.bisect_left(buckets, value)
+      if index < len(buckets):
+        histogram["buckets"][index] += 1
+      histogram["sum"] += value
+      histogram["count"] += 1
+
+  @classmethod
+  def format_labels(cls, key: tuple, extra: tuple = ()) -> str:
+    """Formats labels for an exposition line.
+
+    Args:
+      key: label pairs of the value
+      extra: label pairs added after them, e.g. the bucket bound
+    Returns:
+      A string with the labels in braces or an empty string
+    """
+    pairs = key + extra
+    if not pairs:
+      return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace("\n", "\\n")
+         .replace('"', '\\"'))
+        for (name, value) in pairs
+    )
+    labels = ",".join(f'{name}="{value}"' for (name, value) in escaped)
+    return "{" + labels + "}"
+
+  @classmethod
+  def format_bound(cls, bound: float) -> str:
+    """Formats a bucket bound.
+
+    Args:
+      bound: upper bound of the bucket
+    Returns:
+      A string with the bound
+    """
+    return repr(float(bound))
+
+  @classmethod
+  def render(cls) -> str:
+    """Renders all the metrics in the Prometheus text format.
+
+    Returns:
+      A string with the exposition
+    """
+    lines = []
+    with cls.lock:
+      for (name, definition) in cls.definitions.items():
+        kind = definition["kind"]
+        lines.append(f"# HELP {name} {definition['description']}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (key, value) in cls.values[name].items():
+          if kind != HISTOGRAM:
+            lines.append(f"{name}{cls.format_labels(key)} {value}")
+            continue
+          cumulative = 0
+          for (bound, count) in zip(definition["buckets"], value["buckets"]):
+            cumulative += count
+            labels = cls.format_labels(key, (("le", cls.format_bound(bound)),))
+            lines.append(f"{name}_bucket{labels} {cumulative}")
+          labels = cls.format_labels(key, (("le", "+Inf"),))
+          lines.append(f"{name}_bucket{labels} {value['count']}")
+          lines.append(f"{name}_sum{cls.format_labels(key)} {value['sum']}")
+          lines.append(f"{name}_count{cls.format_labels(key)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+  @classmethod
+  async def handle_metrics(cls, request: web.Request) -> web.Response:
+    """Answers a scrape of the /metrics endpoint.
+
+    Args:
+      request: aiohttp request
+    Returns:
+      A response with the rendered metrics
+    """
+    return web.Response(
+        body=cls.render().encode("UTF-8"),
+        headers={"Content-Type": CONTENT_TYPE},
+    )
+
+  @classmethod
+  async def start_server(cls, port: int | None = None) -> None:
+    """Starts serving the /metrics endpoint if metrics are enabled.
+
+    Args:
+      port: port to listen on, the configured one if None
+    """
+    if not config.METRICS_ENABLED or cls.runner:
+      return
+    app = web.Application()
+    app.router.add_get("/metrics", cls.handle_metrics)
+    cls.runner = web.AppRunner(app, access_log=None)
+    await cls.runner.setup()
+    site = web.TCPSite(
+        runner=cls.runner,
+        host="0.0.0.0",
+        port=port or config.METRICS_PORT,
+    )
+    await site.start()
+    print(f"Serving metrics on port {port or config.METRICS_PORT}")
+
+  @classmethod
+  async def stop_server(cls) -> None:
+    """Stops serving the /metrics endpoint.
+    """
+    if cls.runner:
+      await cls.runner.cleanup()
+    cls.runner = None
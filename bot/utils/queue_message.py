@@ -0,0 +1,160 @@
+"""Module for encoding and decoding the messages passed through RabbitMQ.
+"""
+import json
+import sys
+import timeit
+from dataclasses import dataclass, field
+from bot.config import config
+
+try:
+  import msgpack
+except ImportError:
+  msgpack = None
+
+SCHEMA_VERSION = 2
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+
+
+@dataclass(slots=True)
+class QueueMessage:
+  """A message passed between the bot, the backend and the listeners.
+
+  The text can be a string or a dict/list payload, so structured payloads are
+  encoded together with the message instead of being a nested JSON string.
+  The trace carries the correlation ID and timestamps of the command the
+  message belongs to.
+  """
+  command: str
+  chat_id: str | int | None
+  text: str | dict | list | None = ""
+  message_thread_id: str | int | None = None
+  bot_type: str = "telegram"
+  options: dict = field(default_factory=dict)
+  trace: dict | None = None
+  version: int = SCHEMA_VERSION
+
+  @classmethod
+  def content_type(cls) -> str:
+    """Returns the content type of the configured codec.
+
+    Returns:
+      A string with the AMQP content type
+    """
+    if config.QUEUE_MESSAGE_CODEC == "msgpack" and msgpack:
+      return MSGPACK_CONTENT_TYPE
+    return JSON_CONTENT_TYPE
+
+  def encode(self, content_type: str | None = None) -> bytes:
+    """Encodes the message.
+
+    Args:
+      content_type: content type to encode with, the configured one if None
+    Returns:
+      The message encoded into bytes
+    """
+    content_type = content_type or self.content_type()
+    # dataclasses.asdict deep copies the payload, a shallow dict is enough
+    data = {
+        "command": self.command,
+        "chat_id": self.chat_id,
+        "text": self.text,
+        "message_thread_id": self.message_thread_id,
+        "bot_type": self.bot_type,
+        "options": self.options,
+        "trace": self.trace,
+        "version": self.version,
+    }
+    if content_type == MSGPACK_CONTENT_TYPE:
+      return msgpack.packb(data)
+    return json.dumps(data, separators=(",", ":")).encode("UTF-8")
+
+  @classmethod
+  def decode(
+      cls,
+      body: bytes,
+      content_type: str | None = None,
+  ) -> "QueueMessage":
+    """Decodes a message received from a queue.
+
+    Args:
+      body: body of the message
+      content_type: AMQP content type of the message, JSON if None
+    Returns:
+      A decoded message
+    Raises:
+      ValueError: if the body can't be decoded
+    """
+    if content_type == MSGPACK_CONTENT_TYPE:
+      if msgpack is None:
+        raise ValueError("msgpack message received but msgpack isn't installed")
+      data = msgpack.unpackb(body)
+    else:
+      data = json.loads(body)
+    if not isinstance(data, dict):
+      raise ValueError(f"Message body is {type(data).__name__}, not a dict")
+    # Messages published before the envelope existed have no version
+    version = data.get("version", 0)
+    if version > SCHEMA_VERSION:
+      print(f"Message schema version {version} is newer than {SCHEMA_VERSION}")
+    return cls(
+        command=data.get("command", ""),
+        chat_id=data.get("chat_id"),
+        text=data.get("text", ""),
+        message_thread_id=data.get("message_thread_id"),
+        bot_type=data.get("bot_type", "telegram"),
+        options=data.get("options") or {},
+        trace=data.get("trace"),
+        version=version,
+    )
+
+
+if __name__ == "__main__":
+  # Compares the encoding costs of the message formats:
+  # python -m bot.utils.queue_message [iterations]
+  iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+  payload = {
+      "telegram": "username",
+      "cards": [f"Card number {number}" for number in range(20)],
+      "search": "all",
+  }
+  message = QueueMessage(
+      command="search",
+      chat_id=123456789,
+      text=payload,
+      options={"disable_preview": True},
+  )
+
+  def legacy_round_trip():
+    # The payload used to be a JSON string inside the JSON message
+    body = json.dumps({
+        "command": "search",
+        "chat_id": 123456789,
+        "message_thread_id": None,
+        "text": json.dumps(payload),
+        "bot_type": "telegram",
+        "options": {"disable_preview": True},
+    }).encode("UTF-8")
+    data = json.loads(body.decode("utf-8"))
+    json.loads(data["text"])
+
+  benchmarks = {
+      "legacy json": legacy_round_trip,
+      "envelope json": lambda: QueueMessage.decode(
+          message.encode(JSON_CONTENT_TYPE),
+          JSON_CONTENT_TYPE,
+      ),
+  }
+  if msgpack:
+    benchmarks["envelope msgpack"] = lambda: QueueMessage.decode(
+        message.encode(MSGPACK_CONTENT_TYPE),
+        MSGPACK_CONTENT_TYPE,
+    )
+  for content_type in (JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPE):
+    if content_type == MSGPACK_CONTENT_TYPE and not msgpack:
+      continue
+    size = len(message.encode(content_type))
+    print(f"{content_type}: {size} bytes")
+  for (name, function) in benchmarks.items():
+    seconds = timeit.timeit(function, number=iterations)
+    print(f"{name}: {seconds / iterations * 1e6:.2f} us per round trip")
@@ -0,0 +1,191 @@
+"""Module for tracing a command from the bot through the backend to the
+message delivered to the user.
+"""
+import contextvars
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from bot.utils.metrics import HISTOGRAM, Metrics
+
+Metrics.define(
+    name="command_publish_seconds",
+    kind=HISTOGRAM,
+    description="Time the bot took to publish a command",
+)
+Metrics.define(
+    name="command_queue_wait_seconds",
+    kind=HISTOGRAM,
+    description="Time a command message waited in a queue",
+)
+Metrics.define(
+    name="command_backend_seconds",
+    kind=HISTOGRAM,
+    description="Time the backend spent resolving a command",
+)
+Metrics.define(
+    name="command_mongo_seconds",
+    kind=HISTOGRAM,
+    description="Time Mongo commands took while resolving a command",
+)
+Metrics.define(
+    name="command_upstream_http_seconds",
+    kind=HISTOGRAM,
+    description="Time upstream HTTP requests took while resolving a command",
+)
+Metrics.define(
+    name="command_delivery_seconds",
+    kind=HISTOGRAM,
+    description="Time Telegram took to acknowledge a command response",
+)
+Metrics.define(
+    name="command_end_to_end_seconds",
+    kind=HISTOGRAM,
+    description="Time from sending a command to delivering its response",
+)
+
+# The trace of the command resolved by the current task, Motor copies the
+# context into the threads running Mongo commands
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+@dataclass(slots=True)
+class Trace:
+  """Timings of a command collected while the backend resolves it."""
+  trace_id: str
+  command: str
+  started_at: float
+  mongo_time: float = 0.0
+  http_time: float = 0.0
+  lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+  @classmethod
+  def new_context(cls, command: str) -> dict:
+    """Creates the trace context sent with a new command.
+
+    Args:
+      command: name of the command
+    Returns:
+      A dict with the correlation ID, command and timestamps
+    """
+    now = time.time()
+    return {
+        "id": uuid.uuid4().hex,
+        "command": command,
+        "started_at": now,
+        "enqueued_at": now,
+    }
+
+  @classmethod
+  def observe_queue_wait(cls, context: dict, queue: str) -> None:
+    """Records how long a traced message waited in a queue.
+
+    Args:
+      context: trace context of the message
+      queue: name of the queue
+    """
+    enqueued_at = context.get("enqueued_at")
+    if enqueued_at is None:
+      return
+    Metrics.observe(
+        "command_queue_wait_seconds",
+        max(time.time() - enqueued_at, 0.0),
+        command=context.get("command", "unknown"),
+        queue=queue,
+    )
+
+  @classmethod
+  def start(cls, context: dict | None, command: str) -> "Trace":
+    """Starts tracing the command resolved by the current task.
+
+    Args:
+      context: trace context of the received message, None for messages
+        sent before tracing existed
+      command: name of the command used in metrics
+    Returns:
+      The started trace
+    """
+    context = context or cls.new_context(command=command)
+    trace = cls(
+        trace_id=context.get("id") or uuid.uuid4().hex,
+        command=command,
+        started_at=context.get("started_at") or time.time(),
+    )
+    current_trace.set(trace)
+    return trace
+
+  @classmethod
+  def current(cls) -> "Trace | None":
+    """Returns the trace of the current task.
+
+    Returns:
+      The trace or None if the task isn't traced
+    """
+    return current_trace.get()
+
+  def add_mongo_time(self, seconds: float) -> None:
+    """Adds the duration of a Mongo command.
+
+    Args:
+      seconds: duration of the command
+    """
+    with self.lock:
+      self.mongo_time += seconds
+
+  def add_http_time(self, seconds: float) -> None:
+    """Adds the duration of an upstream HTTP request.
+
+    Args:
+      seconds: duration of the request
+    """
+    with self.lock:
+      self.http_time += seconds
+
+  def child_context(self) -> dict:
+    """Creates the trace context sent with a response of the command.
+
+    Returns:
+      A dict with the correlation ID, command and timestamps
+    """
+    return {
+        "id": self.trace_id,
+        "command": self.command,
+        "started_at": self.started_at,
+        "enqueued_at": time.time(),
+    }
+
+  def finish_backend(self, seconds: float) -> None:
+    """Records the backend timings of the command.
+
+    Args:
+      seconds: time the backend spent resolving the command
+    """
+    Metrics.observe("command_backend_seconds", seconds, command=self.command)
+    Metrics.observe(
+        "command_mongo_seconds",
+        self.mongo_time,
+        command=self.command,
+    )
+    Metrics.observe(
+        "command_upstream_http_seconds",
+        self.http_time,
+        command=self.command,
+    )
+
+  @classmethod
+  def finish_delivery(cls, context: dict, seconds: float) -> None:
+    """Records the delivery of a response and closes its trace.
+
+    Args:
+      context: trace context of the response
+      seconds: time Telegram took to acknowledge the response
+    """
+    command = context.get("command", "unknown")
+    Metrics.observe("command_delivery_seconds", seconds, command=command)
+    started_at = context.get("started_at")
+    if started_at is not None:
+      Metrics.observe(
+          "command_end_to_end_seconds",
+          max(time.time() - started_at, 0.0),
+          command=command,
+      )
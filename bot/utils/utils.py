@@ -4,7 +4,8 @@ import json
 import random
 import string
 from bot.deckbox.deckbox import Deckbox
-from bot.mongo.mongo_client import MongoClient
+from bot.utils.queue_message import QueueMessage
+from bot.utils.tracing import Trace
 
 class Utils:
 
@@ -30,36 +31,54 @@ class Utils:
       cls,
       command: str,
       chat_id: str,
-      message_text: str,
+      message_text: str | dict,
       message_thread_id: str | None = None,
       options: dict | None = None,
       bot_type: str = "telegram",
+      trace: dict | None = None,
   ) -> bytes:
     """Generates a message to be sent to a queue.
 
     Args:
       command: a string with a command to send
       chat_id: id of the chat to send response to
-      message_text: message that will be sent
+      message_text: message that will be sent or a dict with command data
       message_thread_id: ID of the thread in the group
       options: additional options to send
       bot_type: type of the bot, defaults to "telegram"
+      trace: trace context of the message, messages created while a command
+        is resolved continue its trace if None
     Returns:
-      A dict encoded into bytes
+      A message encoded into bytes with the configured codec
     """
-    if not options:
-      options = {}
-    message = {
-      "command": command,
-      "chat_id": chat_id,
-      "message_thread_id": message_thread_id,
-      "text": message_text,
-      "bot_type": bot_type,
-      "options": options,
-    }
-    json_message = json.dumps(message)
-    message_bytes = json_message.encode("UTF-8")
-    return message_bytes
+    if trace is None:
+      current_trace = Trace.current()
+      if current_trace:
+        trace = current_trace.child_context()
+    message = QueueMessage(
+        command=command,
+        chat_id=chat_id,
+        text=message_text,
+        message_thread_id=message_thread_id,
+        bot_type=bot_type,
+        options=options or {},
+        trace=trace,
+    )
+    return message.encode()
+
+  @classmethod
+  def load_payload(cls, message_text: str | dict) -> dict:
+    """Reads the command data sent with a message.
+
+    Args:
+      message_text: a dict with command data or a JSON string with it sent
+      before the data was encoded together with the message
+    Returns:
+      A dict with command data
+    """
+    if isinstance(message_text, str):
+      return json.loads(message_text)
+    return message_text
 
   @classmethod
   async def find_letter_index(
@@ -94,6 +113,7 @@ class Utils:
       cls,
       found_object: dict,
       deckbox_names: dict,
+      users: dict | None = None,
   ) -> list[str]:
     """Creates a message displaying the cards found during using the dict
     that was created after the search.
@@ -102,9 +122,13 @@ class Utils:
       found_object: a dict that was generated by backend.search_for_cards
       deckbox_names: a dict using deckbox_ids as keys and corresponding account
       names as values
+      users: a dict with deckbox names as keys and their owners' user data as
+      values, as returned by MongoClient.get_users_by_deckbox_names
     Returns:
       A list of message strings
     """
+    if not users:
+      users = {}
     messages = []
     result_message = ""
     deckbox_ids = found_object.keys()
@@ -114,7 +138,7 @@ class Utils:
         db_url = await Deckbox.create_deckbox_user_url(username=deckbox_name)
         deckbox_link = f"<a href='{db_url}'><b>{deckbox_name}</b></a>"
         deckbox_message = f"\nDeckbox: {deckbox_link}\n"
-        user_data = await MongoClient.get_user_data(deckbox=deckbox_name)
+        user_data = users.get(deckbox_name.lower())
         if user_data:
           telegram_name = user_data.get("telegram")
           discord_name = user_data.get("discord")
@@ -189,6 +213,7 @@ class Utils:
       found_object: dict,
       deckbox_name: str,
       deckbox_id: str,
+      user_data: dict | None = None,
   ) -> list[str]:
     """Creates a message displaying the cards found during deckbox re-caching.
 
@@ -196,6 +221,7 @@ class Utils:
       found_object: a dict with found cards
       deckbox_name: a string with deckbox name
       deckbox_name: a string with deckbox ID
+      user_data: a dict with user data of the deckbox owner
     Returns:
       A list of message strings
     """
@@ -205,7 +231,6 @@ class Utils:
     messages = []
     deckbox_link = f"<a href='{db_url}'><b>{deckbox_name}</b></a>"
     sub_message = f"{deckbox_link} added new cards from your wishlist!\n"
-    user_data = await MongoClient.get_user_data(deckbox=deckbox_name)
     if user_data:
       telegram_name = user_data.get("telegram")
       discord_name = user_data.get("discord")